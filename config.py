@@ -1,10 +1,18 @@
 p                           = dict()
 p['picklefolder']           = 'pickles'
+p['cachefolder']            = 'cache'
+p['exportfolder']           = 'export'
 # -----------------------------------
 
 p['geocode']                = 'PLZ'
 
 p["file_lstations"]         = "Ladesaeulenregister.csv"
+p["lstat_chunksize"]        = 100000
+# PLZ of a station: "registry" (Postleitzahl column) or "coordinates" (point-in-polygon on Breitengrad/Längengrad)
+p["lstat_plz_assignment"]   = "registry"
+# Incremental registry updates: keep the processed stations (by Ladeeinrichtungs-ID) in cachefolder/registry_state
+# and apply only added/removed/changed rows of a new snapshot; per-PLZ changes are logged to changelog.csv there
+p["lstat_incremental"]      = False
 # p["file_buildings"]         = "gebaeude.csv"
 p["file_residents"]         = "plz_einwohner.csv"
 # p["file_amounttraf"]        = "Verkehrsaufkommen.csv"
@@ -12,6 +20,75 @@ p["file_residents"]         = "plz_einwohner.csv"
 p["file_geodat_plz"]       = "geodata_berlin_plz.csv"
 p["file_geodat_dis"]       = "geodata_berlin_dis.csv"
 
+# Regions: registry Bundesland, station/resident PLZ windows (exclusive bounds) and dataset files below datasets/;
+# the app offers every region whose PLZ geodata and residents files exist, starting with p["region"].
+# Regions missing from the artifact cache are preprocessed in parallel (region_workers processes, one registry pass).
+# Tiles (map_source "tiles") are served for p["region"] only; grids, rasters and areas use the UTM zone of the region's
+# residents (EPSG:25833 for Berlin) unless the region sets "crs"
+p["regions"]                = {
+    "Berlin": {"bundesland": "Berlin", "lstat_plz": [10115, 14200], "resid_plz": [10000, 14200],
+               "file_geodat_plz": "geodata_berlin_plz.csv", "file_geodat_dis": "geodata_berlin_dis.csv",
+               "file_residents": "plz_einwohner.csv", "file_bezirke": "berlin_bezirke/bezirksgrenzen.shp",
+               "center": [52.52, 13.40]},
+    # "Hamburg": {"bundesland": "Hamburg", "lstat_plz": [20000, 22800],
+    #             "file_geodat_plz": "hamburg/geodata_hamburg_plz.csv", "file_residents": "hamburg/plz_einwohner.csv"},
+}
+p["region"]                 = "Berlin"
+p["region_workers"]         = 4
+
+# Community suggestions: "sqlite" (suggestions.db, imports suggestions.json once) or "json"
+p["suggestion_backend"]     = "sqlite"
+p["file_suggestions"]       = "suggestions.json"
+p["file_suggestions_db"]    = "suggestions.db"
+
+# Layer switching on the map: "client" (all layers in one map, switched in the browser) or "server" (radio button, rerun per switch)
+p["layer_switching"]        = "client"
+
+# Display geometry: map zoom -> simplification tolerance (degrees), coordinates rounded to coord_precision decimals
+p["map_zoom"]               = 10
+p["simplify_tolerances"]    = {8: 0.004, 10: 0.001, 12: 0.0003, 14: 0.0}
+p["coord_precision"]        = 5
+
+# Map polygons: "inline" (GeoJSON inside the page) or "tiles" (vector tiles built into cachefolder/tiles/heatmap.mbtiles
+# and served by core.tiles on tile_server_port; tile_url is what the browser requests, e.g. behind a reverse proxy)
+p["map_source"]             = "inline"
+p["tile_url"]               = "http://localhost:8090/tiles/{z}/{x}/{y}.pbf"
+p["tile_server_port"]       = 8090
+p["tiles_minzoom"]          = 8
+p["tiles_maxzoom"]          = 14
+
+# Hexagon grid view: cell sizes in meters (center to corner) of the precomputed levels; [] hides the view
+p["hex_resolutions"]        = [250, 500, 1000, 2000]
+
+# Coverage layer: distance from resident sample points (grid of coverage_sample_m meters inside each PLZ)
+# to the nearest charging station, and the residents farther away than coverage_radius_m
+p["coverage_layer"]         = True
+p["coverage_sample_m"]      = 100
+p["coverage_radius_m"]      = 500
+# Coverage engine: "raster" (residents spread over a raster_resolution_m grid, distance transform of the station cells,
+# shares within every raster_radii_m radius per PLZ and Bezirk) or "samples" (sample points against a station KD-tree)
+p["coverage_engine"]        = "raster"
+p["raster_resolution_m"]    = 25
+p["raster_radii_m"]         = [250, 500, 1000]
+
+# Site recommender: picks the next sites (PLZ centroids, approved suggestions, grid every recommend_grid_m meters)
+# by residents newly within coverage_radius_m, counted on recommend_resolution_m cells of the resident raster
+p["recommend_sites"]        = True
+p["recommend_resolution_m"] = 100
+p["recommend_grid_m"]       = 250
+
+# Pipeline artifact cache (cachefolder/artifacts), least recently used artifacts are evicted above this size
+p["artifact_cache_max_mb"]  = 512
+
+# Seconds between two scans of datasets/ for changed files (every rerun asks for the datasets version)
+p["datasets_check_s"]       = 5
+
+# Print rows and memory per pipeline stage (compact dtypes vs. the former text coordinates / 64-bit numbers)
+p["memory_report"]          = False
+
+# Show the "Debug: pipeline timings" panel (stage spans, metrics, Prometheus export) below the app
+p["debug_panel"]            = False
+
 # p["gebaeude_filter"]        = ["Freistehendes Einzelgebäude", "Doppelhaushälfte"]
 
 # -----------------------------------
@@ -1,28 +1,51 @@
+import os
 import math
 import pandas as pd
 
 import pickle
 
-import time    
 import functools   
 import random
 from collections import Counter, OrderedDict
 
+import core.instrumentation as ins
+
 #------------------------------------------------------------------------------
 
 def timer(func):
-    """Print the runtime of the decorated function"""
+    """Time the decorated function as a nested span (stage metrics, traces) and print its runtime"""
+    # stage name from the defining file, e.g. "methods.preprop_lstat" (also when main.py runs as __main__)
+    stage = "{}.{}".format(os.path.splitext(os.path.basename(func.__code__.co_filename))[0], func.__name__)
+
     @functools.wraps(func)
     def wrapper_timer(*args, **kwargs):
-        start_time = time.perf_counter()  # 1
-        value = func(*args, **kwargs)
-        end_time = time.perf_counter()  # 2
-        run_time = end_time - start_time  # 3
-        print(" ====> Duration {:.2f} secs: {}".format(run_time, func.__doc__))
+        with ins.span(stage, label=func.__doc__) as sp:
+            value = func(*args, **kwargs)
+            sp.set(rows=ins.rows_of(value))
+        if ins.PRINT_TIMINGS:
+            # nested stages are indented under their caller
+            print("{} ====> Duration {:.2f} secs: {}".format("  " * sp.depth, sp.duration, func.__doc__))
         return value
 
     return wrapper_timer #  no "()" here, we need the object to be returned.
 
+#------------------------------------------------------------------------------
+# Memory usage
+def frame_memory_mb(frame):
+    """Deep memory usage of a DataFrame in MB (text columns included)"""
+    return frame.memory_usage(index=True, deep=True).sum() / 1e6
+
+def memory_report(stages, reference=None):
+    """Prints rows and memory per pipeline stage, with the saving against a reference frame per stage"""
+    reference = reference or {}
+    for name, frame in stages.items():
+        mb = frame_memory_mb(frame)
+        line = " ====> Memory {:<16} {:>9} rows {:9.3f} MB".format(name, len(frame), mb)
+        if name in reference:
+            ref_mb = frame_memory_mb(reference[name])
+            line += "  (before compaction {:.3f} MB, saved {:.0%})".format(ref_mb, 1 - mb / ref_mb if ref_mb else 0)
+        print(line)
+
 #------------------------------------------------------------------------------
 # predicates
 def isElFilled(el, liste):
@@ -0,0 +1,176 @@
+import os
+import sys
+import glob
+import hashlib
+import pandas                        as pd
+import geopandas                     as gpd
+import pyarrow.parquet               as pq
+import core.HelperTools              as ht
+import core.geodata                  as gd
+import core.instrumentation          as ins
+
+
+# Project root (one level above core/)
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pipeline sources, hashed into the code version recorded with benchmark results (not part of artifact keys)
+CODE_FILES = ['main.py', 'config.py', os.path.join('core', '*.py')]
+
+_CODE_VERSION = None
+_SOURCE_HASHES = {}
+
+
+def get_artifact_dir(pdict):
+    """Folder of the pipeline artifacts (inside the cache folder)"""
+    artifact_dir = os.path.join(gd.get_cache_dir(pdict), 'artifacts')
+    os.makedirs(artifact_dir, exist_ok=True)
+    return artifact_dir
+
+
+def code_version():
+    """Hash of the pipeline source files, computed once per process"""
+    global _CODE_VERSION
+    if _CODE_VERSION is None:
+        h = hashlib.sha1()
+        for pattern in CODE_FILES:
+            for path in sorted(glob.glob(os.path.join(basedir, pattern))):
+                with open(path, 'rb') as fh:
+                    h.update(fh.read())
+        _CODE_VERSION = h.hexdigest()[:16]
+    return _CODE_VERSION
+
+
+def source_hash(path):
+    """Hash of one source file, computed once per process"""
+    if path not in _SOURCE_HASHES:
+        with open(path, 'rb') as fh:
+            _SOURCE_HASHES[path] = hashlib.sha1(fh.read()).hexdigest()[:12]
+    return _SOURCE_HASHES[path]
+
+
+def stage_version(version, *source_files):
+    """Version of a stage: its version constant plus the hashes of the modules computing it"""
+    return '-'.join([str(version)] + [source_hash(path) for path in source_files])
+
+
+# A stage is keyed on its version (constant bumped by hand when its code changes the result, plus the source hash of
+# its modules, so a forgotten bump still changes the key), the pdict keys it reads and the artifact keys of the
+# upstream stages it consumes, so edits elsewhere and unrelated config keep the cache valid
+def artifact_key(stage, input_files, pdict, version, config_keys=(), depends=()):
+    """Content address of a stage result: stage name and version, input file hashes, config keys and upstream keys"""
+    h = hashlib.sha1(f"{stage}:{version}".encode())
+    for path in input_files:
+        h.update(gd.file_fingerprint(path).encode() if path and os.path.exists(path) else b'missing')
+    h.update(repr([(k, pdict.get(k)) for k in sorted(config_keys)]).encode())
+    for dep in depends:
+        h.update(str(dep).encode())
+    return f"{stage}_{h.hexdigest()[:24]}"
+
+
+def save_artifact(frame, path):
+    """Writes a (Geo)DataFrame as (Geo)Parquet"""
+    geom_cols = [c for c in frame.columns if isinstance(frame[c].dtype, gpd.array.GeometryDtype)]
+    if geom_cols and not isinstance(frame, gpd.GeoDataFrame):
+        frame = gpd.GeoDataFrame(frame, geometry=geom_cols[0])
+    if frame.attrs:
+        # attrs are written as JSON metadata; diagnostics kept there (e.g. DataFrames) are not stored
+        frame = frame.copy(deep=False)
+        frame.attrs = {}
+    tmp = path + '.tmp'
+    frame.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def load_artifact(path):
+    """Reads an artifact back; GeoParquet files come back as GeoDataFrames"""
+    if b'geo' in (pq.read_schema(path).metadata or {}):
+        return gpd.read_parquet(path, memory_map=True)
+    return pd.read_parquet(path, memory_map=True)
+
+
+def evict(pdict, max_bytes=None):
+    """Deletes least recently used artifacts until the folder is below the size limit"""
+    if max_bytes is None:
+        max_bytes = int(pdict.get('artifact_cache_max_mb', 512) * 1024 * 1024)
+    files = [(os.stat(f), f) for f in glob.glob(os.path.join(get_artifact_dir(pdict), '*.parquet'))]
+    total = sum(st.st_size for st, _ in files)
+    for st, f in sorted(files, key=lambda x: x[0].st_mtime):
+        if total <= max_bytes:
+            break
+        os.remove(f)
+        total -= st.st_size
+    return total
+
+
+def artifact_path(stage, input_files, pdict, version, config_keys=(), depends=()):
+    """Parquet file a stage result is stored in"""
+    return os.path.join(get_artifact_dir(pdict), artifact_key(stage, input_files, pdict, version, config_keys, depends)
+                        + '.parquet')
+
+
+def is_cached(stage, input_files, pdict, version, config_keys=(), depends=()):
+    """Whether the stage result of these inputs, stage version and config is in the cache"""
+    return os.path.exists(artifact_path(stage, input_files, pdict, version, config_keys, depends))
+
+
+def cached_rows(stage, input_files, pdict, version, config_keys=(), depends=()):
+    """Row count of a cached stage result from its Parquet footer (the frame is not loaded); None when not cached"""
+    path = artifact_path(stage, input_files, pdict, version, config_keys, depends)
+    return pq.read_metadata(path).num_rows if os.path.exists(path) else None
+
+
+def cached_stage(stage, input_files, pdict, compute, version, config_keys=(), depends=()):
+    """Result of compute() from the artifact cache, computed and stored on a miss (key: see artifact_key)"""
+    with ins.span(f"artifact.{stage}") as sp:
+        path = artifact_path(stage, input_files, pdict, version, config_keys, depends)
+        if os.path.exists(path):
+            try:
+                frame = load_artifact(path)
+                os.utime(path)  # mark as recently used for eviction
+                sp.set(rows=len(frame), cache='hit')
+                return frame
+            except Exception as e:
+                print(f"Artifact {stage} unreadable ({e}); recomputing")
+
+        frame = compute()
+        sp.set(rows=len(frame), cache='miss')
+        try:
+            save_artifact(frame, path)
+            evict(pdict)
+        except Exception as e:
+            print(f"Artifact {stage} not cached ({e})")
+        return frame
+
+
+def clear(pdict):
+    """Removes all pipeline artifacts"""
+    files = glob.glob(os.path.join(get_artifact_dir(pdict), '*.parquet'))
+    for f in files:
+        os.remove(f)
+    return len(files)
+
+
+@ht.timer
+def warm(pdict):
+    """Runs the loading pipeline once so every stage artifact is cached"""
+    import main
+    return main.load_data()
+
+
+if __name__ == "__main__":
+    # python -m core.artifacts warm|clear|info
+    from config import pdict
+    command = sys.argv[1] if len(sys.argv) > 1 else 'info'
+    if command == 'warm':
+        warm(pdict)
+        gd.warm_simplified_geodata(os.path.join(basedir, 'datasets', pdict.get('file_geodat_plz', 'geodata_berlin_plz.csv')), pdict)
+        print(f"Artifact cache warm: {evict(pdict) / 1e6:.1f} MB")
+    elif command == 'clear':
+        print(f"Removed {clear(pdict)} artifacts")
+    elif command == 'info':
+        files = sorted(glob.glob(os.path.join(get_artifact_dir(pdict), '*.parquet')))
+        for f in files:
+            print(f"{os.path.getsize(f) / 1e6:8.2f} MB  {os.path.basename(f)}")
+        print(f"{len(files)} artifacts, {sum(os.path.getsize(f) for f in files) / 1e6:.1f} MB")
+    else:
+        print("Usage: python -m core.artifacts warm|clear|info")
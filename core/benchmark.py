@@ -0,0 +1,190 @@
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from datetime import datetime
+import pandas                        as pd
+import geopandas                     as gpd
+import core.geodata                  as gd
+import core.registry                 as rg
+import core.residents                as rs
+import core.methods                  as m1
+import core.artifacts                as ac
+import core.synthetic                as sy
+import core.hexgrid                  as hx
+import core.nearest                  as nr
+import core.raster                   as rr
+import core.recommend                as rc
+
+
+DEFAULT_STATIONS = [10_000, 100_000, 1_000_000]
+DEFAULT_PLZ = [190, 1000, 4000]
+
+
+def measure(func, repeat=3):
+    """Runs func repeat times (timer output suppressed); returns the last result and the timings"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+    return result, {'seconds_min': min(timings), 'seconds_median': statistics.median(timings), 'repeat': repeat}
+
+
+def _record(results, case, n_stations, n_plz, rows, timing):
+    results.append(dict(case=case, n_stations=n_stations, n_plz=n_plz, rows=int(rows), **timing))
+    print(f"{case:<34} stations={n_stations:>9} plz={n_plz:>5} rows={rows:>9} "
+          f"min={timing['seconds_min']:8.3f}s median={timing['seconds_median']:8.3f}s")
+
+
+def _render(m):
+    return len(m.get_root().render())
+
+
+def run_case_set(work_dir, n_stations, n_plz, pdict, repeat=3, seed=0):
+    """Benchmarks every pipeline stage on one synthetic dataset"""
+    import main
+    results = []
+    paths = sy.write_dataset(work_dir, n_stations, n_plz, seed=seed)
+    gdf_plz = gd._parse_wkt_csv(paths['geodata_plz'])
+    plz_index = gd.build_plz_index(gdf_plz)
+
+    # load
+    df_raw, t = measure(lambda: main._read_csv_with_header_detection(paths['lstat']), repeat)
+    _record(results, 'read_csv_with_header_detection', n_stations, n_plz, len(df_raw), t)
+    df_lstat, t = measure(lambda: rg.read_lstat_chunked(paths['lstat'], chunksize=pdict.get('lstat_chunksize', 100_000)), repeat)
+    _record(results, 'read_lstat_chunked', n_stations, n_plz, len(df_lstat), t)
+    # one pass over the registry for all 16 Bundeslaender (multi-region preprocessing)
+    windows = {land: (land, 0, 100000) for land in rg.BUNDESLAENDER}
+    parts, t = measure(lambda: rg.read_lstat_partitioned(paths['lstat'], windows, chunksize=pdict.get('lstat_chunksize', 100_000)), repeat)
+    _record(results, 'read_lstat_partitioned[16]', n_stations, n_plz, sum(len(p) for p in parts.values()), t)
+
+    # preprocess
+    gdf_lstat3, t = measure(lambda: m1.preprop_lstat(df_lstat, gdf_plz, pdict), repeat)
+    _record(results, 'preprop_lstat', n_stations, n_plz, len(gdf_lstat3), t)
+    df_lstat2, t = measure(lambda: m1.count_plz_occurrences(gdf_lstat3), repeat)
+    _record(results, 'count_plz_occurrences', n_stations, n_plz, len(df_lstat2), t)
+
+    df_residents, t = measure(lambda: rs._read_residents_source(paths['residents'], '', plz_index), repeat)
+    _record(results, 'residents_excel', n_stations, n_plz, len(df_residents), t)
+    gdf_residents2, t = measure(lambda: m1.preprop_resid(df_residents, gdf_plz, pdict), repeat)
+    _record(results, 'preprop_resid', n_stations, n_plz, len(gdf_residents2), t)
+
+    # hexagon grid: station binning and residents interpolation at 1 km cells
+    cells, t = measure(lambda: hx.hex_aggregate(gdf_lstat3, gdf_residents2, 1000), repeat)
+    _record(results, 'hex_aggregate[1000m]', n_stations, n_plz, len(cells), t)
+
+    # nearest-station coverage: 100 m resident sample points against the station index
+    coverage, t = measure(lambda: nr.coverage_by_plz(gdf_lstat3, gdf_residents2, spacing_m=100), repeat)
+    _record(results, 'coverage_by_plz[100m]', n_stations, n_plz, len(coverage), t)
+
+    # raster coverage: resident raster at 25 m (built once) and the distance transform of the station cells
+    raster = rr.ResidentRaster(gdf_residents2, resolution=25)
+    (coverage, _), t = measure(lambda: rr.coverage_rasters(raster, gdf_lstat3), repeat)
+    _record(results, 'coverage_rasters[25m]', n_stations, n_plz, len(coverage), t)
+
+    # site recommender: 500 sites from PLZ centroids and the 250 m grid (lazy greedy over the coverage sets)
+    recommender = rc.SiteRecommender(raster, gdf_lstat3, plz_index, radius_m=500)
+    sites, t = measure(lambda: (recommender._memo.clear(), recommender.recommend(500, ('plz', 'grid')))[1], repeat)
+    _record(results, 'recommend[k=500]', n_stations, n_plz, len(sites), t)
+
+    # render (the map build of make_streamlit_electric_Charging_resid, without Streamlit)
+    for layer in m1.LAYERS:
+        def build_and_render():
+            m1._DEMAND_CACHE.clear()
+            m, _ = m1.build_heatmap(layer, df_lstat2, gdf_residents2, zoom_start=pdict.get('map_zoom', 10), plz_index=plz_index)
+            return _render(m)
+        size, t = measure(build_and_render, repeat)
+        t['html_bytes'] = size
+        _record(results, f'build_heatmap[{layer}]', n_stations, n_plz, len(gdf_residents2), t)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=ac.basedir, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(pdict, stations=DEFAULT_STATIONS, plz=DEFAULT_PLZ, repeat=3, seed=0, out_path=None):
+    """Runs the suite for every (stations, PLZ grid) size and writes the results as JSON"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='heatmap_bench_') as work_dir:
+        for n_plz in plz:
+            for n_stations in stations:
+                results += run_case_set(work_dir, n_stations, n_plz, pdict, repeat=repeat, seed=seed)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'code_version': ac.code_version(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'geopandas': gpd.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+        },
+        'results': results,
+    }
+    if out_path:
+        with open(out_path, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Results written to {out_path}")
+    return report
+
+
+def compare(old_path, new_path, threshold=0.10):
+    """Prints the median time ratio new/old per case and size; returns the cases slower than 1 + threshold"""
+    def load(path):
+        with open(path, 'r', encoding='utf-8') as fh:
+            return {(r['case'], r['n_stations'], r['n_plz']): r for r in json.load(fh)['results']}
+    old, new = load(old_path), load(new_path)
+    regressions = []
+    for key in sorted(set(old) & set(new)):
+        ratio = new[key]['seconds_median'] / old[key]['seconds_median'] if old[key]['seconds_median'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = '  <-- slower'
+        print(f"{key[0]:<34} stations={key[1]:>9} plz={key[2]:>5} "
+              f"{old[key]['seconds_median']:8.3f}s -> {new[key]['seconds_median']:8.3f}s  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(',') if v]
+
+
+if __name__ == "__main__":
+    # python -m core.benchmark run [--stations 10000,100000] [--plz 190,1000] [--repeat 3] [--out bench.json]
+    # python -m core.benchmark compare old.json new.json
+    parser = argparse.ArgumentParser(prog='python -m core.benchmark')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_run = sub.add_parser('run', help='benchmark the pipeline on synthetic datasets')
+    p_run.add_argument('--stations', type=_int_list, default=DEFAULT_STATIONS, help='registry sizes, comma separated')
+    p_run.add_argument('--plz', type=_int_list, default=DEFAULT_PLZ, help='PLZ grid sizes, comma separated')
+    p_run.add_argument('--repeat', type=int, default=3)
+    p_run.add_argument('--seed', type=int, default=0)
+    p_run.add_argument('--out', default='benchmark_results.json')
+    p_cmp = sub.add_parser('compare', help='compare two result files')
+    p_cmp.add_argument('old')
+    p_cmp.add_argument('new')
+    p_cmp.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        from config import pdict
+        run(pdict, stations=args.stations, plz=args.plz, repeat=args.repeat, seed=args.seed, out_path=args.out)
+    else:
+        sys.exit(1 if compare(args.old, args.new, args.threshold) else 0)
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+from datetime import datetime
+import numpy                         as np
+import pandas                        as pd
+import pyarrow.parquet               as pq
+import geopandas                     as gpd
+import core.HelperTools              as ht
+import core.geodata                  as gd
+import core.registry                 as rg
+import core.methods                  as m1
+import core.artifacts                as ac
+
+
+ID = rg.ID_COLUMN
+
+# Station columns kept in the state (the gdf_lstat3 columns, plus the id); stations are stored with their geometry
+STATION_COLUMNS = ['PLZ', 'Bundesland', 'Breitengrad', 'Längengrad', 'KW']
+
+# Version of the stored state layout (bump when the state files or their processing change)
+STATE_VERSION = 2
+
+CHANGELOG_COLUMNS = ['refreshed_at', 'snapshot', 'PLZ', 'added', 'removed', 'changed',
+                     'Number_before', 'Number_after', 'KW_before', 'KW_after']
+
+
+def get_state_dir(pdict, region=None):
+    """Folder of the incremental registry state (inside the cache folder, one subfolder per region if given)"""
+    state_dir = os.path.join(gd.get_cache_dir(pdict), 'registry_state', *([region] if region else []))
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+
+def _state_paths(pdict, region=None):
+    state_dir = get_state_dir(pdict, region)
+    return {name: os.path.join(state_dir, name) for name in
+            ('meta.json', 'snapshot.parquet', 'stations.parquet', 'counts.parquet', 'demand.parquet', 'changelog.csv')}
+
+
+def _settings(pdict, df_geo_path, region=None, plz_window=(10115, 14200)):
+    """Everything the processed station rows depend on besides the registry rows themselves"""
+    region = region or {}
+    return {
+        'state_version': STATE_VERSION,
+        'preprop_version': ac.stage_version(m1.PREPROP_LSTAT_VERSION, m1.__file__, rg.__file__),
+        'plz_assignment': pdict.get('lstat_plz_assignment', 'registry'),
+        'geocode': pdict.get('geocode', 'PLZ'),
+        'geodata': gd.file_fingerprint(df_geo_path) if df_geo_path and os.path.exists(df_geo_path) else None,
+        # rows selected by the region (lists, as stored in meta.json)
+        'bundesland': region.get('bundesland', 'Berlin'),
+        'plz_window': list(plz_window),
+        'lstat_plz': list(region.get('lstat_plz', (10115, 14200))),
+    }
+
+
+def row_hashes(df_raw):
+    """Content hash of every registry row over the used columns"""
+    return pd.util.hash_pandas_object(df_raw[rg.LSTAT_COLUMNS].astype(str), index=False).to_numpy()
+
+
+def read_snapshot(path, plz_window=(10115, 14200), chunksize=100_000, bundesland='Berlin'):
+    """Registry rows of one Bundesland with their charging point id, one row per id (the last one wins)"""
+    df = rg.read_lstat_chunked(path, bundesland=bundesland, plz_min=plz_window[0], plz_max=plz_window[1],
+                               chunksize=chunksize, columns=rg.LSTAT_COLUMNS + [ID])
+    df = df[df[ID].notna()]
+    duplicated = df[ID].duplicated(keep='last')
+    if duplicated.any():
+        print(f"Registry snapshot: {int(duplicated.sum())} rows with a repeated {ID} ignored")
+        df = df[~duplicated]
+    return df.reset_index(drop=True)
+
+
+def diff_snapshot(old_hashes, df_new):
+    """Ids added, removed and changed between the stored row hashes (id -> hash) and a new snapshot"""
+    new_hashes = pd.Series(row_hashes(df_new), index=df_new[ID].to_numpy())
+    common = new_hashes.index.intersection(old_hashes.index)
+    changed = common[new_hashes.loc[common].to_numpy() != old_hashes.loc[common].to_numpy()]
+    added = new_hashes.index.difference(old_hashes.index)
+    removed = old_hashes.index.difference(new_hashes.index)
+    return added, removed, changed, new_hashes
+
+
+def _counts_of(stations):
+    """Stations and summed kW per PLZ of a set of station rows"""
+    if not len(stations):
+        return pd.DataFrame({'Number': pd.Series(dtype='int64'), 'KW': pd.Series(dtype='float64')},
+                            index=pd.Index([], name='PLZ', dtype=m1.PLZ_DTYPE))
+    return stations.groupby('PLZ').agg(Number=('PLZ', 'size'), KW=('KW', 'sum'))
+
+
+def apply_count_delta(counts, removed_rows, added_rows):
+    """Per-PLZ counts (PLZ, Number, KW) after taking removed_rows out and adding added_rows; only touched PLZ change"""
+    table = counts.set_index('PLZ')[['Number', 'KW']].astype({'Number': 'int64', 'KW': 'float64'})
+    minus, plus = _counts_of(removed_rows), _counts_of(added_rows)
+    touched = minus.index.union(plus.index)
+    delta = plus.reindex(touched, fill_value=0) - minus.reindex(touched, fill_value=0)
+    table = table.reindex(table.index.union(touched), fill_value=0)
+    table.loc[touched, ['Number', 'KW']] += delta[['Number', 'KW']].to_numpy()
+    table = table[table['Number'] > 0]
+    out = table.reset_index().rename(columns={'index': 'PLZ'})
+    return out.astype({'PLZ': m1.PLZ_DTYPE, 'Number': m1.COUNT_DTYPE}), touched
+
+
+def _with_geometry(counts, df_geo, pdict):
+    """Counts in the layout of count_plz_occurrences (PLZ, Number, geometry, KW)"""
+    gdf = m1.sort_by_plz_add_geometry(counts, df_geo, pdict)
+    return pd.DataFrame(gdf[['PLZ', 'Number', 'geometry', 'KW']])
+
+
+def _load_state(paths, settings):
+    """Stored row hashes, stations and counts; empty when missing or built with other settings"""
+    meta = {}
+    if os.path.exists(paths['meta.json']):
+        with open(paths['meta.json'], 'r', encoding='utf-8') as fh:
+            meta = json.load(fh)
+    if meta.get('settings') != settings or not all(os.path.exists(paths[n]) for n in
+                                                   ('snapshot.parquet', 'stations.parquet', 'counts.parquet')):
+        empty_hashes = pd.Series(np.array([], dtype='uint64'), index=pd.Index([], dtype=object))
+        empty_stations = gpd.GeoDataFrame({ID: pd.Series(dtype=object), 'PLZ': pd.Series(dtype=m1.PLZ_DTYPE),
+                                           'Bundesland': pd.Series(dtype=rg.BUNDESLAND_DTYPE),
+                                           'Breitengrad': pd.Series(dtype=m1.COORD_DTYPE),
+                                           'Längengrad': pd.Series(dtype=m1.COORD_DTYPE), 'KW': pd.Series(dtype='float64')},
+                                          geometry=gpd.GeoSeries([], crs='EPSG:4326'))
+        empty_counts = pd.DataFrame({'PLZ': pd.Series(dtype=m1.PLZ_DTYPE), 'Number': pd.Series(dtype=m1.COUNT_DTYPE),
+                                     'KW': pd.Series(dtype='float64')})
+        return {}, empty_hashes, empty_stations, empty_counts
+    snapshot = pd.read_parquet(paths['snapshot.parquet'])
+    hashes = pd.Series(snapshot['row_hash'].to_numpy(), index=snapshot[ID].to_numpy())
+    return meta, hashes, gpd.read_parquet(paths['stations.parquet']), pd.read_parquet(paths['counts.parquet'])
+
+
+def _save_frame(frame, path):
+    tmp = path + '.tmp'
+    frame.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _append_changelog(path, log):
+    if len(log):
+        log.to_csv(path, mode='a', header=not os.path.exists(path), index=False, sep=';')
+
+
+def read_changelog(pdict, plz=None, region=None):
+    """Change log of all refreshes (one row per refresh and touched PLZ), optionally of one PLZ"""
+    path = _state_paths(pdict, region)['changelog.csv']
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=CHANGELOG_COLUMNS)
+    log = pd.read_csv(path, sep=';')
+    return log[log['PLZ'] == int(plz)] if plz is not None else log
+
+
+@ht.timer
+def refresh_registry(path_lstat, df_geo, pdict, df_geo_path=None, plz_window=(10115, 14200), region=None):
+    """Brings the stored station table and PLZ counts up to date with a registry snapshot, processing only changed rows"""
+    # region: definition of core.regions (state subfolder, Bundesland and station PLZ window); None keeps Berlin
+    region = region or {}
+    paths = _state_paths(pdict, region.get('slug'))
+    settings = _settings(pdict, df_geo_path, region, plz_window)
+    snapshot_id = gd.file_fingerprint(path_lstat)
+    meta, old_hashes, stations, counts = _load_state(paths, settings)
+
+    result = {'snapshot': snapshot_id, 'previous_snapshot': meta.get('snapshot'), 'added': 0, 'removed': 0,
+              'changed': 0, 'touched_plz': pd.Index([], dtype=m1.PLZ_DTYPE)}
+    if meta.get('snapshot') != snapshot_id:
+        df_new = read_snapshot(path_lstat, plz_window, chunksize=pdict.get('lstat_chunksize', 100_000),
+                               bundesland=region.get('bundesland', 'Berlin'))
+        added, removed, changed, new_hashes = diff_snapshot(old_hashes, df_new)
+
+        # only added and changed rows go through the preprocessing (filters, coordinates, PLZ assignment, geometry)
+        incoming_ids = added.union(changed)
+        incoming = df_new[df_new[ID].isin(incoming_ids)]
+        processed = (m1.preprop_lstat(incoming, df_geo, pdict, bundesland=region.get('bundesland', 'Berlin'),
+                                      plz_window=region.get('lstat_plz', (10115, 14200)))
+                     if len(incoming) else stations.iloc[:0])
+        processed = processed[[ID] + STATION_COLUMNS + ['geometry']]
+
+        outgoing_ids = removed.union(changed)
+        outgoing = stations[stations[ID].isin(outgoing_ids)]
+        counts_after, touched = apply_count_delta(counts, outgoing, processed)
+
+        # the processed rows are merged into the stored stations in PLZ order, like sort_by_plz_add_geometry
+        stations = pd.concat([stations[~stations[ID].isin(outgoing_ids)], processed.to_crs(stations.crs)])
+        stations = m1.compact_dtypes(stations.sort_values('PLZ', kind='stable', ignore_index=True))
+
+        # change log: per touched PLZ the added/removed/changed stations and the count before and after
+        now = datetime.now().isoformat(timespec='seconds')
+        kinds = pd.concat([
+            pd.DataFrame({'PLZ': processed.loc[processed[ID].isin(added), 'PLZ'], 'kind': 'added'}),
+            pd.DataFrame({'PLZ': outgoing.loc[outgoing[ID].isin(removed), 'PLZ'], 'kind': 'removed'}),
+            pd.DataFrame({'PLZ': pd.concat([processed.loc[processed[ID].isin(changed), 'PLZ'],
+                                            outgoing.loc[outgoing[ID].isin(changed), 'PLZ']]).drop_duplicates(), 'kind': 'changed'}),
+        ])
+        log = kinds.groupby(['PLZ', 'kind']).size().unstack(fill_value=0).reindex(
+            columns=['added', 'removed', 'changed'], fill_value=0).reindex(touched, fill_value=0)
+        before = counts.set_index('PLZ').reindex(touched)
+        after = counts_after.set_index('PLZ').reindex(touched)
+        log['Number_before'] = before['Number'].fillna(0).astype(int).to_numpy()
+        log['Number_after'] = after['Number'].fillna(0).astype(int).to_numpy()
+        log['KW_before'] = before['KW'].fillna(0).round(1).to_numpy()
+        log['KW_after'] = after['KW'].fillna(0).round(1).to_numpy()
+        log = log.reset_index().rename(columns={'index': 'PLZ'})
+        log.insert(0, 'snapshot', snapshot_id)
+        log.insert(0, 'refreshed_at', now)
+
+        _save_frame(pd.DataFrame({ID: new_hashes.index.astype(str), 'row_hash': new_hashes.to_numpy()}), paths['snapshot.parquet'])
+        _save_frame(stations, paths['stations.parquet'])
+        _save_frame(counts_after, paths['counts.parquet'])
+        _append_changelog(paths['changelog.csv'], log[CHANGELOG_COLUMNS])
+        with open(paths['meta.json'], 'w', encoding='utf-8') as fh:
+            # the stored demand metrics (refresh_demand) stay valid for the previous snapshot
+            json.dump({'snapshot': snapshot_id, 'settings': settings, 'refreshed_at': now,
+                       'stations': int(len(stations)), 'demand': meta.get('demand')}, fh, indent=2)
+
+        print(f"Registry refresh: {len(added)} added, {len(removed)} removed, {len(changed)} changed, "
+              f"{len(touched)} PLZ touched")
+        counts = counts_after
+        result.update(added=len(added), removed=len(removed), changed=len(changed), touched_plz=touched)
+
+    result['stations'] = stations.drop(columns=ID)
+    result['counts'] = _with_geometry(counts, df_geo, pdict)
+    return result
+
+
+def state_rows(pdict, region=None):
+    """Station and PLZ rows of the stored state (gdf_lstat3, df_lstat2) from the Parquet footers; None without state"""
+    paths = _state_paths(pdict, region)
+    if not all(os.path.exists(paths[n]) for n in ('meta.json', 'stations.parquet', 'counts.parquet')):
+        return None
+    return {'gdf_lstat3': pq.read_metadata(paths['stations.parquet']).num_rows,
+            'df_lstat2': pq.read_metadata(paths['counts.parquet']).num_rows}
+
+
+def refresh_demand(update, df_resid, pdict, region=None):
+    """Demand metrics after a refresh, patched from the stored metrics of the previous snapshot (touched PLZ only)"""
+    paths = _state_paths(pdict, region)
+    with open(paths['meta.json'], 'r', encoding='utf-8') as fh:
+        meta = json.load(fh)
+    # the stored metrics hold for one residents version and snapshot
+    residents = m1.residents_version(df_resid)
+    stored = meta.get('demand') or {}
+    metrics = None
+    if stored.get('residents') == residents and os.path.exists(paths['demand.parquet']):
+        if stored.get('snapshot') in (update['snapshot'], update['previous_snapshot']):
+            old = pd.read_parquet(paths['demand.parquet']).set_axis(df_resid.index)
+            touched = [] if stored['snapshot'] == update['snapshot'] else update['touched_plz']
+            metrics = m1.patch_demand_metrics(old, update['counts'], df_resid, touched)
+    if metrics is None:
+        metrics = m1.compute_demand_metrics(update['counts'], df_resid)
+
+    if stored != {'residents': residents, 'snapshot': update['snapshot']}:
+        _save_frame(metrics, paths['demand.parquet'])
+        meta['demand'] = {'residents': residents, 'snapshot': update['snapshot']}
+        with open(paths['meta.json'], 'w', encoding='utf-8') as fh:
+            json.dump(meta, fh, indent=2)
+    return metrics
+
+
+def reset(pdict, region=None):
+    """Removes the stored state (the next refresh processes the whole snapshot); the change log is kept"""
+    paths = _state_paths(pdict, region)
+    for name in ('meta.json', 'snapshot.parquet', 'stations.parquet', 'counts.parquet', 'demand.parquet'):
+        if os.path.exists(paths[name]):
+            os.remove(paths[name])
+
+
+if __name__ == "__main__":
+    # python -m core.deltas refresh [registry.csv] | log [PLZ] | reset  (state of the default region, p["region"])
+    import core.regions as rn
+    from config import pdict
+    region = rn.get_region(pdict)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'refresh'
+    if command == 'refresh':
+        paths = rn.region_paths(region, pdict)
+        path_lstat = sys.argv[2] if len(sys.argv) > 2 else paths['lstat']
+        df_geo = gd.load_geodata_plz(paths['geodata_plz'], pdict)
+        update = refresh_registry(path_lstat, df_geo, pdict, df_geo_path=paths['geodata_plz'],
+                                  plz_window=rn.lstat_read_window(region, pdict), region=region)
+        print(f"{len(update['stations'])} stations in {len(update['counts'])} PLZ")
+    elif command == 'log':
+        with pd.option_context('display.max_rows', 200, 'display.width', 200):
+            print(read_changelog(pdict, sys.argv[2] if len(sys.argv) > 2 else None, region=region['slug']))
+    elif command == 'reset':
+        reset(pdict, region=region['slug'])
+    else:
+        print("Usage: python -m core.deltas refresh [registry.csv] | log [PLZ] | reset")
@@ -0,0 +1,85 @@
+import os
+import sys
+import core.HelperTools              as ht
+import core.geodata                  as gd
+import core.methods                  as m1
+import core.raster                   as rr
+
+
+# Project root (one level above core/), the export folder in pdict is relative to it
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Heatmaps: Electric Charging Stations and Residents</title></head>
+<body>
+<h1>Heatmaps: Electric Charging Stations and Residents</h1>
+<ul>
+{items}
+</ul>
+</body>
+</html>
+"""
+
+
+def get_export_dir(pdict, out_dir=None):
+    """Output folder of the static maps, created on demand"""
+    export_dir = out_dir or os.path.join(basedir, pdict.get('exportfolder', 'export'))
+    os.makedirs(export_dir, exist_ok=True)
+    return export_dir
+
+
+def _write_text(path, text):
+    """Writes a file via a temp file, so a static server never sees a half-written one"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        fh.write(text)
+    os.replace(tmp, path)
+
+
+@ht.timer
+def export_layers(pdict, out_dir=None, layers=None):
+    """Runs the pipeline once and writes <layer>.html/.geojson per layer, the combined Heatmaps.html/.geojson and index.html"""
+    import main
+    data = main.load_data()
+    export_dir = get_export_dir(pdict, out_dir)
+
+    zoom = pdict.get('map_zoom', 10)
+    df_geo_display = gd.load_simplified_geodata(data['paths']['geodata_plz'], pdict, zoom)
+    dframe2_map = m1.with_display_geometry(data['gdf_residents2'], df_geo_display)
+    if pdict.get('coverage_layer', True):
+        dframe2_map = m1.with_coverage(dframe2_map, rr.load_coverage(data, pdict)[0])
+    layers = layers or m1.available_layers(dframe2_map)
+
+    written = []
+    for layer in layers:
+        m, features = m1.build_heatmap(layer, data['df_lstat2'], dframe2_map, zoom_start=zoom, plz_index=data['plz_index'])
+
+        html_path = os.path.join(export_dir, f"{layer}.html")
+        _write_text(html_path, m.get_root().render())
+        geojson_path = os.path.join(export_dir, f"{layer}.geojson")
+        _write_text(geojson_path, features.to_crs(epsg=4326).to_json(drop_id=True))
+        written += [html_path, geojson_path]
+
+    # All layers in one page with the client-side switch, and their shared GeoJSON
+    m, features = m1.build_combined_heatmap(data['df_lstat2'], dframe2_map, zoom_start=zoom, plz_index=data['plz_index'])
+    html_path = os.path.join(export_dir, "Heatmaps.html")
+    _write_text(html_path, m.get_root().render())
+    geojson_path = os.path.join(export_dir, "Heatmaps.geojson")
+    _write_text(geojson_path, features.to_crs(epsg=4326).to_json(drop_id=True))
+    written += [html_path, geojson_path]
+
+    items = '<li><a href="Heatmaps.html">All layers</a> (<a href="Heatmaps.geojson">GeoJSON</a>)</li>\n'
+    items += "\n".join(f'<li><a href="{layer}.html">{layer}</a> (<a href="{layer}.geojson">GeoJSON</a>)</li>' for layer in layers)
+    index_path = os.path.join(export_dir, 'index.html')
+    _write_text(index_path, INDEX_TEMPLATE.format(items=items))
+    written.append(index_path)
+    return written
+
+
+if __name__ == "__main__":
+    # python -m core.export [out_dir]
+    from config import pdict
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    for path in export_layers(pdict, out_dir):
+        print(f"{os.path.getsize(path) / 1e6:8.3f} MB  {path}")
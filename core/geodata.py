@@ -0,0 +1,239 @@
+import os
+import glob
+import hashlib
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import geopandas                     as gpd
+import core.HelperTools              as ht
+
+
+# Project root (one level above core/), cache paths in pdict are relative to it
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Process-wide store of parsed geodata: (abspath, mtime_ns, size) -> GeoDataFrame
+_GEODATA_STORE = {}
+
+# Content hashes of source files: (abspath, mtime_ns, size) -> fingerprint
+_FINGERPRINTS = {}
+
+
+def get_cache_dir(pdict):
+    """Absolute path of the cache folder, created on demand"""
+    cache_dir = os.path.join(basedir, pdict.get('cachefolder', 'cache'))
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def file_fingerprint(path):
+    """Content hash (sha1, shortened) of a source file, used as cache key; hashed once per file version and process"""
+    # mtime and size only decide whether to hash again, the key is the content (a touch or checkout keeps caches)
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    memo_key = (path, stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _FINGERPRINTS:
+        h = hashlib.sha1()
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                h.update(chunk)
+        for key in [k for k in _FINGERPRINTS if k[0] == path]:
+            del _FINGERPRINTS[key]
+        _FINGERPRINTS[memo_key] = h.hexdigest()[:16]
+    return _FINGERPRINTS[memo_key]
+
+
+def source_tag(*paths):
+    """Short hash of absolute source paths: cache files of equally named sources (e.g. per region) stay apart"""
+    return hashlib.sha1('|'.join(os.path.abspath(p) for p in paths).encode()).hexdigest()[:8]
+
+
+def utm_crs(bounds):
+    """UTM CRS of the zone containing the center of lon/lat bounds (ETRS89 in Europe, e.g. EPSG:25833 for Berlin)"""
+    minx, miny, maxx, maxy = bounds
+    lat = (miny + maxy) / 2
+    zone = int(np.floor(((minx + maxx) / 2 + 180) / 6)) % 60 + 1
+    if lat >= 0 and 28 <= zone <= 38:
+        return f"EPSG:{25800 + zone}"
+    return f"EPSG:{(32600 if lat >= 0 else 32700) + zone}"
+
+
+def metric_crs(gdf):
+    """Metric CRS to measure a frame in: its own CRS if projected, else the UTM zone of its bounds"""
+    if gdf.crs is not None and gdf.crs.is_projected:
+        return gdf.crs.to_string()
+    return utm_crs(gdf.to_crs(epsg=4326).total_bounds if gdf.crs is not None else gdf.total_bounds)
+
+
+def _parse_wkt_csv(path, sep=';'):
+    """Reads a geodata CSV with a WKT geometry column into a GeoDataFrame (EPSG:4326)"""
+    df = pd.read_csv(path, sep=sep)
+    geometry = gpd.GeoSeries.from_wkt(df.pop('geometry'))
+    return gpd.GeoDataFrame(df, geometry=geometry, crs='EPSG:4326')
+
+
+@ht.timer
+def load_geodata(path, pdict, sep=';'):
+    """Loads WKT geodata once, cached as GeoParquet (WKB) keyed by file hash"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    store_key = (path, stat.st_mtime_ns, stat.st_size)
+    if store_key in _GEODATA_STORE:
+        return _GEODATA_STORE[store_key]
+
+    prefix = f"geodata_{os.path.splitext(os.path.basename(path))[0]}_{source_tag(path)}_"
+    cache_file = os.path.join(get_cache_dir(pdict), f"{prefix}{file_fingerprint(path)}.parquet")
+
+    gdf = None
+    if os.path.exists(cache_file):
+        try:
+            gdf = gpd.read_parquet(cache_file, memory_map=True)
+        except Exception:
+            gdf = None
+
+    if gdf is None:
+        gdf = _parse_wkt_csv(path, sep=sep)
+        try:
+            # drop stale versions of this file (not of equally named files elsewhere) before writing the new one
+            for old in glob.glob(os.path.join(os.path.dirname(cache_file), f"{prefix}*.parquet")):
+                os.remove(old)
+            gdf.to_parquet(cache_file, index=False)
+        except Exception as e:
+            print(f"Geodata cache not written ({e}); continuing with parsed data")
+
+    if gdf.crs is None:
+        gdf = gdf.set_crs(epsg=4326)
+
+    # Shared across reruns and sessions: callers must not modify it in place
+    for key in [k for k in _GEODATA_STORE if k[0] == path]:
+        del _GEODATA_STORE[key]
+    _GEODATA_STORE[store_key] = gdf
+    return gdf
+
+
+def load_geodata_plz(path, pdict):
+    """PLZ polygons (columns: PLZ, geometry) from geodata_berlin_plz.csv"""
+    return load_geodata(path, pdict)
+
+
+def load_geodata_dis(path, pdict):
+    """Bezirk polygons (columns: Bezirk, geometry) from geodata_berlin_dis.csv"""
+    return load_geodata(path, pdict)
+
+
+# -----------------------------------------------------------------------------
+def simplify_geometries(gdf, tolerance, precision):
+    """Topology-preserving simplification plus coordinate quantization of a polygon layer"""
+    geoms = gdf.geometry.values
+    if tolerance > 0:
+        if hasattr(shapely, 'coverage_simplify'):
+            # simplifies shared edges once, so neighbouring PLZ stay gap-free
+            geoms = shapely.coverage_simplify(geoms, tolerance)
+        else:
+            geoms = shapely.simplify(geoms, tolerance, preserve_topology=True)
+    if precision is not None:
+        geoms = shapely.set_precision(geoms, 10.0 ** -precision)
+        # round the snapped values too, so they serialize with the short representation
+        geoms = shapely.transform(geoms, lambda xy: np.round(xy, precision))
+    return gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs))
+
+
+def pick_simplify_tolerance(zoom, pdict):
+    """Tolerance of the configured level matching a map zoom (finest level at or below it)"""
+    levels = pdict.get('simplify_tolerances', {10: 0.0})
+    eligible = [z for z in levels if z <= zoom]
+    return levels[max(eligible)] if eligible else levels[min(levels)]
+
+
+@ht.timer
+def load_simplified_geodata(path, pdict, zoom):
+    """Simplified and quantized geodata for a map zoom, cached per tolerance and precision"""
+    tolerance = pick_simplify_tolerance(zoom, pdict)
+    precision = pdict.get('coord_precision', 5)
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    store_key = (path, stat.st_mtime_ns, stat.st_size, tolerance, precision)
+    if store_key in _GEODATA_STORE:
+        return _GEODATA_STORE[store_key]
+
+    gdf_full = load_geodata(path, pdict)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_file = os.path.join(
+        get_cache_dir(pdict),
+        f"geodata_{stem}_{source_tag(path)}_{file_fingerprint(path)}_simpl{tolerance:g}_p{precision}.parquet"
+    )
+
+    gdf = None
+    if os.path.exists(cache_file):
+        try:
+            gdf = gpd.read_parquet(cache_file, memory_map=True)
+        except Exception:
+            gdf = None
+
+    if gdf is None:
+        gdf = simplify_geometries(gdf_full, tolerance, precision)
+        try:
+            gdf.to_parquet(cache_file, index=False)
+        except Exception as e:
+            print(f"Simplified geodata cache not written ({e}); continuing with computed data")
+
+    _GEODATA_STORE[store_key] = gdf
+    return gdf
+
+
+def warm_simplified_geodata(path, pdict):
+    """Precomputes every configured simplification level of a geodata file"""
+    return {zoom: load_simplified_geodata(path, pdict, zoom) for zoom in pdict.get('simplify_tolerances', {10: 0.0})}
+
+
+# -----------------------------------------------------------------------------
+def build_plz_index(gdf):
+    """Centroid, representative point and bbox per PLZ, in arrays sorted by PLZ"""
+    gdf = gdf.drop_duplicates(subset='PLZ').sort_values('PLZ')
+    geoms = gdf.geometry.values
+    centroids = shapely.centroid(geoms)
+    rep_points = shapely.point_on_surface(geoms)
+    plz = gdf['PLZ'].to_numpy(dtype='int64')
+    return {
+        'plz': plz,
+        'pos': {int(p): i for i, p in enumerate(plz)},
+        'lat': shapely.get_y(centroids),
+        'lon': shapely.get_x(centroids),
+        'rep_lat': shapely.get_y(rep_points),
+        'rep_lon': shapely.get_x(rep_points),
+        'bbox': shapely.bounds(geoms),  # minx, miny, maxx, maxy
+    }
+
+
+def load_plz_index(path, pdict):
+    """PLZ centroid/bbox index of a geodata file, built once per file version"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    store_key = (path, stat.st_mtime_ns, stat.st_size, 'plz_index')
+    if store_key not in _GEODATA_STORE:
+        _GEODATA_STORE[store_key] = build_plz_index(load_geodata(path, pdict))
+    return _GEODATA_STORE[store_key]
+
+
+def lookup_plz_centroid(index, plz):
+    """(lat, lon) of one PLZ centroid, (None, None) if unknown"""
+    try:
+        i = index['pos'].get(int(plz))
+    except (TypeError, ValueError):
+        i = None
+    if i is None:
+        return None, None
+    return float(index['lat'][i]), float(index['lon'][i])
+
+
+def lookup_plz_centroids(index, plzs):
+    """Batch lookup: arrays (lat, lon) for many PLZ, NaN where unknown"""
+    plzs = pd.to_numeric(pd.Series(plzs), errors='coerce').to_numpy(dtype=float)
+    if len(index['plz']) == 0:
+        return np.full(len(plzs), np.nan), np.full(len(plzs), np.nan)
+    pos = np.searchsorted(index['plz'], np.nan_to_num(plzs, nan=-1))
+    pos = np.clip(pos, 0, len(index['plz']) - 1)
+    found = index['plz'][pos] == plzs
+    lat = np.where(found, index['lat'][pos], np.nan)
+    lon = np.where(found, index['lon'][pos], np.nan)
+    return lat, lon
@@ -0,0 +1,163 @@
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import geopandas                     as gpd
+from pyproj                          import Transformer
+import core.HelperTools              as ht
+import core.artifacts                as ac
+import core.geodata                  as gd
+
+
+# Hexagons are laid out in the metric CRS of a region (its UTM zone, gd.metric_crs), pointy-top, axial coordinates (q, r)
+SQRT3 = np.sqrt(3.0)
+
+# Cell sizes in meters (center to corner) of the pyramid levels, fine to coarse
+DEFAULT_RESOLUTIONS = (250, 500, 1000, 2000)
+
+# Artifact version of the hexagon levels (bump when hex_aggregate changes its output)
+HEX_VERSION = 1
+
+# Transformers from degrees to each metric CRS used so far: crs -> Transformer
+_TRANSFORMERS = {}
+
+
+def project_points(lat, lon, crs):
+    """Station coordinates (degrees) to meters in a metric CRS"""
+    if crs not in _TRANSFORMERS:
+        _TRANSFORMERS[crs] = Transformer.from_crs('EPSG:4326', crs, always_xy=True)
+    x, y = _TRANSFORMERS[crs].transform(np.asarray(lon, dtype='float64'), np.asarray(lat, dtype='float64'))
+    return np.asarray(x), np.asarray(y)
+
+
+def hex_cells(x, y, size):
+    """Axial coordinates (q, r) of the hexagons containing the points (cube rounding, vectorized)"""
+    fq = (SQRT3 / 3 * x - y / 3) / size
+    fr = (2 / 3 * y) / size
+    fs = -fq - fr
+    q, r, s = np.rint(fq), np.rint(fr), np.rint(fs)
+    dq, dr, ds = np.abs(q - fq), np.abs(r - fr), np.abs(s - fs)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+    return q.astype('int32'), r.astype('int32')
+
+
+def hex_centers(q, r, size):
+    """Center of each hexagon in meters of the grid CRS"""
+    q = np.asarray(q, dtype='float64')
+    r = np.asarray(r, dtype='float64')
+    return size * SQRT3 * (q + r / 2), size * 1.5 * r
+
+
+def hex_polygons(q, r, size):
+    """Hexagon polygons (grid CRS) of the cells, built in one shapely call"""
+    cx, cy = hex_centers(q, r, size)
+    angles = np.deg2rad(30 + 60 * np.arange(7))
+    coords = np.stack([cx[:, None] + size * np.cos(angles), cy[:, None] + size * np.sin(angles)], axis=-1)
+    return shapely.polygons(coords)
+
+
+def _cell_key(q, r):
+    return (q.astype('int64') << 32) | (r.astype('int64') & 0xFFFFFFFF)
+
+
+def _key_cells(key):
+    return (key >> 32).astype('int32'), (key & 0xFFFFFFFF).astype('uint32').astype('int32')
+
+
+def bin_points(x, y, size, weights=None):
+    """Points per hexagon (and the sum of the weights per hexagon); returns q, r, count[, weight]"""
+    q, r = hex_cells(x, y, size)
+    keys, inverse = np.unique(_cell_key(q, r), return_inverse=True)
+    cq, cr = _key_cells(keys)
+    out = pd.DataFrame({'q': cq, 'r': cr, 'count': np.bincount(inverse, minlength=len(keys)).astype('int32')})
+    if weights is not None:
+        out['weight'] = np.bincount(inverse, weights=np.nan_to_num(np.asarray(weights, dtype='float64')), minlength=len(keys))
+    return out
+
+
+def grid_over(bounds, size):
+    """All hexagons whose center lies within bounds (grid CRS) grown by one cell"""
+    minx, miny, maxx, maxy = bounds
+    r0, r1 = int(np.floor((miny - size) / (1.5 * size))), int(np.ceil((maxy + size) / (1.5 * size)))
+    r = np.arange(r0, r1 + 1)
+    q0 = int(np.floor((minx - size) / (SQRT3 * size) - r1 / 2)) - 1
+    q1 = int(np.ceil((maxx + size) / (SQRT3 * size) - r0 / 2)) + 1
+    qq, rr = np.meshgrid(np.arange(q0, q1 + 1), r)
+    qq, rr = qq.ravel(), rr.ravel()
+    cx, cy = hex_centers(qq, rr, size)
+    keep = (cx >= minx - size) & (cx <= maxx + size) & (cy >= miny - size) & (cy <= maxy + size)
+    return qq[keep].astype('int32'), rr[keep].astype('int32')
+
+
+def interpolate_residents(gdf_resid, size, value_col='Einwohner', crs=None):
+    """Areal interpolation of PLZ residents into hexagons: each PLZ contributes in proportion to the overlapping area"""
+    plz = gdf_resid.to_crs(crs or gd.metric_crs(gdf_resid))
+    polys = plz.geometry.values
+    values = pd.to_numeric(plz[value_col], errors='coerce').fillna(0).to_numpy(dtype='float64')
+
+    q, r = grid_over(plz.total_bounds, size)
+    cells = hex_polygons(q, r, size)
+    plz_idx, cell_idx = shapely.STRtree(cells).query(polys, predicate='intersects')
+    overlap = shapely.area(shapely.intersection(polys[plz_idx], cells[cell_idx]))
+    share = overlap / np.maximum(shapely.area(polys), 1e-9)[plz_idx]
+
+    residents = np.bincount(cell_idx, weights=share * values[plz_idx], minlength=len(cells))
+    hit = np.unique(cell_idx)
+    return pd.DataFrame({'q': q[hit], 'r': r[hit], 'Einwohner': residents[hit]})
+
+
+@ht.timer
+def hex_aggregate(gdf_lstat, gdf_resid, size, crs=None):
+    """Stations, summed power and interpolated residents per hexagon of one resolution (GeoDataFrame, EPSG:4326)"""
+    # the grid is laid out in the UTM zone of the residents unless the region sets its CRS
+    crs = crs or gd.metric_crs(gdf_resid)
+    x, y = project_points(gdf_lstat['Breitengrad'], gdf_lstat['Längengrad'], crs)
+    valid = np.isfinite(x) & np.isfinite(y)
+    kw = gdf_lstat['KW'].to_numpy()[valid] if 'KW' in gdf_lstat.columns else None
+    stations = bin_points(x[valid], y[valid], size, weights=kw).rename(columns={'count': 'Stations', 'weight': 'KW'})
+    residents = interpolate_residents(gdf_resid, size, crs=crs)
+
+    cells = stations.merge(residents, on=['q', 'r'], how='outer')
+    cells['Stations'] = cells['Stations'].fillna(0).astype('int32')
+    if 'KW' in cells.columns:
+        cells['KW'] = cells['KW'].fillna(0).round(1).astype('float32')
+    cells['Einwohner'] = cells['Einwohner'].fillna(0).round().astype('int32')
+    cells['Stations_10k'] = np.where(cells['Einwohner'] > 0, cells['Stations'] / cells['Einwohner'].clip(lower=1) * 10_000, np.nan).round(2)
+    cells['size_m'] = np.int32(size)
+
+    geometry = gpd.GeoSeries(hex_polygons(cells['q'].to_numpy(), cells['r'].to_numpy(), size), crs=crs)
+    return gpd.GeoDataFrame(cells, geometry=geometry.to_crs(epsg=4326).values, crs='EPSG:4326')
+
+
+def hex_pyramid(gdf_lstat, gdf_resid, resolutions=DEFAULT_RESOLUTIONS, crs=None):
+    """{cell size: hexagon frame} for every resolution"""
+    return {size: hex_aggregate(gdf_lstat, gdf_resid, size, crs) for size in resolutions}
+
+
+def load_hex_pyramid(data, pdict):
+    """Hexagon pyramid of the loaded data; each level is an artifact keyed by the station and resident stages"""
+    # the CRS of the region lays out the cells, so it keys the levels as well
+    depends = [data['artifact_keys']['gdf_lstat3'], data['artifact_keys']['gdf_residents2'], data['crs']]
+    return {size: ac.cached_stage(f"hex_{data['slug']}_{size}", [], pdict,
+                                  lambda size=size: hex_aggregate(data['gdf_lstat3'], data['gdf_residents2'], size,
+                                                                  data['crs']),
+                                  ac.stage_version(HEX_VERSION, __file__), depends=depends)
+            for size in pdict.get('hex_resolutions', DEFAULT_RESOLUTIONS)}
+
+
+def resolution_for_zoom(zoom, resolutions=DEFAULT_RESOLUTIONS):
+    """Coarsest pyramid level whose cells are still about 16 screen pixels wide at a web map zoom"""
+    meters_per_pixel = 156543.03 * np.cos(np.deg2rad(52.5)) / 2 ** zoom
+    fitting = [s for s in sorted(resolutions) if 2 * s / meters_per_pixel <= 48]
+    return fitting[-1] if fitting else min(resolutions)
+
+
+if __name__ == "__main__":
+    # python -m core.hexgrid: builds (or loads) the pyramid of the datasets and prints one line per level
+    import main
+    from config import pdict
+    for size, cells in load_hex_pyramid(main.load_data(), pdict).items():
+        print(f"{size:>6} m  cells={len(cells):>6}  stations={int(cells['Stations'].sum()):>7}  "
+              f"residents={int(cells['Einwohner'].sum()):>9}")
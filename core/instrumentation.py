@@ -0,0 +1,354 @@
+import os
+import sys
+import time
+import bisect
+import cProfile
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from datetime import datetime
+
+
+# Environment switches
+#   HEATMAP_PROFILE=cprofile|pyinstrument  profile every profiled() block (e.g. one app run) into cache/profiles
+#   HEATMAP_TIMER_PRINT=0                  silence the " ====> Duration" lines of HelperTools.timer
+#   HEATMAP_METRICS_PORT=9108              serve the Prometheus text export on this port
+PROFILE_MODE = os.environ.get('HEATMAP_PROFILE', '').strip().lower()
+PRINT_TIMINGS = os.environ.get('HEATMAP_TIMER_PRINT', '1') != '0'
+
+# Project root (one level above core/), profiles are written to cache/profiles
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Latency buckets in seconds (upper bounds, +Inf implicit)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Finished root spans kept for the debug panel
+MAX_TRACES = 50
+
+
+def rss_bytes():
+    """Current resident set size of the process (Linux /proc, else peak RSS from getrusage)"""
+    try:
+        with open('/proc/self/statm', 'r') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+        except (ImportError, OSError):
+            return 0
+
+
+def rows_of(value):
+    """Row count of a result (DataFrame, array, list; first element of a tuple), None if it has none"""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    if isinstance(value, list):
+        return len(value)
+    return None
+
+
+# -----------------------------------------------------------------------------
+class Histogram:
+    """Cumulative latency histogram in the Prometheus sense (bucket counts, sum, count)"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs including +Inf"""
+        total = 0
+        out = []
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def quantile(self, q):
+        """Upper bucket bound containing quantile q (an estimate, like histogram_quantile)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    """In-process metrics: duration histograms, last rows and memory delta per stage, span counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.rows = {}
+        self.memory_delta = {}
+        self.calls = {}
+        self.errors = {}
+
+    def record(self, finished):
+        with self._lock:
+            stage = finished.name
+            self.durations.setdefault(stage, Histogram()).observe(finished.duration)
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            if finished.error:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+            if finished.rows is not None:
+                self.rows[stage] = finished.rows
+            self.memory_delta[stage] = finished.memory_delta
+
+    def summary(self):
+        """One dict per stage: calls, errors, total/mean seconds, p50/p95 bucket, last rows and memory delta"""
+        with self._lock:
+            out = []
+            for stage, hist in sorted(self.durations.items()):
+                out.append({
+                    'stage': stage,
+                    'calls': self.calls.get(stage, 0),
+                    'errors': self.errors.get(stage, 0),
+                    'seconds_total': round(hist.sum, 4),
+                    'seconds_mean': round(hist.sum / hist.count, 4) if hist.count else None,
+                    'p50_le': hist.quantile(0.5),
+                    'p95_le': hist.quantile(0.95),
+                    'rows': self.rows.get(stage),
+                    'memory_delta_mb': round(self.memory_delta.get(stage, 0) / 1e6, 2),
+                })
+            return out
+
+    def reset(self):
+        with self._lock:
+            for values in (self.durations, self.rows, self.memory_delta, self.calls, self.errors):
+                values.clear()
+
+
+REGISTRY = MetricsRegistry()
+TRACES = deque(maxlen=MAX_TRACES)
+
+# Span currently open in this thread / asyncio task
+_CURRENT = contextvars.ContextVar('heatmap_current_span', default=None)
+
+
+class Span:
+    """One timed pipeline stage; children are the spans opened while it was current"""
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.attrs = dict(attrs)
+        self.children = []
+        self.rows = None
+        self.error = None
+        self.start = time.perf_counter()
+        self.started_at = datetime.now().isoformat(timespec='milliseconds')
+        self.duration = 0.0
+        self._rss_start = rss_bytes()
+        self.memory_delta = 0
+
+    def set(self, rows=None, **attrs):
+        """Attaches a row count and/or further attributes"""
+        if rows is not None:
+            self.rows = int(rows)
+        self.attrs.update(attrs)
+        return self
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        self.memory_delta = rss_bytes() - self._rss_start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'seconds': round(self.duration, 4),
+            'rows': self.rows,
+            'memory_delta_mb': round(self.memory_delta / 1e6, 2),
+            'error': self.error,
+            'attrs': {k: str(v) for k, v in self.attrs.items()},
+            'children': [c.to_dict() for c in self.children],
+        }
+
+    def flatten(self):
+        """The span and its descendants in call order, as (depth, span) pairs"""
+        out = [(self.depth, self)]
+        for child in self.children:
+            out += child.flatten()
+        return out
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Times a block as a span nested under the current one; recorded in the metrics registry"""
+    parent = _CURRENT.get()
+    current = Span(name, parent, **attrs)
+    if parent is not None:
+        parent.children.append(current)
+    token = _CURRENT.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.finish()
+        _CURRENT.reset(token)
+        REGISTRY.record(current)
+        if parent is None:
+            TRACES.append(current)
+
+
+def current_span():
+    """Span open in this context, None outside of any span"""
+    return _CURRENT.get()
+
+
+def last_trace(name=None):
+    """Most recent finished root span (optionally with a given name)"""
+    for root in reversed(TRACES):
+        if name is None or root.name == name:
+            return root
+    return None
+
+
+# -----------------------------------------------------------------------------
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def prometheus_text(registry=None, prefix='heatmap'):
+    """Metrics registry in the Prometheus text exposition format"""
+    registry = registry or REGISTRY
+    lines = [
+        f"# HELP {prefix}_stage_duration_seconds Duration of pipeline stages",
+        f"# TYPE {prefix}_stage_duration_seconds histogram",
+    ]
+    with registry._lock:
+        for stage, hist in sorted(registry.durations.items()):
+            label = _label(stage)
+            for bound, total in hist.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{label}",le="{le}"}} {total}')
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{label}"}} {hist.sum:.6f}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{label}"}} {hist.count}')
+
+        lines += [f"# HELP {prefix}_stage_errors_total Pipeline stages that raised", f"# TYPE {prefix}_stage_errors_total counter"]
+        lines += [f'{prefix}_stage_errors_total{{stage="{_label(s)}"}} {n}' for s, n in sorted(registry.errors.items())]
+        lines += [f"# HELP {prefix}_stage_rows Rows returned by the last run of a stage", f"# TYPE {prefix}_stage_rows gauge"]
+        lines += [f'{prefix}_stage_rows{{stage="{_label(s)}"}} {n}' for s, n in sorted(registry.rows.items())]
+        lines += [f"# HELP {prefix}_stage_memory_delta_bytes RSS change during the last run of a stage",
+                  f"# TYPE {prefix}_stage_memory_delta_bytes gauge"]
+        lines += [f'{prefix}_stage_memory_delta_bytes{{stage="{_label(s)}"}} {n}' for s, n in sorted(registry.memory_delta.items())]
+    lines += [f"# HELP {prefix}_process_resident_memory_bytes Resident memory of the process",
+              f"# TYPE {prefix}_process_resident_memory_bytes gauge",
+              f"{prefix}_process_resident_memory_bytes {rss_bytes()}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, registry=None):
+    """Writes the text export atomically (for the node_exporter textfile collector)"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        fh.write(prometheus_text(registry))
+    os.replace(tmp, path)
+    return path
+
+
+_METRICS_SERVER = None
+
+
+def start_metrics_server(port=None):
+    """Serves /metrics on a background thread once per process (port from HEATMAP_METRICS_PORT if not given)"""
+    global _METRICS_SERVER
+    port = port or os.environ.get('HEATMAP_METRICS_PORT')
+    if _METRICS_SERVER is not None or not port:
+        return _METRICS_SERVER
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = prometheus_text().encode('utf-8')
+            self.send_response(200 if self.path.startswith('/metrics') else 404)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        _METRICS_SERVER = ThreadingHTTPServer(('0.0.0.0', int(port)), MetricsHandler)
+    except OSError as e:
+        print(f"Metrics server not started on port {port} ({e})")
+        return None
+    threading.Thread(target=_METRICS_SERVER.serve_forever, daemon=True).start()
+    return _METRICS_SERVER
+
+
+# -----------------------------------------------------------------------------
+def get_profile_dir():
+    """Folder of the profiler output, created on demand"""
+    profile_dir = os.path.join(basedir, 'cache', 'profiles')
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+@contextlib.contextmanager
+def profiled(name, mode=None):
+    """Profiles a block with cProfile or pyinstrument when HEATMAP_PROFILE is set; no-op otherwise"""
+    mode = (mode if mode is not None else PROFILE_MODE) or ''
+    if mode not in ('cprofile', 'pyinstrument'):
+        yield None
+        return
+
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    if mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed, profiling with cProfile")
+            mode = 'cprofile'
+
+    if mode == 'pyinstrument':
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            path = os.path.join(get_profile_dir(), f"{name}_{stamp}.html")
+            with open(path, 'w', encoding='utf-8') as fh:
+                fh.write(profiler.output_html())
+            print(f"Profile written to {path}")
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            path = os.path.join(get_profile_dir(), f"{name}_{stamp}.prof")
+            profiler.dump_stats(path)
+            print(f"Profile written to {path} (view with: python -m pstats {path})")
+
+
+if __name__ == "__main__":
+    # python -m core.instrumentation: runs the loading pipeline once and prints the stage metrics
+    # (the registry lives in the imported module core.instrumentation, not in this __main__ copy)
+    import main
+    from core import instrumentation
+    main.load_data()
+    sys.stdout.write(instrumentation.prometheus_text())
@@ -1,133 +1,311 @@
 import pandas                        as pd
 import geopandas                     as gpd
+import shapely
 import core.HelperTools              as ht
+import core.geodata                  as gd
+import core.registry                 as rg
+import core.instrumentation          as ins
+import core.suggestions              as sg
+import core.hexgrid                  as hx
+import core.recommend                as rc
 
 import folium
 import numpy as np
 # from folium.plugins import HeatMap
 import streamlit as st
+import streamlit.components.v1 as components
 from streamlit_folium import folium_static
 from branca.colormap import LinearColormap
+from branca.element import MacroElement, Template
 import json
-import os
+import hashlib
 from datetime import datetime
 
 
 
 def sort_by_plz_add_geometry(dfr, dfg, pdict): 
-    dframe                  = dfr.copy()
-    df_geo                  = dfg.copy()
-    
-    sorted_df               = dframe\
-        .sort_values(by='PLZ')\
-        .reset_index(drop=True)\
-        .sort_index()
-        
-    sorted_df2              = sorted_df.merge(df_geo, on=pdict["geocode"], how ='left')
+    # inputs are only read, never modified: no defensive copies of the shared frames
+    dframe                  = dfr
+    df_geo                  = dfg
+    key                     = pdict["geocode"]
+
+    sorted_df               = dframe.sort_values(by='PLZ', ignore_index=True)
+
+    geo_keys                = pd.Index(df_geo[key])
+    if geo_keys.is_unique:
+        # one positional take of the polygons instead of a merge (keeps the compact PLZ dtype)
+        pos                 = geo_keys.get_indexer(sorted_df[key])
+        found               = pos >= 0
+        geo_cols            = df_geo.drop(columns=key).iloc[pos[found]].reset_index(drop=True)
+        sorted_df2          = pd.concat([sorted_df[found].reset_index(drop=True), pd.DataFrame(geo_cols)], axis=1)
+    else:
+        sorted_df2          = sorted_df.merge(df_geo, on=key, how ='left')
     sorted_df3              = sorted_df2.dropna(subset=['geometry'])
-    
-    # Geometry column may already contain shapely geometry objects or WKT strings.
-    try:
-        # If values are WKT strings, this will succeed.
-        sorted_df3['geometry'] = gpd.GeoSeries.from_wkt(sorted_df3['geometry'])
-    except Exception:
-        # Otherwise, assume they're already geometry objects and construct GeoSeries directly.
-        sorted_df3['geometry'] = gpd.GeoSeries(sorted_df3['geometry'])
 
-    ret = gpd.GeoDataFrame(sorted_df3, geometry='geometry')
+    # Geodata from core.geodata is already parsed; only raw CSV frames still carry WKT strings.
+    if isinstance(df_geo, gpd.GeoDataFrame):
+        ret = gpd.GeoDataFrame(sorted_df3, geometry='geometry', crs=df_geo.crs)
+    else:
+        try:
+            # If values are WKT strings, this will succeed.
+            sorted_df3['geometry'] = gpd.GeoSeries.from_wkt(sorted_df3['geometry'])
+        except Exception:
+            # Otherwise, assume they're already geometry objects and construct GeoSeries directly.
+            sorted_df3['geometry'] = gpd.GeoSeries(sorted_df3['geometry'])
+        ret = gpd.GeoDataFrame(sorted_df3, geometry='geometry')
 
     return ret
     
 
+# -----------------------------------------------------------------------------
+# Compact dtypes of the preprocessed frames
+COORD_DTYPE = 'float32'   # ~1 m at Berlin's latitude, plenty for centroids and markers
+PLZ_DTYPE   = 'int32'
+COUNT_DTYPE = 'int32'
+
+# Artifact versions of the preprocessing stages (core.artifacts): bump when a change alters their output
+PREPROP_LSTAT_VERSION = 1
+PREPROP_RESID_VERSION = 1
+# pdict keys the preprocessing reads
+PREPROP_LSTAT_CONFIG  = ['geocode', 'lstat_plz_assignment']
+PREPROP_RESID_CONFIG  = ['geocode']
+
+
+def compact_dtypes(dframe):
+    """Casts PLZ, coordinates, residents and Bundesland of a filtered frame to compact dtypes"""
+    casts = {}
+    if 'PLZ' in dframe.columns:
+        casts['PLZ'] = PLZ_DTYPE
+    for col in ('Breitengrad', 'Längengrad'):
+        if col in dframe.columns:
+            casts[col] = COORD_DTYPE
+    if 'Einwohner' in dframe.columns:
+        casts['Einwohner'] = COUNT_DTYPE
+    if 'Bundesland' in dframe.columns:
+        casts['Bundesland'] = rg.BUNDESLAND_DTYPE
+    return dframe.astype(casts)
+
+
+def legacy_dtypes(dframe):
+    """Frame with the dtypes used before compaction (coordinates as text, 64-bit numbers), for the memory report"""
+    legacy = dframe.astype({c: 'int64' for c in ('PLZ', 'Einwohner', 'Number') if c in dframe.columns})
+    for col in ('Breitengrad', 'Längengrad'):
+        if col in legacy.columns:
+            legacy[col] = legacy[col].astype('float64').round(6).astype(str)
+    if 'Bundesland' in legacy.columns:
+        legacy['Bundesland'] = legacy['Bundesland'].astype(object)
+    return legacy
+
+
+# -----------------------------------------------------------------------------
+def _to_float(values):
+    """Float array from numbers or strings with comma decimals"""
+    values = pd.Series(values)
+    if not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values.astype(str).str.replace(',', '.'), errors='coerce')
+    return values.to_numpy(dtype=float)
+
+
+def assign_plz_by_coordinates(lat, lon, df_geo):
+    """PLZ of the polygon containing each (lat, lon) point, NaN outside; STRtree-backed"""
+    lat = _to_float(lat)
+    lon = _to_float(lon)
+    geoms = df_geo.geometry.values
+    shapely.prepare(geoms)
+
+    # bounding-box candidates from the tree, then an exact (prepared) point-in-polygon test
+    tree = shapely.STRtree(geoms)
+    point_idx, poly_idx = tree.query(shapely.points(lon, lat))
+    inside = shapely.contains_xy(geoms[poly_idx], lon[point_idx], lat[point_idx])
+
+    plz = np.full(len(lat), np.nan)
+    plz[point_idx[inside]] = df_geo['PLZ'].to_numpy()[poly_idx[inside]]
+    return plz
+
+
+def plz_disagreements(dframe):
+    """Stations whose registry PLZ differs from the PLZ polygon their coordinates fall in"""
+    mask = dframe['PLZ_geo'].notna() & (dframe['PLZ_registry'] != dframe['PLZ_geo'])
+    return dframe.loc[mask, ['PLZ_registry', 'PLZ_geo', 'Breitengrad', 'Längengrad']].reset_index(drop=True)
+
+
 # -----------------------------------------------------------------------------
 @ht.timer
-def preprop_lstat(dfr, dfg, pdict):
+def preprop_lstat(dfr, dfg, pdict, bundesland='Berlin', plz_window=(10115, 14200)):
     """Preprocessing dataframe from Ladesaeulenregister.csv"""
-    dframe = dfr.copy()
-    df_geo = dfg.copy()
-
-    dframe2 = dframe.loc[:, ['Postleitzahl', 'Bundesland', 'Breitengrad', 'Längengrad', 'Nennleistung Ladeeinrichtung [kW]']]
+    # inputs are only read; the column selection below creates the working frame
+    dframe = dfr
+    df_geo = dfg
+
+    columns = ['Postleitzahl', 'Bundesland', 'Breitengrad', 'Längengrad', 'Nennleistung Ladeeinrichtung [kW]']
+    # the charging point id is carried along when present (incremental registry updates, core.deltas)
+    if rg.ID_COLUMN in dframe.columns:
+        columns.append(rg.ID_COLUMN)
+    dframe2 = dframe.loc[:, columns]
     dframe2.rename(columns={"Nennleistung Ladeeinrichtung [kW]": "KW", "Postleitzahl": "PLZ"}, inplace=True)
 
     # Normalize PLZ to numeric to ensure consistent joins with geodata
     dframe2['PLZ'] = pd.to_numeric(dframe2['PLZ'], errors='coerce')
-
-    # Convert lat/lon to string and replace comma decimals with dot
-    dframe2['Breitengrad'] = dframe2['Breitengrad'].astype(str).str.replace(',', '.')
-    dframe2['Längengrad'] = dframe2['Längengrad'].astype(str).str.replace(',', '.')
-
-    dframe3 = dframe2[(dframe2["Bundesland"] == 'Berlin') & (dframe2["PLZ"] > 10115) & (dframe2["PLZ"] < 14200)]
+    dframe2['KW'] = _to_float(dframe2['KW'])
+    dframe2['Bundesland'] = dframe2['Bundesland'].astype(rg.BUNDESLAND_DTYPE)
+
+    # Coordinates as floats once (comma decimals handled here), no string round-trip
+    dframe2['Breitengrad'] = _to_float(dframe2['Breitengrad'])
+    dframe2['Längengrad'] = _to_float(dframe2['Längengrad'])
+
+    # Optional: take the PLZ from the polygon the station coordinates fall in instead of the registry column
+    disagreements = None
+    if pdict.get('lstat_plz_assignment', 'registry') == 'coordinates':
+        if not isinstance(df_geo, gpd.GeoDataFrame):
+            df_geo = gpd.GeoDataFrame(df_geo, geometry=gpd.GeoSeries.from_wkt(df_geo['geometry']), crs='EPSG:4326')
+        dframe2['PLZ_registry'] = dframe2['PLZ']
+        dframe2['PLZ_geo'] = assign_plz_by_coordinates(dframe2['Breitengrad'], dframe2['Längengrad'], df_geo)
+        disagreements = plz_disagreements(dframe2)
+        # reported on the span of this stage (stage metrics, debug panel) besides attrs['plz_disagreements']
+        ins.current_span().set(plz_disagreements=len(disagreements),
+                               plz_outside_polygons=int(dframe2['PLZ_geo'].isna().sum()))
+        dframe2 = dframe2[dframe2['PLZ_geo'].notna()].copy()
+        dframe2['PLZ'] = dframe2['PLZ_geo'].astype(int)
+        dframe2 = dframe2.drop(columns=['PLZ_registry', 'PLZ_geo'])
+
+    # stations of one region: its Bundesland and PLZ window (bounds exclusive)
+    dframe3 = dframe2[(dframe2["Bundesland"] == bundesland) & (dframe2["PLZ"] > plz_window[0]) & (dframe2["PLZ"] < plz_window[1])]
+    dframe3 = compact_dtypes(dframe3)
 
     ret = sort_by_plz_add_geometry(dframe3, df_geo, pdict)
+    if disagreements is not None:
+        ret.attrs['plz_disagreements'] = disagreements
     return ret
 
 def count_plz_occurrences(df_lstat2):
     """Counts loading stations per PLZ"""
-    # Group by PLZ and count occurrences, keeping geometry
-    result_df = df_lstat2.groupby('PLZ').agg(
-        Number=('PLZ', 'count'),
-        geometry=('geometry', 'first')
-    ).reset_index()
+    # Group by PLZ and count occurrences, keeping geometry (and the summed power if present)
+    aggs = dict(Number=('PLZ', 'count'), geometry=('geometry', 'first'))
+    if 'KW' in df_lstat2.columns:
+        aggs['KW'] = ('KW', 'sum')
+    result_df = df_lstat2.groupby('PLZ').agg(**aggs).reset_index().astype({'Number': COUNT_DTYPE})
     
     return result_df
 
 
-def load_suggestions():
-    """Load suggestions from JSON file"""
-    suggestions_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'suggestions.json')
-    if os.path.exists(suggestions_file):
-        try:
-            with open(suggestions_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+# Demand metrics already computed, keyed by a hash of their inputs
+_DEMAND_CACHE = {}
 
 
-def save_suggestion(suggestion):
-    """Save a new suggestion to JSON file"""
-    suggestions = load_suggestions()
-    suggestion['id'] = len(suggestions) + 1
-    suggestion['timestamp'] = datetime.now().isoformat()
-    suggestion['status'] = 'pending'  # pending, approved, rejected
-    suggestion['reviewed_by'] = None
-    suggestion['review_date'] = None
-    suggestion['review_notes'] = None
-    suggestions.append(suggestion)
+def _data_version(*series):
+    """Content hash of a few columns, used to memoize derived frames"""
+    h = hashlib.sha1()
+    for s in series:
+        h.update(pd.util.hash_pandas_object(pd.Series(s), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _residents_of(df_resid):
+    """PLZ and residents per residents row"""
+    res_col = next((c for c in df_resid.columns if 'einw' in str(c).lower()), None)
+    plz = df_resid['PLZ'].to_numpy()
+    residents = df_resid[res_col].fillna(0).to_numpy(dtype=float) if res_col else np.zeros(len(plz))
+    return plz, residents
+
+
+def residents_version(df_resid):
+    """Content hash of the PLZ and residents columns the demand metrics read"""
+    return _data_version(*_residents_of(df_resid))
 
-    suggestions_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'suggestions.json')
-    with open(suggestions_file, 'w', encoding='utf-8') as f:
-        json.dump(suggestions, f, indent=2, ensure_ascii=False)
+
+def _demand_inputs(df_counts, df_resid):
+    """PLZ and residents per residents row, the station count columns and the memo key of their demand metrics"""
+    plz, residents = _residents_of(df_resid)
+    kw_col = df_counts['KW'] if 'KW' in df_counts.columns else pd.Series(np.zeros(len(df_counts)))
+    key = _data_version(plz, residents, df_counts['PLZ'], df_counts['Number'], kw_col)
+    return plz, residents, kw_col, key
+
+
+def _demand_rows(plz, residents, df_counts, kw_col):
+    """Demand metric columns for the given PLZ/residents rows"""
+    # vectorized PLZ lookup of the station counts; PLZ without stations get 0
+    pos = pd.Index(df_counts['PLZ']).get_indexer(plz)
+    found = pos >= 0
+    number = np.where(found, df_counts['Number'].to_numpy(dtype=float)[pos], 0.0)
+    kw = np.where(found, kw_col.fillna(0).to_numpy(dtype=float)[pos], 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # zero-station PLZ count as high demand equal to their residents
+        demand = np.where(number > 0, residents / number, residents)
+        per_10k = np.where(residents > 0, number * 10000 / residents, 0.0)
+        kw_per_resident = np.where(residents > 0, kw / residents, 0.0)
+
+    return {
+        'PLZ': plz,
+        'Einwohner': residents.astype(int),
+        'Number': number.astype(int),
+        'KW': kw,
+        'demand': np.nan_to_num(demand, nan=0.0, posinf=0.0, neginf=0.0),
+        'stations_per_10k': np.nan_to_num(per_10k, nan=0.0, posinf=0.0, neginf=0.0),
+        'kw_per_resident': np.nan_to_num(kw_per_resident, nan=0.0, posinf=0.0, neginf=0.0),
+    }
+
+
+def _remember_demand(key, metrics):
+    if len(_DEMAND_CACHE) > 8:
+        _DEMAND_CACHE.clear()
+    _DEMAND_CACHE[key] = metrics
+    return metrics
+
+
+def compute_demand_metrics(df_counts, df_resid):
+    """Demand metrics per residents row: residents/station, stations per 10k residents, kW per resident"""
+    plz, residents, kw_col, key = _demand_inputs(df_counts, df_resid)
+    if key in _DEMAND_CACHE:
+        return _DEMAND_CACHE[key]
+
+    metrics = pd.DataFrame(_demand_rows(plz, residents, df_counts, kw_col), index=df_resid.index)
+    return _remember_demand(key, metrics)
+
+
+def patch_demand_metrics(old, df_counts, df_resid, changed_plz):
+    """Demand metrics of new station counts from the metrics of the previous counts, recomputing the rows of changed_plz"""
+    plz, residents, kw_col, key = _demand_inputs(df_counts, df_resid)
+    if key in _DEMAND_CACHE:
+        return _DEMAND_CACHE[key]
+
+    rows = np.isin(plz, np.asarray(list(changed_plz), dtype=plz.dtype))
+    metrics = old.copy()
+    if rows.any():
+        patch = _demand_rows(plz[rows], residents[rows], df_counts, kw_col)
+        for col, values in patch.items():
+            metrics.loc[rows, col] = values
+    return _remember_demand(key, metrics)
+
+
+def demand_color_max(demand):
+    """Upper end of the demand color scale: 95th percentile of the non-zero values"""
+    demand = np.asarray(demand, dtype=float)
+    nonzero = demand[demand > 0]
+    vmax = int(np.percentile(nonzero, 95)) if len(nonzero) else 0
+    if vmax <= 0:
+        vmax = int(demand.max()) if len(demand) and demand.max() > 0 else 1
+    return vmax
+
+
+def load_suggestions(status=None):
+    """Load suggestions from the configured suggestion store"""
+    return sg.get_suggestion_store().list(status=status)
+
+
+def save_suggestion(suggestion):
+    """Save a new suggestion to the suggestion store"""
+    return sg.get_suggestion_store().add(sg.new_suggestion(suggestion))
 
 
 def review_suggestion(suggestion_id, status, reviewer="Admin", notes=""):
     """Review a suggestion (approve/reject)"""
-    suggestions = load_suggestions()
-    for suggestion in suggestions:
-        if suggestion.get('id') == suggestion_id:
-            suggestion['status'] = status
-            suggestion['reviewed_by'] = reviewer
-            suggestion['review_date'] = datetime.now().isoformat()
-            suggestion['review_notes'] = notes
-            break
-
-    suggestions_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'suggestions.json')
-    with open(suggestions_file, 'w', encoding='utf-8') as f:
-        json.dump(suggestions, f, indent=2, ensure_ascii=False)
-
-
-def get_plz_centroid(plz, df_geo):
-    """Get centroid coordinates for a PLZ"""
-    try:
-        plz_int = int(plz)
-        geo_row = df_geo[df_geo['PLZ'] == plz_int]
-        if not geo_row.empty:
-            geom = geo_row.iloc[0]['geometry']
-            if hasattr(geom, 'centroid'):
-                return geom.centroid.y, geom.centroid.x
-    except:
-        pass
-    return None, None
+    sg.get_suggestion_store().review(suggestion_id, status, reviewer, datetime.now().isoformat(), notes)
+
+
+def get_plz_centroid(plz, plz_index):
+    """Get centroid coordinates for a PLZ from a PLZ index (core.geodata.build_plz_index)"""
+    return gd.lookup_plz_centroid(plz_index, plz)
     
 # -----------------------------------------------------------------------------
 # @ht.timer
@@ -172,25 +350,23 @@ def get_plz_centroid(plz, df_geo):
     
 # -----------------------------------------------------------------------------
 @ht.timer
-def preprop_resid(dfr, dfg, pdict):
+def preprop_resid(dfr, dfg, pdict, plz_window=(10000, 14200)):
     """Preprocessing dataframe from plz_einwohner.csv"""
-    dframe                  = dfr.copy()
-    df_geo                  = dfg.copy()    
+    # inputs are only read; the column selection below creates the working frame
+    dframe                  = dfr
+    df_geo                  = dfg
     
     dframe2               	= dframe.loc[:,['plz', 'einwohner', 'lat', 'lon']]
     dframe2.rename(columns  = {"plz": "PLZ", "einwohner": "Einwohner", "lat": "Breitengrad", "lon": "Längengrad"}, inplace = True)
 
-    # Convert to string
-    dframe2['Breitengrad']  = dframe2['Breitengrad'].astype(str)
-    dframe2['Längengrad']   = dframe2['Längengrad'].astype(str)
-
-    # Now replace the commas with periods
-    dframe2['Breitengrad']  = dframe2['Breitengrad'].str.replace(',', '.')
-    dframe2['Längengrad']   = dframe2['Längengrad'].str.replace(',', '.')
+    # Coordinates as floats (comma decimals handled by _to_float)
+    dframe2['Breitengrad']  = _to_float(dframe2['Breitengrad'])
+    dframe2['Längengrad']   = _to_float(dframe2['Längengrad'])
 
     dframe3                 = dframe2[ 
-                                            (dframe2["PLZ"] > 10000) &  
-                                            (dframe2["PLZ"] < 14200)]
+                                            (dframe2["PLZ"] > plz_window[0]) &  
+                                            (dframe2["PLZ"] < plz_window[1])]
+    dframe3                 = compact_dtypes(dframe3)
     
     ret = sort_by_plz_add_geometry(dframe3, df_geo, pdict)
     
@@ -198,12 +374,540 @@ def preprop_resid(dfr, dfg, pdict):
 
 
 # -----------------------------------------------------------------------------
+def colors_from_colormap(color_map, values):
+    """Vectorized hex colors of a branca LinearColormap (same result as calling it per value)"""
+    vals = np.nan_to_num(np.asarray(values, dtype=float), nan=color_map.vmin)
+    vals = np.clip(vals, color_map.vmin, color_map.vmax)
+    index = np.asarray(color_map.index, dtype=float)
+    rgba = np.asarray(color_map.colors, dtype=float)
+    channels = np.column_stack([np.interp(vals, index, rgba[:, i]) for i in range(4)])
+    channels = (channels * 255.9999).astype(int)
+    return ['#{:02x}{:02x}{:02x}{:02x}'.format(*c) for c in channels]
+
+
+def _feature_style(feature, fill_property='fillColor'):
+    """Style of a PLZ polygon; fill color is precomputed in the feature properties"""
+    return {
+        'fillColor': feature['properties'][fill_property],
+        'color': 'black',
+        'weight': 1,
+        'fillOpacity': 0.7
+    }
+
+
+def choropleth_features(gdf, value_col, color_map, fields):
+    """PLZ polygons with the tooltip fields and their precomputed fill color"""
+    layer = gpd.GeoDataFrame(gdf[fields], geometry=gdf.geometry)
+    layer['fillColor'] = colors_from_colormap(color_map, gdf[value_col])
+    return layer
+
+
+def add_choropleth_layer(m, gdf, value_col, color_map, fields, name, aliases=None):
+    """Adds all PLZ polygons as a single GeoJson FeatureCollection layer, returns the features"""
+    layer = choropleth_features(gdf, value_col, color_map, fields)
+    folium.GeoJson(
+        layer,
+        name=name,
+        style_function=_feature_style,
+        tooltip=folium.GeoJsonTooltip(fields=fields, aliases=aliases or [f"{f}:" for f in fields])
+    ).add_to(m)
+    return layer
+
+
+def with_display_geometry(gdf, df_geo_display):
+    """Swaps the polygons of a PLZ frame for simplified display geometry (matched on PLZ)"""
+    if df_geo_display is None:
+        return gdf
+    display_geom = df_geo_display.set_index('PLZ').geometry
+    display_geom = display_geom[~display_geom.index.duplicated()]
+    geometry = gdf['PLZ'].map(display_geom).fillna(gdf.geometry)
+    return gdf.set_geometry(gpd.GeoSeries(geometry.values, index=gdf.index, crs=gdf.crs))
+
+
+def _merge_station_counts(dframe1, dframe2):
+    """Full PLZ GeoDataFrame (residents geometries) with station counts, zeros explicit"""
+    # detect residents column name in the residents GeoDataFrame
+    res_col = next((c for c in dframe2.columns if 'einw' in str(c).lower()), None)
+    if res_col is not None:
+        temp_res = dframe2[['PLZ', 'geometry', res_col]].rename(columns={res_col: 'Einwohner'})
+    else:
+        temp_res = dframe2[['PLZ', 'geometry']].assign(Einwohner=0)
+
+    full_gdf = temp_res.merge(dframe1[['PLZ', 'Number']], on='PLZ', how='left')
+    full_gdf['Number'] = full_gdf['Number'].fillna(0).astype(int)
+    full_gdf['Einwohner'] = full_gdf['Einwohner'].fillna(0).astype(int)
+    return full_gdf
+
+
+def _show_suggestion(suggestion, admin_mode):
+    """Draws one suggestion of the "View Suggestions" tab, with review buttons in admin mode"""
+    status = suggestion.get('status', 'pending')
+    status_emoji = {"pending": "⏳", "approved": "✅", "rejected": "❌"}.get(status, "❓")
+
+    st.write(f"{status_emoji} **PLZ {suggestion.get('plz', 'Unknown')} — Location:** {suggestion.get('address', 'N/A')}")
+    st.write(f"**Reason:** {suggestion.get('reason', 'N/A')}")
+    st.write(f"**Status:** {status.title()}")
+
+    timestamp = suggestion.get('timestamp', '')
+    if timestamp:
+        try:
+            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            st.caption(f"Suggested on {dt.strftime('%Y-%m-%d %H:%M')}")
+        except:
+            st.caption(f"Suggested: {timestamp}")
+
+    # Show review info if available
+    if suggestion.get('reviewed_by'):
+        st.caption(f"Reviewed by {suggestion['reviewed_by']} on {(suggestion.get('review_date') or '')[:10]}")
+        if suggestion.get('review_notes'):
+            st.caption(f"Notes: {suggestion['review_notes']}")
+
+    # Admin review buttons (Only visible if admin_mode is True)
+    if admin_mode and status == 'pending':
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button(f"✅ Approve #{suggestion['id']}", key=f"approve_{suggestion['id']}"):
+                review_suggestion(suggestion['id'], 'approved', 'Admin')
+                st.success("Suggestion approved!")
+                st.rerun()
+        with col2:
+            if st.button(f"❌ Reject #{suggestion['id']}", key=f"reject_{suggestion['id']}"):
+                review_suggestion(suggestion['id'], 'rejected', 'Admin')
+                st.success("Suggestion rejected!")
+                st.rerun()
+        with col3:
+            notes = st.text_input(f"Notes for #{suggestion['id']}", key=f"notes_{suggestion['id']}")
+            if st.button(f"💬 Add Notes #{suggestion['id']}", key=f"add_notes_{suggestion['id']}"):
+                review_suggestion(suggestion['id'], status, 'Admin', notes)
+                st.success("Notes added!")
+                st.rerun()
+
+    st.divider()
+
+
+# -----------------------------------------------------------------------------
+LAYERS = ("Residents", "Charging_Stations", "Demand")
+
+# Initial map center (lat, lon); regions other than Berlin pass their own
+MAP_CENTER = (52.52, 13.40)
+
+# Optional layer of the nearest-station metrics (core.nearest), shown when the PLZ frame carries them
+COVERAGE_LAYER = "Coverage"
+COVERAGE_FIELDS = ['dist_mean_m', 'dist_max_m', 'share_within', 'residents_beyond']
+
+
+def with_coverage(gdf, coverage):
+    """PLZ frame with the coverage metrics of core.nearest joined by PLZ (a new frame, the input stays untouched)"""
+    if coverage is None:
+        return gdf
+    merged = gdf.drop(columns=[c for c in COVERAGE_FIELDS if c in gdf.columns]).merge(
+        coverage[['PLZ'] + COVERAGE_FIELDS], on='PLZ', how='left')
+    merged.index = gdf.index
+    return gpd.GeoDataFrame(merged, geometry=gdf.geometry.name, crs=gdf.crs)
+
+
+def available_layers(dframe2_map):
+    """Heatmap layers the PLZ frame has data for"""
+    return LAYERS + ((COVERAGE_LAYER,) if 'dist_mean_m' in dframe2_map.columns else ())
+
+
+def layer_frame(layer, dframe1, dframe2_map):
+    """PLZ GeoDataFrame, value column, color map, tooltip fields and aliases of one heatmap layer"""
+    if layer == "Residents":
+        # Create a color map for Residents
+        color_map = LinearColormap(colors=['yellow', 'red'], vmin=dframe2_map['Einwohner'].min(), vmax=dframe2_map['Einwohner'].max())
+        return dframe2_map, 'Einwohner', color_map, ['PLZ', 'Einwohner'], None
+
+    elif layer == "Charging_Stations":
+        # Build full PLZ GeoDataFrame (use residents geometries) and merge counts so zeros are explicit
+        full_gdf = _merge_station_counts(dframe1, dframe2_map)
+
+        # compute colormap vmin/vmax from full_gdf to include zeros
+        vmin = int(full_gdf['Number'].min())
+        vmax = int(full_gdf['Number'].max())
+        color_map = LinearColormap(colors=['yellow', 'red'], vmin=vmin, vmax=vmax)
+        return full_gdf, 'Number', color_map, ['PLZ', 'Number'], None
+
+    elif layer == "Demand":
+        # Demand metrics per PLZ (memoized per input data version), on the display geometry
+        metrics = compute_demand_metrics(dframe1, dframe2_map)
+        full_gdf = gpd.GeoDataFrame(metrics, geometry=dframe2_map.geometry)
+
+        # Color scaling: vmin 0, vmax = 95th percentile to avoid outlier saturation
+        vmax = demand_color_max(full_gdf['demand'])
+        color_map = LinearColormap(colors=['yellow', 'red'], vmin=0, vmax=vmax)
+
+        # Colors are capped at vmax by the colormap lookup so the legend remains readable
+        full_gdf['Demand'] = full_gdf['demand'].round(1)
+        full_gdf['Stations_10k'] = full_gdf['stations_per_10k'].round(2)
+        full_gdf['KW_resident'] = full_gdf['kw_per_resident'].round(3)
+
+        # Add color map legend
+        color_map.caption = 'Residents per charging station (capped at 95th percentile)'
+        return (full_gdf, 'demand', color_map, ['PLZ', 'Demand', 'Stations_10k', 'KW_resident'],
+                ['PLZ:', 'Demand (res/station):', 'Stations per 10k residents:', 'kW per resident:'])
+
+    elif layer == COVERAGE_LAYER and 'dist_mean_m' in dframe2_map.columns:
+        # Mean distance from the PLZ residents (sample points) to the nearest station, 95th percentile cap as for Demand
+        full_gdf = dframe2_map.copy()
+        full_gdf['Nearest_mean_m'] = full_gdf['dist_mean_m'].fillna(0).astype(int)
+        full_gdf['Nearest_max_m'] = full_gdf['dist_max_m'].fillna(0).astype(int)
+        full_gdf['Within_radius_pct'] = (100 * full_gdf['share_within'].fillna(0)).round(1)
+        full_gdf['Residents_beyond'] = full_gdf['residents_beyond'].fillna(0).astype(int)
+        color_map = LinearColormap(colors=['yellow', 'red'], vmin=0, vmax=max(demand_color_max(full_gdf['dist_mean_m']), 1))
+        color_map.caption = 'Mean distance to the nearest charging station in m (capped at 95th percentile)'
+        return (full_gdf, 'dist_mean_m', color_map, ['PLZ', 'Nearest_mean_m', 'Nearest_max_m', 'Within_radius_pct', 'Residents_beyond'],
+                ['PLZ:', 'Mean distance to nearest station (m):', 'Max distance (m):', 'Residents within radius (%):',
+                 'Residents beyond radius:'])
+
+    raise ValueError(f"Unknown layer {layer!r}, expected one of {available_layers(dframe2_map)}")
+
+
+def add_approved_suggestions(m, plz_index):
+    """Adds the approved community suggestions as markers at their PLZ centroid"""
+    approved_suggestions = load_suggestions(status='approved')
+    if approved_suggestions:
+        suggestion_group = folium.FeatureGroup(name="Approved Community Suggestions", show=False)
+        # one batched index lookup for all suggestions instead of a frame scan per suggestion
+        lats, lons = gd.lookup_plz_centroids(plz_index, [s.get('plz', '') for s in approved_suggestions])
+        for suggestion, lat, lon in zip(approved_suggestions, lats, lons):
+            plz = suggestion.get('plz', '')
+            if not (np.isnan(lat) or np.isnan(lon)):
+                folium.Marker(
+                    location=[lat, lon],
+                    popup=f"<b>Approved Suggestion</b><br>PLZ: {plz}<br>Address: {suggestion.get('address', 'N/A')}<br>Reason: {suggestion.get('reason', 'N/A')}",
+                    icon=folium.Icon(color='green', icon='check-circle', prefix='fa')
+                ).add_to(suggestion_group)
+        suggestion_group.add_to(m)
+    return m
+
+
+def add_recommended_sites(m, sites):
+    """Adds the sites picked by core.recommend as numbered circles (radius: newly covered residents)"""
+    if sites is None or not len(sites):
+        return m
+    site_group = folium.FeatureGroup(name="Recommended Charging Sites")
+    largest = max(float(sites['new_residents'].max()), 1.0)
+    for site in sites.itertuples(index=False):
+        folium.CircleMarker(
+            location=[site.lat, site.lon],
+            radius=4 + 8 * np.sqrt(site.new_residents / largest),
+            color='#1f4e9c', weight=1, fill=True, fill_color='#3b82f6', fill_opacity=0.8,
+            tooltip=f"#{site.rank}: +{site.new_residents} residents",
+            popup=(f"<b>Recommended site #{site.rank}</b><br>{rc.SOURCES.get(site.source, site.source)}: {site.label}<br>"
+                   f"Newly covered residents: {site.new_residents}<br>Covered after this site: {site.covered_share:.1%}")
+        ).add_to(site_group)
+    site_group.add_to(m)
+    return m
+
+
+@ht.timer
+def build_heatmap(layer, dframe1, dframe2_map, zoom_start=10, plz_index=None, sites=None, center=MAP_CENTER):
+    """Folium map of one heatmap layer with legend, suggestions and layer control; returns (map, features)"""
+    if plz_index is None:
+        plz_index = gd.build_plz_index(dframe2_map)
+
+    m = folium.Map(location=list(center), zoom_start=zoom_start)
+    gdf, value_col, color_map, fields, aliases = layer_frame(layer, dframe1, dframe2_map)
+
+    # One FeatureCollection for all PLZ polygons, colors precomputed per feature
+    features = add_choropleth_layer(m, gdf, value_col, color_map, fields, layer, aliases=aliases)
+
+    # Add color map to the map
+    color_map.add_to(m)
+
+    # Add community suggestions to the map (only approved ones)
+    add_approved_suggestions(m, plz_index)
+    add_recommended_sites(m, sites)
+
+    # Add layer control
+    folium.LayerControl().add_to(m)
+    return m, features
+
+
+# -----------------------------------------------------------------------------
+# Client-side layer switching: one GeoJSON with every layer's values and fill colors
+def legend_html(color_map, caption):
+    """Compact CSS gradient legend of a LinearColormap (replaces branca's SVG legend in the switch control)"""
+    index = np.asarray(color_map.index, dtype=float)
+    span = (index[-1] - index[0]) or 1.0
+    stops = ', '.join(f"{c} {100 * (v - index[0]) / span:.0f}%" for c, v in zip(colors_from_colormap(color_map, index), index))
+    return (f'<div style="font-size:11px;margin-top:4px">{color_map.caption or caption}</div>'
+            f'<div style="width:180px;height:10px;background:linear-gradient(to right, {stops})"></div>'
+            f'<div style="width:180px;display:flex;justify-content:space-between;font-size:11px">'
+            f'<span>{color_map.vmin:g}</span><span>{color_map.vmax:g}</span></div>')
+
+
+def combined_features(dframe1, dframe2_map):
+    """PLZ polygons once, with the tooltip values and the fill color of every layer as feature properties"""
+    features = gpd.GeoDataFrame({'PLZ': dframe2_map['PLZ'].to_numpy()}, geometry=dframe2_map.geometry.values, crs=dframe2_map.crs)
+    fields, aliases, legends = ['PLZ'], ['PLZ:'], {}
+    for layer in available_layers(dframe2_map):
+        # every layer frame has one row per display row, in the same order
+        gdf, value_col, color_map, layer_fields, layer_aliases = layer_frame(layer, dframe1, dframe2_map)
+        for field, alias in zip(layer_fields, layer_aliases or [f"{f}:" for f in layer_fields]):
+            if field not in fields:
+                features[field] = gdf[field].to_numpy()
+                fields.append(field)
+                aliases.append(alias)
+        features[f'fill_{layer}'] = colors_from_colormap(color_map, gdf[value_col])
+        legends[layer] = legend_html(color_map, layer)
+    return features, fields, aliases, legends
+
+
+class LayerSwitchControl(MacroElement):
+    """Leaflet control with one radio button per layer; switching restyles the GeoJSON (or vector tile) layer in the browser"""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var target = {{ this.target.get_name() }};
+            var layers = {{ this.layers|tojson }};
+            var legends = {{ this.legends|tojson }};
+            var control = L.control({position: 'topright'});
+            control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.background = 'white';
+                div.style.padding = '6px 8px';
+                div.innerHTML = layers.map(function(name) {
+                    return '<label style="display:block;margin:0"><input type="radio" name="{{ this.get_name() }}" value="'
+                        + name + '"' + (name === {{ this.initial|tojson }} ? ' checked' : '') + '> ' + name + '</label>';
+                }).join('') + '<div class="legend"></div>';
+                L.DomEvent.disableClickPropagation(div);
+                var show = function(name) {
+                    {%- if this.vector_tiles %}
+                    target.options.vectorTileLayerStyles.plz = function(properties) {
+                        return Object.assign({fillColor: properties['fill_' + name]}, {{ this.tile_style|tojson }});
+                    };
+                    target.redraw();
+                    {%- else %}
+                    target.setStyle(function(feature) { return {fillColor: feature.properties['fill_' + name]}; });
+                    {%- endif %}
+                    div.querySelector('.legend').innerHTML = legends[name];
+                };
+                div.querySelectorAll('input').forEach(function(input) {
+                    input.addEventListener('change', function() { show(this.value); });
+                });
+                div.querySelector('.legend').innerHTML = legends[{{ this.initial|tojson }}];
+                return div;
+            };
+            control.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, target, layers, legends, initial, vector_tiles=False):
+        super().__init__()
+        self._name = 'LayerSwitchControl'
+        self.target = target
+        self.layers = list(layers)
+        self.legends = legends
+        self.initial = initial
+        self.vector_tiles = vector_tiles
+        self.tile_style = TILE_PLZ_STYLE
+
+
 @ht.timer
-def make_streamlit_electric_Charging_resid(dfr1, dfr2):
+def build_combined_heatmap(dframe1, dframe2_map, zoom_start=10, plz_index=None, initial=LAYERS[0], sites=None,
+                           center=MAP_CENTER):
+    """Folium map with all layers in one GeoJSON and a client-side switch; returns (map, features)"""
+    if plz_index is None:
+        plz_index = gd.build_plz_index(dframe2_map)
+
+    m = folium.Map(location=list(center), zoom_start=zoom_start)
+    features, fields, aliases, legends = combined_features(dframe1, dframe2_map)
+
+    fill_col = f'fill_{initial}'
+    geojson = folium.GeoJson(
+        features,
+        name="PLZ",
+        style_function=lambda feature: _feature_style(feature, fill_col),
+        tooltip=folium.GeoJsonTooltip(fields=fields, aliases=aliases)
+    ).add_to(m)
+    LayerSwitchControl(geojson, list(legends), legends, initial).add_to(m)
+
+    # Add community suggestions to the map (only approved ones)
+    add_approved_suggestions(m, plz_index)
+    add_recommended_sites(m, sites)
+
+    folium.LayerControl().add_to(m)
+    return m, features
+
+
+# Rendered combined maps, keyed by data, geometry, zoom, approved suggestions and recommended sites
+# (least recently used first, at most MAP_HTML_CACHE_SIZE entries)
+_MAP_HTML_CACHE = {}
+MAP_HTML_CACHE_SIZE = 8
+
+
+def combined_heatmap_html(dframe1, dframe2_map, zoom_start=10, plz_index=None, sites=None, center=MAP_CENTER):
+    """HTML of the combined map, rendered once per input version and reused across reruns and sessions"""
+    approved = [(s.get('id'), s.get('plz'), s.get('address'), s.get('reason')) for s in load_suggestions(status='approved')]
+    key = (
+        # KW changes the Demand tooltips (KW_resident) even when no station count changes
+        _data_version(dframe1['PLZ'], dframe1['Number'], dframe1['KW'] if 'KW' in dframe1.columns else None,
+                      dframe2_map['PLZ'], dframe2_map['Einwohner'],
+                      *(dframe2_map[c] for c in COVERAGE_FIELDS if c in dframe2_map.columns),
+                      pd.Series(shapely.to_wkb(dframe2_map.geometry.values))),
+        zoom_start,
+        tuple(center),
+        repr(approved),
+        None if sites is None else _data_version(*(sites[c] for c in sites.columns)),
+    )
+    if key in _MAP_HTML_CACHE:
+        _MAP_HTML_CACHE[key] = _MAP_HTML_CACHE.pop(key)  # most recently used last
+        return _MAP_HTML_CACHE[key]
+
+    m, _ = build_combined_heatmap(dframe1, dframe2_map, zoom_start=zoom_start, plz_index=plz_index, sites=sites,
+                                  center=center)
+    while len(_MAP_HTML_CACHE) >= MAP_HTML_CACHE_SIZE:
+        del _MAP_HTML_CACHE[next(iter(_MAP_HTML_CACHE))]
+    _MAP_HTML_CACHE[key] = folium.Figure().add_child(m).render()
+    return _MAP_HTML_CACHE[key]
+
+
+def show_debug_panel(session_id=None):
+    """Debug panel: stage timings of this session's last run, aggregated stage metrics, Prometheus export"""
+    with st.expander("Debug: pipeline timings", expanded=False):
+        runs = [t for t in ins.TRACES if session_id is None or t.attrs.get('session') == session_id]
+        if runs:
+            last = runs[-1]
+            st.caption(f"Last run of this session: {last.started_at}, {last.duration:.3f} s")
+            st.dataframe(pd.DataFrame([{
+                'stage': '\u2003' * depth + sp.name,
+                'seconds': round(sp.duration, 4),
+                'rows': sp.rows,
+                'memory_delta_mb': round(sp.memory_delta / 1e6, 2),
+                'cache': sp.attrs.get('cache', ''),
+            } for depth, sp in last.flatten()]), hide_index=True)
+
+        st.write("**All stages in this process**")
+        st.dataframe(pd.DataFrame(ins.REGISTRY.summary()), hide_index=True)
+
+        metrics_text = ins.prometheus_text()
+        st.download_button("Download Prometheus metrics", metrics_text, file_name="metrics.prom", mime="text/plain")
+
+
+# -----------------------------------------------------------------------------
+# Hexagon grid (core.hexgrid): station density and residents on equal-area cells instead of PLZ polygons
+HEX_VALUES = {
+    'Stations': 'Charging stations per cell',
+    'Einwohner': 'Residents per cell (interpolated from PLZ)',
+    'Stations_10k': 'Stations per 10k residents',
+}
+
+
+@ht.timer
+def build_hex_heatmap(cells, value_col='Stations', zoom_start=10, center=MAP_CENTER):
+    """Folium map of one hexagon grid level with legend; cells without a value are left out"""
+    if value_col not in HEX_VALUES:
+        raise ValueError(f"Unknown hexagon value {value_col!r}, expected one of {tuple(HEX_VALUES)}")
+    m = folium.Map(location=list(center), zoom_start=zoom_start)
+
+    shown = cells[cells[value_col].fillna(0) > 0]
+    # like the Demand layer, the scale is capped at the 95th percentile so a few dense cells do not wash out the rest
+    vmax = float(shown[value_col].quantile(0.95)) if len(shown) else 1.0
+    color_map = LinearColormap(colors=['yellow', 'red'], vmin=0, vmax=max(vmax, 1e-9))
+    color_map.caption = f"{HEX_VALUES[value_col]} ({int(cells['size_m'].iloc[0])} m cells)" if len(cells) else HEX_VALUES[value_col]
+
+    fields = ['Stations', 'Einwohner', 'Stations_10k']
+    add_choropleth_layer(m, shown, value_col, color_map, fields, f"Hexagons: {value_col}",
+                         aliases=['Stations:', 'Residents:', 'Stations per 10k residents:'])
+    color_map.add_to(m)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+# -----------------------------------------------------------------------------
+# Vector tiles: the PLZ polygons come from the tile server (core.tiles) instead of GeoJSON inside the page
+TILE_PLZ_STYLE = {'fill': True, 'color': 'black', 'weight': 1, 'fillOpacity': 0.7}
+TILE_BEZIRK_STYLE = {'fill': False, 'color': '#333333', 'weight': 2}
+
+
+class VectorTilePopup(MacroElement):
+    """Popup with the tooltip fields of a clicked PLZ polygon of a vector tile layer"""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var fields = {{ this.fields|tojson }};
+            var aliases = {{ this.aliases|tojson }};
+            {{ this.target.get_name() }}.on('click', function(e) {
+                var properties = e.layer.properties || {};
+                if (properties.PLZ === undefined) { return; }
+                var rows = fields.map(function(field, i) {
+                    return '<tr><th style="text-align:left;padding-right:6px">' + aliases[i] + '</th><td>'
+                        + (properties[field] === undefined ? '' : properties[field]) + '</td></tr>';
+                });
+                L.popup().setLatLng(e.latlng).setContent('<table>' + rows.join('') + '</table>')
+                    .openOn({{ this._parent.get_name() }});
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, target, fields, aliases):
+        super().__init__()
+        self._name = 'VectorTilePopup'
+        self.target = target
+        self.fields = list(fields)
+        self.aliases = list(aliases)
+
+
+@ht.timer
+def build_tile_heatmap(dframe1, dframe2, tile_url, zoom_start=10, plz_index=None, max_native_zoom=14, initial=LAYERS[0],
+                       sites=None, center=MAP_CENTER):
+    """Folium map of all layers drawn from vector tiles, with the client-side switch; returns the map"""
+    from folium.plugins import VectorGridProtobuf
+    if plz_index is None:
+        plz_index = gd.build_plz_index(dframe2)
+
+    m = folium.Map(location=list(center), zoom_start=zoom_start)
+    # legends and tooltip fields only: the polygons and their fill colors are in the tiles
+    _, fields, aliases, legends = combined_features(dframe1, dframe2)
+
+    plz_style = json.dumps(TILE_PLZ_STYLE)
+    options = ("{"
+               f"vectorTileLayerStyles: {{plz: function(properties) {{ return Object.assign("
+               f"{{fillColor: properties[{json.dumps('fill_' + initial)}]}}, {plz_style}); }}, "
+               f"bezirke: {json.dumps(TILE_BEZIRK_STYLE)}}}, "
+               f"interactive: true, maxNativeZoom: {int(max_native_zoom)}"
+               "}")
+    grid = VectorGridProtobuf(tile_url, name="PLZ", options=options).add_to(m)
+    LayerSwitchControl(grid, list(legends), legends, initial, vector_tiles=True).add_to(m)
+    VectorTilePopup(grid, fields, aliases).add_to(m)
+
+    # Add community suggestions to the map (only approved ones)
+    add_approved_suggestions(m, plz_index)
+    add_recommended_sites(m, sites)
+
+    folium.LayerControl().add_to(m)
+    return m
+
+
+# -----------------------------------------------------------------------------
+@ht.timer
+def make_streamlit_electric_Charging_resid(dfr1, dfr2, df_geo_display=None, zoom_start=10, plz_index=None, layer_switching='server',
+                                           tile_url=None, tiles_maxzoom=14, hex_pyramid=None, coverage=None,
+                                           coverage_bezirk=None, recommender=None, center=MAP_CENTER,
+                                           plz_window=(10000, 14200), region_name='Berlin', on_reload=None):
     """Makes Streamlit App with Heatmap of Electric Charging Stations and Residents"""
 
-    dframe1 = dfr1.copy()
-    dframe2 = dfr2.copy()
+    # Shared, read-only frames of the data context: derived frames are built, the inputs stay untouched
+    dframe1 = dfr1
+    dframe2 = dfr2
+
+    # Centroid/bbox lookup per PLZ for marker placement (built here if the caller has none cached)
+    if plz_index is None:
+        plz_index = gd.build_plz_index(dframe2)
+
+    # Polygons drawn on the map (simplified for zoom_start if display geodata is given)
+    dframe2_map = with_display_geometry(dframe2, df_geo_display)
+
+    # Nearest-station metrics per PLZ add the Coverage layer
+    dframe2 = with_coverage(dframe2, coverage)
+    dframe2_map = with_coverage(dframe2_map, coverage)
+    layers = available_layers(dframe2_map)
 
 
     # Streamlit app
@@ -216,164 +920,73 @@ def make_streamlit_electric_Charging_resid(dfr1, dfr2):
         # Create a radio button for layer selection
         # layer_selection = st.radio("Select Layer", ("Number of Residents per PLZ (Postal code)", "Number of Charging Stations per PLZ (Postal code)"))
 
-        layer_selection = st.radio("Select Layer", ("Residents", "Charging_Stations", "Demand"))
-
-        # Create a Folium map
-        m = folium.Map(location=[52.52, 13.40], zoom_start=10)
-
-        if layer_selection == "Residents":
-
-            # Create a color map for Residents
-            color_map = LinearColormap(colors=['yellow', 'red'], vmin=dframe2['Einwohner'].min(), vmax=dframe2['Einwohner'].max())
+        sites = None
+        if recommender is not None:
+            # Next charging sites by newly covered residents (lazy greedy over the candidate coverage sets)
+            with st.expander("Recommend new charging sites"):
+                show_sites = st.checkbox(f"Show recommended sites on the map (residents within {recommender.radius_m} m)",
+                                         key="recommend_show")
+                col1, col2 = st.columns(2)
+                with col1:
+                    k = st.slider("Number of new sites", min_value=1, max_value=500, value=50, key="recommend_k")
+                with col2:
+                    sources = st.multiselect("Candidate sites", list(rc.SOURCES), default=['plz', 'suggestions'],
+                                             format_func=rc.SOURCES.get, key="recommend_sources")
+                if show_sites:
+                    approved_plz = [s.get('plz') for s in load_suggestions(status='approved')]
+                    sites = recommender.recommend(k, tuple(sources), tuple(approved_plz))
+                    if len(sites):
+                        st.caption(f"{int(sites['new_residents'].sum())} more residents within reach, "
+                                   f"{sites['covered_share'].iloc[-1]:.1%} of all residents covered after {len(sites)} sites.")
+                        st.dataframe(sites, hide_index=True, height=200)
+                    else:
+                        st.info("No candidate site brings additional residents within reach.")
+
+        if tile_url:
+            # Polygons from the vector tile server, layers switched in the browser
+            st.caption(f"Switch between {', '.join(layers)} with the control on the map (click a PLZ for its values).")
+            m = build_tile_heatmap(dframe1, dframe2, tile_url, zoom_start=zoom_start, plz_index=plz_index, max_native_zoom=tiles_maxzoom,
+                                   sites=sites, center=center)
+            components.html(folium.Figure().add_child(m).render(), height=510, width=700)
+        elif layer_switching == 'client':
+            # All layers in one map, switched in the browser (no rerun per switch); HTML rendered once per data version
+            st.caption(f"Switch between {', '.join(layers)} with the control on the map.")
+            components.html(combined_heatmap_html(dframe1, dframe2_map, zoom_start=zoom_start, plz_index=plz_index, sites=sites,
+                                                  center=center),
+                            height=510, width=700)
+        else:
+            layer_selection = st.radio("Select Layer", layers)
 
-            # Add polygons to the map for Residents
-            for idx, row in dframe2.iterrows():
-                folium.GeoJson(
-                    row['geometry'],
-                    style_function=lambda x, color=color_map(row['Einwohner']): {
-                        'fillColor': color,
-                        'color': 'black',
-                        'weight': 1,
-                        'fillOpacity': 0.7
-                    },
-                    tooltip=f"PLZ: {row['PLZ']}, Einwohner: {row['Einwohner']}"
-                ).add_to(m)
+            # Folium map of the selected layer (built without Streamlit, shared with the batch export)
+            m, _ = build_heatmap(layer_selection, dframe1, dframe2_map, zoom_start=zoom_start, plz_index=plz_index, sites=sites,
+                                 center=center)
 
-            # Display the dataframe for Residents
-            # st.subheader('Residents Data')
-            # st.dataframe(gdf_residents2)
+            # Display the map
+            folium_static(m)
 
-        else:
-            # Build full PLZ GeoDataFrame (use residents geometries) and merge counts so zeros are explicit
-            try:
-                full_gdf = dframe2[['PLZ', 'geometry']].merge(dframe1[['PLZ', 'Number']], on='PLZ', how='left')
-                full_gdf['Number'] = full_gdf['Number'].fillna(0).astype(int)
-            except Exception:
-                full_gdf = dframe1.copy()
-                if 'Number' in full_gdf.columns:
-                    full_gdf['Number'] = full_gdf['Number'].fillna(0).astype(int)
-                else:
-                    full_gdf['Number'] = 0
-
-            # compute colormap vmin/vmax from full_gdf to include zeros
-            vmin = int(full_gdf['Number'].min()) if 'Number' in full_gdf.columns else 0
-            vmax = int(full_gdf['Number'].max()) if 'Number' in full_gdf.columns else 1
-            color_map = LinearColormap(colors=['yellow', 'red'], vmin=vmin, vmax=vmax)
-
-            for idx, row in full_gdf.iterrows():
-                num = int(row['Number']) if 'Number' in row and pd.notna(row['Number']) else 0
-                folium.GeoJson(
-                    row['geometry'],
-                    style_function=lambda x, color=color_map(num): {
-                        'fillColor': color,
-                        'color': 'black',
-                        'weight': 1,
-                        'fillOpacity': 0.7
-                    },
-                    tooltip=f"PLZ: {row.get('PLZ', '')}, Number: {num}"
-                ).add_to(m)
-
-            # Display the dataframe for Numbers
-            # st.subheader('Numbers Data')
-            # st.dataframe(gdf_lstat3)
-
-        if layer_selection == "Demand":
-            # Build full PLZ GeoDataFrame merging residents + station counts
-            try:
-                # detect residents column name in the residents GeoDataFrame
-                res_col = None
-                for c in dframe2.columns:
-                    if str(c).lower().startswith('einw') or 'einw' in str(c).lower():
-                        res_col = c
-                        break
-
-                if res_col is not None:
-                    temp_res = dframe2[['PLZ', 'geometry', res_col]].rename(columns={res_col: 'Einwohner'})
-                else:
-                    temp_res = dframe2[['PLZ', 'geometry']].copy()
-                    temp_res['Einwohner'] = 0
-
-                full_gdf = temp_res.merge(dframe1[['PLZ', 'Number']], on='PLZ', how='left')
-                full_gdf['Number'] = full_gdf['Number'].fillna(0).astype(int)
-                full_gdf['Einwohner'] = full_gdf['Einwohner'].fillna(0).astype(int)
-            except Exception:
-                # Fallback: try to build from available frames
-                full_gdf = dframe2.copy()
-                if 'PLZ' in dframe1.columns and 'Number' in dframe1.columns:
-                    counts = dframe1[['PLZ', 'Number']].copy()
-                    full_gdf = full_gdf.merge(counts, on='PLZ', how='left')
-                if 'Number' not in full_gdf.columns:
-                    full_gdf['Number'] = 0
-                if 'Einwohner' not in full_gdf.columns:
-                    full_gdf['Einwohner'] = 0
-
-            # Demand: residents per station; if zero stations, use residents (marks high demand)
-            def compute_demand(row):
-                if row['Number'] > 0:
-                    return row['Einwohner'] / row['Number']
-                else:
-                    # treat zero-station PLZ as high-demand equal to residents
-                    return float(row['Einwohner'])
-
-            full_gdf['demand'] = full_gdf.apply(compute_demand, axis=1)
-
-            # Replace infinite or NaN
-            full_gdf['demand'] = full_gdf['demand'].replace([np.inf, -np.inf], np.nan).fillna(0)
-
-            # Color scaling: vmin 0, vmax = 95th percentile to avoid outlier saturation
-            vmax = int(np.nanpercentile(full_gdf['demand'].replace(0, np.nan).dropna(), 95)) if full_gdf['demand'].notna().any() else int(full_gdf['demand'].max() or 1)
-            if vmax <= 0:
-                vmax = int(full_gdf['demand'].max() or 1)
-            color_map = LinearColormap(colors=['yellow', 'red'], vmin=0, vmax=vmax)
-
-            # Draw PLZ polygons with color corresponding to demand
-            for idx, row in full_gdf.iterrows():
-                val = float(row['demand']) if 'demand' in row and pd.notna(row['demand']) else 0.0
-                # Cap display value for color lookup to vmax so legend remains readable
-                display_val = min(val, vmax)
-                folium.GeoJson(
-                    row['geometry'],
-                    style_function=lambda x, color=color_map(display_val): {
-                        'fillColor': color,
-                        'color': 'black',
-                        'weight': 1,
-                        'fillOpacity': 0.7
-                    },
-                    tooltip=f"PLZ: {row.get('PLZ', '')}, Demand: {val:.1f} (res/station)"
-                ).add_to(m)
-
-            # Add color map legend
-            color_map.caption = 'Residents per charging station (capped at 95th percentile)'
-            color_map.add_to(m)
-
-        # Add color map to the map
-        color_map.add_to(m)
-
-        # Add community suggestions to the map (only approved ones)
-        suggestions = load_suggestions()
-        approved_suggestions = [s for s in suggestions if s.get('status') == 'approved']
-        if approved_suggestions:
-            suggestion_group = folium.FeatureGroup(name="Approved Community Suggestions", show=False)
-            for suggestion in approved_suggestions:
-                plz = suggestion.get('plz', '')
-                lat, lon = get_plz_centroid(plz, dframe2)
-                if lat is not None and lon is not None:
-                    folium.Marker(
-                        location=[lat, lon],
-                        popup=f"<b>Approved Suggestion</b><br>PLZ: {plz}<br>Address: {suggestion.get('address', 'N/A')}<br>Reason: {suggestion.get('reason', 'N/A')}",
-                        icon=folium.Icon(color='green', icon='check-circle', prefix='fa')
-                    ).add_to(suggestion_group)
-            suggestion_group.add_to(m)
-
-        # Add layer control
-        folium.LayerControl().add_to(m)
-
-        # Display the map
-        folium_static(m)
+        if hex_pyramid:
+            # Density on equal-area hexagons; the preselected cell size fits the map zoom
+            with st.expander("Density on a hexagon grid (independent of PLZ boundaries)"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    size = st.select_slider("Cell size (m)", options=sorted(hex_pyramid), key="hex_size",
+                                            value=hx.resolution_for_zoom(zoom_start, list(hex_pyramid)))
+                with col2:
+                    value_col = st.selectbox("Value", list(HEX_VALUES), format_func=HEX_VALUES.get, key="hex_value")
+                folium_static(build_hex_heatmap(hex_pyramid[size], value_col, zoom_start=zoom_start, center=center))
+
+        if coverage_bezirk is not None and len(coverage_bezirk):
+            # Residents within walking distance of a charger per district (raster coverage engine)
+            with st.expander("Residents within reach of a charging station per Bezirk"):
+                shares = [c for c in coverage_bezirk.columns if c.startswith('share_')]
+                st.dataframe(coverage_bezirk.sort_values('Bezirk'), hide_index=True,
+                             column_config={c: st.column_config.ProgressColumn(f"within {c[6:]}", format="%.3f",
+                                                                               min_value=0.0, max_value=1.0)
+                                            for c in shares})
 
         with tab2:
             st.header("Suggest New Charging Location")
-            st.write("Help improve Berlin's charging infrastructure by suggesting new locations where charging stations are needed.")
+            st.write(f"Help improve {region_name}'s charging infrastructure by suggesting new locations where charging stations are needed.")
 
             with st.form("suggestion_form"):
                 col1, col2 = st.columns(2)
@@ -396,7 +1009,7 @@ def make_streamlit_electric_Charging_resid(dfr1, dfr2):
                     else:
                         try:
                             plz_int = int(plz.strip())
-                            if 10000 <= plz_int <= 14200:
+                            if plz_window[0] <= plz_int <= plz_window[1]:
                                 suggestion = {
                                     "plz": plz.strip(),
                                     "address": address.strip(),
@@ -406,7 +1019,7 @@ def make_streamlit_electric_Charging_resid(dfr1, dfr2):
                                 st.success("✅ Thank you! Your suggestion has been submitted and will be reviewed.")
                                 st.balloons()
                             else:
-                                st.error("Please enter a valid Berlin postal code (10000-14200)")
+                                st.error(f"Please enter a valid {region_name} postal code ({plz_window[0]}-{plz_window[1]})")
                         except ValueError:
                             st.error("Please enter a valid 5-digit postal code")
 
@@ -425,64 +1038,52 @@ def make_streamlit_electric_Charging_resid(dfr1, dfr2):
                 st.info("Enter the correct admin password to unlock review features.")
             # ------------------------------------------
 
-            suggestions = load_suggestions()
+            # Reload of the shared data context (with lstat_incremental the registry delta is applied on the reload)
+            if admin_mode and on_reload is not None and st.button("🔄 Reload datasets", key="reload_datasets"):
+                on_reload()
+                st.rerun()
+
+            store = sg.get_suggestion_store()
+            plz_counts = store.counts_by_plz()
+            total = sum(n for _, n in plz_counts)
 
-            if not suggestions:
+            if not total:
                 st.info("No suggestions yet. Be the first to suggest a new charging location!")
             else:
-                st.write(f"**Total suggestions:** {len(suggestions)}")
-
-                # Group suggestions by PLZ
-                suggestions_by_plz = {}
-                for s in suggestions:
-                    plz = s.get('plz', 'Unknown')
-                    if plz not in suggestions_by_plz:
-                        suggestions_by_plz[plz] = []
-                    suggestions_by_plz[plz].append(s)
-
-                # Display suggestions grouped by PLZ
-                for plz in sorted(suggestions_by_plz.keys()):
-                    with st.expander(f"📍 PLZ {plz} ({len(suggestions_by_plz[plz])} suggestions)"):
-                        for suggestion in suggestions_by_plz[plz]:
-                            status = suggestion.get('status', 'pending')
-                            status_emoji = {"pending": "⏳", "approved": "✅", "rejected": "❌"}.get(status, "❓")
-
-                            st.write(f"{status_emoji} **Location:** {suggestion.get('address', 'N/A')}")
-                            st.write(f"**Reason:** {suggestion.get('reason', 'N/A')}")
-                            st.write(f"**Status:** {status.title()}")
-
-                            timestamp = suggestion.get('timestamp', '')
-                            if timestamp:
-                                try:
-                                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                                    st.caption(f"Suggested on {dt.strftime('%Y-%m-%d %H:%M')}")
-                                except:
-                                    st.caption(f"Suggested: {timestamp}")
-
-                            # Show review info if available
-                            if suggestion.get('reviewed_by'):
-                                st.caption(f"Reviewed by {suggestion['reviewed_by']} on {suggestion.get('review_date', '')[:10]}")
-                                if suggestion.get('review_notes'):
-                                    st.caption(f"Notes: {suggestion['review_notes']}")
-
-                            # Admin review buttons (Only visible if admin_mode is True)
-                            if admin_mode and status == 'pending':
-                                col1, col2, col3 = st.columns(3)
-                                with col1:
-                                    if st.button(f"✅ Approve #{suggestion['id']}", key=f"approve_{suggestion['id']}"):
-                                        review_suggestion(suggestion['id'], 'approved', 'Admin')
-                                        st.success("Suggestion approved!")
-                                        st.rerun()
-                                with col2:
-                                    if st.button(f"❌ Reject #{suggestion['id']}", key=f"reject_{suggestion['id']}"):
-                                        review_suggestion(suggestion['id'], 'rejected', 'Admin')
-                                        st.success("Suggestion rejected!")
-                                        st.rerun()
-                                with col3:
-                                    notes = st.text_input(f"Notes for #{suggestion['id']}", key=f"notes_{suggestion['id']}")
-                                    if st.button(f"💬 Add Notes #{suggestion['id']}", key=f"add_notes_{suggestion['id']}"):
-                                        review_suggestion(suggestion['id'], status, 'Admin', notes)
-                                        st.success("Notes added!")
-                                        st.rerun()
-
-                            st.divider()
+                st.write(f"**Total suggestions:** {total}")
+
+                # Filters; PLZ choices carry their suggestion counts (counted by the store)
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    status_choice = st.selectbox("Status", ["All", "pending", "approved", "rejected"], key="suggestions_status")
+                with col2:
+                    plz_choice = st.selectbox("PLZ", ["All"] + [f"{p} ({n})" for p, n in plz_counts], key="suggestions_plz")
+                with col3:
+                    page_size = st.selectbox("Per page", [10, 20, 50], index=1, key="suggestions_page_size")
+
+                status_filter = None if status_choice == "All" else status_choice
+                plz_filter = None if plz_choice == "All" else plz_choice.split(' ')[0]
+
+                # Cursor of every visited page (first page: None); back to page 1 when the filters change
+                filters = (status_filter, plz_filter, page_size)
+                if st.session_state.get('suggestions_filters') != filters:
+                    st.session_state['suggestions_filters'] = filters
+                    st.session_state['suggestions_cursors'] = [None]
+                cursors = st.session_state['suggestions_cursors']
+
+                # Only the visible page is loaded and drawn
+                page, next_cursor = store.query(status=status_filter, plz=plz_filter, limit=page_size, cursor=cursors[-1])
+                for suggestion in page:
+                    _show_suggestion(suggestion, admin_mode)
+
+                nav1, nav2, nav3 = st.columns(3)
+                with nav1:
+                    if len(cursors) > 1 and st.button("◀ Previous", key="suggestions_prev"):
+                        cursors.pop()
+                        st.rerun()
+                with nav2:
+                    st.caption(f"Page {len(cursors)}")
+                with nav3:
+                    if next_cursor is not None and st.button("Next ▶", key="suggestions_next"):
+                        cursors.append(next_cursor)
+                        st.rerun()
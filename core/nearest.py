@@ -0,0 +1,153 @@
+import sys
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import geopandas                     as gpd
+from sklearn.neighbors               import KDTree
+import core.HelperTools              as ht
+import core.artifacts                as ac
+import core.geodata                  as gd
+
+
+EARTH_RADIUS_M = 6371008.8
+
+# Coverage metric columns per PLZ (see coverage_by_plz)
+COVERAGE_COLUMNS = ['PLZ', 'dist_mean_m', 'dist_max_m', 'share_within', 'residents_beyond', 'n_samples']
+
+# Artifact version of the coverage stage (bump when coverage_by_plz changes its output) and the config it reads
+COVERAGE_VERSION = 2
+COVERAGE_CONFIG = ['coverage_sample_m', 'coverage_radius_m']
+
+
+def unit_vectors(lat, lon):
+    """Points on the unit sphere; their chord distance orders neighbours exactly like the haversine distance"""
+    lat = np.radians(np.asarray(lat, dtype='float64'))
+    lon = np.radians(np.asarray(lon, dtype='float64'))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_meters(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def meters_to_chord(meters):
+    return 2 * np.sin(np.asarray(meters, dtype='float64') / (2 * EARTH_RADIUS_M))
+
+
+class StationIndex:
+    """Nearest-station queries over station coordinates (KD-tree on unit vectors, distances in meters along the sphere)"""
+
+    def __init__(self, lat, lon, leaf_size=40):
+        lat = np.asarray(lat, dtype='float64')
+        lon = np.asarray(lon, dtype='float64')
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        # positions refer to the rows of the frame the coordinates came from
+        self.positions = np.flatnonzero(valid)
+        # no tree without stations (a region or filter may leave none): every point is then infinitely far away
+        self.tree = KDTree(unit_vectors(lat[valid], lon[valid]), leaf_size=leaf_size) if valid.any() else None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def nearest(self, lat, lon, k=1):
+        """Distances (m) and station row positions of the k nearest stations of every point, shape (n, k)"""
+        if self.tree is None:
+            n = len(np.atleast_1d(lat))
+            return np.full((n, k), np.inf), np.full((n, k), -1, dtype='int64')
+        k = min(k, len(self))
+        chord, idx = self.tree.query(unit_vectors(lat, lon), k=k)
+        return chord_to_meters(chord), self.positions[idx]
+
+    def count_within(self, lat, lon, radius_m):
+        """Number of stations within radius_m of every point"""
+        if self.tree is None:
+            return np.zeros(len(np.atleast_1d(lat)), dtype='int64')
+        return self.tree.query_radius(unit_vectors(lat, lon), meters_to_chord(radius_m), count_only=True)
+
+    def within(self, lat, lon, radius_m):
+        """Station row positions within radius_m of every point (one array per point)"""
+        if self.tree is None:
+            return [np.array([], dtype='int64') for _ in range(len(np.atleast_1d(lat)))]
+        idx = self.tree.query_radius(unit_vectors(lat, lon), meters_to_chord(radius_m))
+        return [self.positions[i] for i in idx]
+
+
+def station_index(gdf_lstat):
+    """Index over the cleaned station coordinates of preprop_lstat"""
+    return StationIndex(gdf_lstat['Breitengrad'].to_numpy(), gdf_lstat['Längengrad'].to_numpy())
+
+
+def residents_per_plz(gdf_resid):
+    """One polygon and the summed residents per PLZ (T14 lists some PLZ once per district)"""
+    einw = gdf_resid.groupby('PLZ', sort=True)['Einwohner'].sum()
+    first = gdf_resid.drop_duplicates('PLZ').set_index('PLZ').loc[einw.index]
+    return first.geometry.values, einw.index.to_numpy(), einw.to_numpy(dtype='float64')
+
+
+def sample_points(polys, spacing_m, crs=None):
+    """Regular grid points (spacing_m apart) inside each polygon; polygons without one get their representative point"""
+    crs = crs or gd.utm_crs(shapely.total_bounds(polys))
+    projected = gpd.GeoSeries(polys, crs='EPSG:4326').to_crs(crs).values
+    minx, miny, maxx, maxy = shapely.total_bounds(projected)
+    xs = np.arange(minx + spacing_m / 2, maxx, spacing_m)
+    ys = np.arange(miny + spacing_m / 2, maxy, spacing_m)
+    gx, gy = (a.ravel() for a in np.meshgrid(xs, ys))
+    point_idx, poly_idx = shapely.STRtree(projected).query(shapely.points(gx, gy), predicate='within')
+
+    # each grid point counts once, for the first polygon containing it
+    point_idx, first = np.unique(point_idx, return_index=True)
+    poly_idx = poly_idx[first]
+    missing = np.setdiff1d(np.arange(len(projected)), poly_idx)
+    rep = shapely.get_coordinates(shapely.point_on_surface(projected[missing]))
+    x = np.concatenate([gx[point_idx], rep[:, 0]])
+    y = np.concatenate([gy[point_idx], rep[:, 1]])
+    owner = np.concatenate([poly_idx, missing])
+
+    lon, lat = gpd.GeoSeries(shapely.points(x, y), crs=crs).to_crs(epsg=4326).get_coordinates().to_numpy().T
+    return lat, lon, owner
+
+
+@ht.timer
+def coverage_by_plz(gdf_lstat, gdf_resid, spacing_m=100, radius_m=500, crs=None):
+    """Per PLZ: mean/max distance (m) from resident sample points to the nearest station and the residents beyond radius_m"""
+    polys, plz, residents = residents_per_plz(gdf_resid)
+    lat, lon, owner = sample_points(polys, spacing_m, crs)
+    dist, _ = station_index(gdf_lstat).nearest(lat, lon, k=1)
+    dist = dist[:, 0]
+    # without any station the distances are unknown (NaN) and nobody is within the radius
+    finite = np.isfinite(dist)
+
+    # every sample point stands for an equal share of its PLZ residents
+    n = np.bincount(owner, minlength=len(plz))
+    within = np.bincount(owner, weights=(dist <= radius_m).astype(float), minlength=len(plz)) / np.maximum(n, 1)
+    dist_max = pd.Series(np.where(finite, dist, np.nan)).groupby(owner).max().reindex(range(len(plz))).to_numpy()
+    dist_mean = np.bincount(owner, weights=np.where(finite, dist, 0), minlength=len(plz)) / np.maximum(n, 1)
+    return pd.DataFrame({
+        'PLZ': plz.astype('int32'),
+        'dist_mean_m': np.where(finite.all(), dist_mean, np.nan).round(0),
+        'dist_max_m': dist_max.round(0),
+        'share_within': within.round(3),
+        'residents_beyond': np.rint(residents * (1 - within)).astype('int32'),
+        'n_samples': n.astype('int32'),
+    })[COVERAGE_COLUMNS]
+
+
+def load_coverage(data, pdict):
+    """Coverage metrics of the loaded data as a pipeline artifact (recomputed when the registry or residents change)"""
+    depends = [data['artifact_keys']['gdf_lstat3'], data['artifact_keys']['gdf_residents2'], data['crs']]
+    return ac.cached_stage(f"coverage_{data['slug']}", [], pdict, lambda: coverage_by_plz(
+        data['gdf_lstat3'], data['gdf_residents2'], spacing_m=pdict.get('coverage_sample_m', 100),
+        radius_m=pdict.get('coverage_radius_m', 500), crs=data['crs']),
+        ac.stage_version(COVERAGE_VERSION, __file__), COVERAGE_CONFIG, depends)
+
+
+if __name__ == "__main__":
+    # python -m core.nearest: coverage metrics of the datasets, PLZ with the most residents beyond the radius first
+    import main
+    from config import pdict
+    coverage = load_coverage(main.load_data(), pdict)
+    with pd.option_context('display.width', 200, 'display.max_rows', 30):
+        print(coverage.sort_values('residents_beyond', ascending=False).head(20).to_string(index=False))
+    sys.stdout.write(f"{int(coverage['residents_beyond'].sum())} residents live more than "
+                     f"{pdict.get('coverage_radius_m', 500)} m from the nearest charging station\n")
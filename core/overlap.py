@@ -0,0 +1,133 @@
+import os
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import geopandas                     as gpd
+import scipy.sparse                  as sp
+import core.HelperTools              as ht
+import core.geodata                  as gd
+
+
+# Version of the overlap computation, part of the cache file name (bump when build_overlap_matrix changes)
+OVERLAP_VERSION = 1
+
+# Process-wide matrices: cache file path -> OverlapMatrix
+_OVERLAP_STORE = {}
+
+
+class OverlapMatrix:
+    """Sparse PLZ x Bezirk matrix of intersection areas (m²) and the redistribution weights derived from it"""
+
+    def __init__(self, areas, plz, bezirke):
+        self.areas = sp.csr_matrix(areas, dtype='float64')
+        self.plz = np.asarray(plz)
+        self.bezirke = np.asarray(bezirke, dtype=object)
+        plz_area = np.asarray(self.areas.sum(axis=1)).ravel()
+        bez_area = np.asarray(self.areas.sum(axis=0)).ravel()
+        # district -> PLZ: a PLZ gets the share of the district area it covers (columns sum to 1)
+        self.to_plz = sp.csr_matrix(self.areas.multiply(1 / np.where(bez_area > 0, bez_area, 1)[None, :]))
+        # PLZ -> district: a district gets the share of each PLZ area inside it (rows sum to 1)
+        self.to_bezirk = sp.csr_matrix(self.areas.multiply(1 / np.where(plz_area > 0, plz_area, 1)[:, None]).T)
+
+    def __repr__(self):
+        return f"OverlapMatrix({len(self.plz)} PLZ x {len(self.bezirke)} Bezirke, {self.areas.nnz} overlaps)"
+
+    def district_to_plz(self, values):
+        """District totals (aligned with self.bezirke) spread over the PLZ by overlapping area"""
+        return self.to_plz @ np.asarray(values, dtype='float64')
+
+    def plz_to_district(self, values):
+        """PLZ totals (aligned with self.plz) summed into districts by overlapping area"""
+        return self.to_bezirk @ np.asarray(values, dtype='float64')
+
+    def align_districts(self, names, values):
+        """District values given by name as a vector aligned with self.bezirke (case and blanks ignored, missing -> 0)"""
+        lookup = pd.Series(np.asarray(values, dtype='float64'), index=_normalize(pd.Series(names)).to_numpy())
+        lookup = lookup[~lookup.index.duplicated(keep='first')]
+        return lookup.reindex(_normalize(pd.Series(self.bezirke)).to_numpy()).fillna(0).to_numpy()
+
+
+def _normalize(names):
+    return names.astype(str).str.strip().str.lower()
+
+
+def bezirk_name_column(gdf_bez):
+    """Column with the district names of a Bezirke layer (shapefile: Gemeinde_n)"""
+    for c in ('Gemeinde_n', 'Gemeinde_s', 'Bezirk'):
+        if c in gdf_bez.columns:
+            return c
+    return next(c for c in gdf_bez.columns if any(k in str(c).lower() for k in ('gemeinde', 'bezirk', 'name')))
+
+
+@ht.timer
+def build_overlap_matrix(gdf_plz, gdf_bez, plz_col='PLZ', bez_col=None, crs=None):
+    """Intersection areas of every PLZ/Bezirk pair that overlaps (STRtree candidate pairs, vectorized intersection)"""
+    bez_col = bez_col or bezirk_name_column(gdf_bez)
+    # areas in m² of the UTM zone of the PLZ layer (or its own projected CRS)
+    crs = crs or gd.metric_crs(gdf_plz)
+    plz_geoms = gdf_plz.to_crs(crs).geometry.values
+    bez_geoms = gdf_bez.to_crs(crs).geometry.values
+
+    plz_idx, bez_idx = shapely.STRtree(bez_geoms).query(plz_geoms, predicate='intersects')
+    areas = shapely.area(shapely.intersection(plz_geoms[plz_idx], bez_geoms[bez_idx]))
+    keep = areas > 0
+    matrix = sp.coo_matrix((areas[keep], (plz_idx[keep], bez_idx[keep])), shape=(len(plz_geoms), len(bez_geoms)))
+    return OverlapMatrix(matrix, gdf_plz[plz_col].to_numpy(), gdf_bez[bez_col].astype(str).to_numpy())
+
+
+def save_overlap_matrix(overlap, path):
+    """Writes the area matrix and its PLZ/district labels as one .npz file"""
+    areas = overlap.areas
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, data=areas.data, indices=areas.indices, indptr=areas.indptr, shape=np.array(areas.shape),
+             plz=overlap.plz, bezirke=overlap.bezirke.astype(str))
+    os.replace(tmp, path)
+
+
+def read_overlap_matrix(path):
+    with np.load(path, allow_pickle=False) as npz:
+        areas = sp.csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape']))
+        return OverlapMatrix(areas, npz['plz'], npz['bezirke'])
+
+
+def load_overlap_matrix(geodata_path, bez_path, pdict):
+    """PLZ x Bezirk overlap matrix, built once per version of both geometry files and kept in the cache folder"""
+    key = f"v{OVERLAP_VERSION}_{gd.file_fingerprint(geodata_path)}_{gd.file_fingerprint(bez_path)}"
+    # the path tag keeps the matrices of several regions apart; only stale files of the same pair are removed
+    prefix = f"overlap_plz_bezirk_{gd.source_tag(geodata_path, bez_path)}_"
+    path = os.path.join(gd.get_cache_dir(pdict), f"{prefix}{key}.npz")
+    if path in _OVERLAP_STORE:
+        return _OVERLAP_STORE[path]
+
+    overlap = None
+    if os.path.exists(path):
+        try:
+            overlap = read_overlap_matrix(path)
+        except Exception as e:
+            print(f"Overlap matrix unreadable ({e}); rebuilding")
+    if overlap is None:
+        overlap = build_overlap_matrix(gd.load_geodata_plz(geodata_path, pdict), gpd.read_file(bez_path))
+        try:
+            for old in [f for f in os.listdir(os.path.dirname(path)) if f.startswith(prefix)]:
+                os.remove(os.path.join(os.path.dirname(path), old))
+            save_overlap_matrix(overlap, path)
+        except OSError as e:
+            print(f"Overlap matrix not cached ({e})")
+    _OVERLAP_STORE[path] = overlap
+    return overlap
+
+
+if __name__ == "__main__":
+    # python -m core.overlap: builds (or loads) the matrix of the datasets and prints the PLZ split over several districts
+    from config import pdict
+    basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    datasets_dir = os.path.join(basedir, 'datasets')
+    overlap = load_overlap_matrix(os.path.join(datasets_dir, pdict.get('file_geodat_plz', 'geodata_berlin_plz.csv')),
+                                  os.path.join(datasets_dir, 'berlin_bezirke', 'bezirksgrenzen.shp'), pdict)
+    print(overlap)
+    shares = overlap.to_bezirk.T.tocsr()
+    for i in np.flatnonzero(np.diff(shares.indptr) > 1):
+        row = shares.getrow(i)
+        parts = sorted(zip(row.data, overlap.bezirke[row.indices]), reverse=True)
+        if parts[1][0] >= 0.01:
+            print(f"{overlap.plz[i]}: " + ", ".join(f"{name} {share:.0%}" for share, name in parts if share >= 0.01))
@@ -0,0 +1,242 @@
+import os
+import sys
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import geopandas                     as gpd
+from scipy.ndimage                   import distance_transform_edt
+import core.HelperTools              as ht
+import core.artifacts                as ac
+import core.geodata                  as gd
+import core.hexgrid                  as hx
+import core.nearest                  as nr
+import core.overlap                  as ov
+
+
+# Rasters are laid out in the metric CRS of a region (like the hexagon grid), cell size in meters
+DEFAULT_RESOLUTION = 25
+DEFAULT_RADII = (250, 500, 1000)
+
+# Artifact version of the raster coverage stages (bump when coverage_rasters changes its output) and their config
+RASTER_COVERAGE_VERSION = 2
+RASTER_COVERAGE_CONFIG = ['raster_resolution_m', 'raster_radii_m', 'coverage_radius_m']
+
+# Process-wide resident rasters: region slug -> ((input fingerprints, resolution, padding, CRS), ResidentRaster)
+_RASTER_STORE = {}
+
+
+class RasterGrid:
+    """Regular grid of square cells (resolution meters) over bounds in a metric CRS, row 0 at the southern edge"""
+
+    def __init__(self, bounds, resolution, pad=0.0):
+        minx, miny, maxx, maxy = bounds
+        self.resolution = float(resolution)
+        self.x0, self.y0 = minx - pad, miny - pad
+        self.width = int(np.ceil((maxx + pad - self.x0) / self.resolution))
+        self.height = int(np.ceil((maxy + pad - self.y0) / self.resolution))
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    def __repr__(self):
+        return f"RasterGrid({self.height} x {self.width} cells of {self.resolution:g} m)"
+
+    def xs(self):
+        """Cell center x of every column"""
+        return self.x0 + (np.arange(self.width) + 0.5) * self.resolution
+
+    def ys(self):
+        """Cell center y of every row"""
+        return self.y0 + (np.arange(self.height) + 0.5) * self.resolution
+
+    def cells(self, x, y):
+        """Row and column of the cells containing the points and whether they fall inside the grid"""
+        col = np.floor((np.asarray(x, dtype='float64') - self.x0) / self.resolution)
+        row = np.floor((np.asarray(y, dtype='float64') - self.y0) / self.resolution)
+        inside = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+        return np.where(inside, row, 0).astype('int64'), np.where(inside, col, 0).astype('int64'), inside
+
+
+def rasterize(polys, grid):
+    """Label raster: index of the first polygon containing each cell center, -1 outside all polygons (scanline fill)"""
+    labels = np.full(grid.shape, -1, dtype='int32')
+    xs, ys = grid.xs(), grid.ys()
+    for i, poly in enumerate(polys):
+        if poly is None or poly.is_empty:
+            continue
+        minx, miny, maxx, maxy = poly.bounds
+        c0, c1 = np.searchsorted(xs, minx), np.searchsorted(xs, maxx)
+        r0, r1 = np.searchsorted(ys, miny), np.searchsorted(ys, maxy)
+        if c0 >= c1 or r0 >= r1:
+            continue
+        # edges of all rings (exteriors and holes of every part)
+        coords, ring = shapely.get_coordinates(shapely.get_rings(shapely.get_parts(poly)), return_index=True)
+        same = ring[1:] == ring[:-1]
+        x1, y1, x2, y2 = coords[:-1, 0][same], coords[:-1, 1][same], coords[1:, 0][same], coords[1:, 1][same]
+        # one crossing per edge and row center in [min(y1, y2), max(y1, y2))
+        lo, hi = np.searchsorted(ys, np.minimum(y1, y2)), np.searchsorted(ys, np.maximum(y1, y2))
+        n = hi - lo
+        edge = np.repeat(np.arange(len(n)), n)
+        row = lo[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(n) - n, n)
+        x = x1[edge] + (ys[row] - y1[edge]) / (y2[edge] - y1[edge]) * (x2[edge] - x1[edge])
+        # a crossing flips every cell center to its right, centers with an odd count lie inside (even-odd rule)
+        flips = np.zeros((r1 - r0, c1 - c0 + 1), dtype='int32')
+        np.add.at(flips, (row - r0, np.searchsorted(xs[c0:c1], x, side='right')), 1)
+        inside = (np.cumsum(flips, axis=1)[:, :-1] & 1).astype(bool)
+        window = labels[r0:r1, c0:c1]
+        window[inside & (window < 0)] = i
+    return labels
+
+
+def burn_points(grid, x, y):
+    """Boolean raster with the cells hit by at least one point (points outside the grid are dropped)"""
+    mask = np.zeros(grid.shape, dtype=bool)
+    row, col, inside = grid.cells(x, y)
+    mask[row[inside], col[inside]] = True
+    return mask
+
+
+class ResidentRaster:
+    """Residents of every PLZ spread evenly over its raster cells, with PLZ and Bezirk labels per cell"""
+
+    def __init__(self, gdf_resid, gdf_bez=None, resolution=DEFAULT_RESOLUTION, pad=max(DEFAULT_RADII), crs=None):
+        # the UTM zone of the residents unless the region sets its CRS
+        self.crs = crs or gd.metric_crs(gdf_resid)
+        polys, self.plz, residents = nr.residents_per_plz(gdf_resid)
+        projected = gpd.GeoSeries(polys, crs='EPSG:4326').to_crs(self.crs).values
+        # padded by the largest radius, so stations just outside the city still cover residents inside it
+        self.grid = RasterGrid(shapely.total_bounds(projected), resolution, pad=pad)
+        self.plz_labels = rasterize(projected, self.grid)
+
+        # PLZ smaller than a cell get the cell of their representative point
+        n = np.bincount(self.plz_labels[self.plz_labels >= 0], minlength=len(self.plz))
+        for i in np.flatnonzero(n == 0):
+            rep = shapely.point_on_surface(projected[i])
+            row, col, inside = self.grid.cells([rep.x], [rep.y])
+            if inside[0] and self.plz_labels[row[0], col[0]] < 0:
+                self.plz_labels[row[0], col[0]] = i
+        self.cells_per_plz = np.bincount(self.plz_labels[self.plz_labels >= 0], minlength=len(self.plz))
+
+        per_cell = residents / np.maximum(self.cells_per_plz, 1)
+        self.residents = np.where(self.plz_labels >= 0, per_cell[np.maximum(self.plz_labels, 0)], 0.0)
+
+        self.bezirke = np.array([], dtype=object)
+        self.bez_labels = np.full(self.grid.shape, -1, dtype='int32')
+        if gdf_bez is not None:
+            self.bezirke = gdf_bez[ov.bezirk_name_column(gdf_bez)].astype(str).to_numpy()
+            self.bez_labels = rasterize(gdf_bez.to_crs(self.crs).geometry.values, self.grid)
+
+    def __repr__(self):
+        return f"ResidentRaster({self.grid}, {len(self.plz)} PLZ, {int(round(self.residents.sum()))} residents)"
+
+    def station_mask(self, lat, lon):
+        """Cells containing at least one station"""
+        x, y = hx.project_points(lat, lon, self.crs)
+        valid = np.isfinite(x) & np.isfinite(y)
+        return burn_points(self.grid, x[valid], y[valid])
+
+    def distance(self, lat, lon):
+        """Distance (m) from every cell center to the center of the nearest cell with a station"""
+        stations = self.station_mask(lat, lon)
+        if not stations.any():
+            return np.full(self.grid.shape, np.inf)
+        return distance_transform_edt(~stations, sampling=self.grid.resolution)
+
+
+@ht.timer
+def coverage_rasters(raster, gdf_lstat, radii=DEFAULT_RADII, radius_m=500):
+    """Per PLZ and per Bezirk: residents within each radius of a station (distance transform of the station cells)"""
+    dist = raster.distance(gdf_lstat['Breitengrad'].to_numpy(), gdf_lstat['Längengrad'].to_numpy())
+    radii = sorted(set(radii) | {radius_m})
+
+    inside = raster.plz_labels >= 0
+    owner, weight, d = raster.plz_labels[inside], raster.residents[inside], dist[inside]
+    n_plz = len(raster.plz)
+    residents = np.bincount(owner, weights=weight, minlength=n_plz)
+    finite = np.isfinite(d)
+    # residents in a PLZ are spread evenly, so the resident-weighted mean equals the mean over its cells
+    dist_mean = np.bincount(owner[finite], weights=d[finite], minlength=n_plz) / np.maximum(raster.cells_per_plz, 1)
+    dist_max = pd.Series(np.where(finite, d, np.nan)).groupby(owner).max().reindex(range(n_plz)).to_numpy()
+    shares = {r: np.bincount(owner, weights=weight * (d <= r), minlength=n_plz) / np.maximum(residents, 1e-9)
+              for r in radii}
+
+    by_plz = pd.DataFrame({
+        'PLZ': raster.plz.astype('int32'),
+        'dist_mean_m': np.where(finite.all(), dist_mean, np.nan).round(0),
+        'dist_max_m': dist_max.round(0),
+        'share_within': shares[radius_m].round(3),
+        'residents_beyond': np.rint(residents * (1 - shares[radius_m])).astype('int32'),
+        'n_samples': raster.cells_per_plz.astype('int32'),
+    })[nr.COVERAGE_COLUMNS]
+    for r in radii:
+        by_plz[f'share_{r}m'] = shares[r].round(3)
+
+    in_bez = raster.bez_labels >= 0
+    bez_owner, bez_weight, bez_d = raster.bez_labels[in_bez], raster.residents[in_bez], dist[in_bez]
+    n_bez = len(raster.bezirke)
+    bez_residents = np.bincount(bez_owner, weights=bez_weight, minlength=n_bez)
+    by_bezirk = pd.DataFrame({'Bezirk': raster.bezirke, 'Einwohner': np.rint(bez_residents).astype('int64')})
+    for r in radii:
+        within = np.bincount(bez_owner, weights=bez_weight * (bez_d <= r), minlength=n_bez)
+        by_bezirk[f'share_{r}m'] = (within / np.maximum(bez_residents, 1e-9)).round(3)
+    return by_plz, by_bezirk
+
+
+def load_resident_raster(data, pdict):
+    """Resident raster of the loaded data, built once per version of the residents/geometry files and resolution"""
+    paths = data['paths']
+    resolution = pdict.get('raster_resolution_m', DEFAULT_RESOLUTION)
+    pad = max(list(pdict.get('raster_radii_m', DEFAULT_RADII)) + [pdict.get('coverage_radius_m', 500)])
+    # regions without a Bezirke file get no per-Bezirk table
+    has_bez = bool(paths['bezirke']) and os.path.exists(paths['bezirke'])
+    key = (gd.file_fingerprint(paths['geodata_plz']), gd.file_fingerprint(paths['residents']),
+           gd.file_fingerprint(paths['bezirke']) if has_bez else None, resolution, pad, data['crs'])
+    # one raster per region, replaced when its inputs or settings change
+    cached = _RASTER_STORE.get(data['slug'])
+    if cached is None or cached[0] != key:
+        raster = ResidentRaster(data['gdf_residents2'], gpd.read_file(paths['bezirke']) if has_bez else None,
+                                resolution=resolution, pad=pad, crs=data['crs'])
+        _RASTER_STORE[data['slug']] = cached = (key, raster)
+    return cached[1]
+
+
+def load_raster_coverage(data, pdict):
+    """PLZ and Bezirk coverage shares of the loaded data as pipeline artifacts (recomputed when an input changes)"""
+    # the Bezirke file is rasterized here, the other inputs are covered by the upstream stages
+    inputs = [data['paths']['bezirke']]
+    depends = [data['artifact_keys']['gdf_lstat3'], data['artifact_keys']['gdf_residents2'], data['crs']]
+    radii = pdict.get('raster_radii_m', DEFAULT_RADII)
+    radius_m = pdict.get('coverage_radius_m', 500)
+    version = ac.stage_version(RASTER_COVERAGE_VERSION, __file__, hx.__file__, nr.__file__)
+    computed = {}
+
+    def compute(part):
+        if not computed:
+            computed['plz'], computed['bezirk'] = coverage_rasters(load_resident_raster(data, pdict), data['gdf_lstat3'],
+                                                                   radii=radii, radius_m=radius_m)
+        return computed[part]
+    return (ac.cached_stage(f"raster_coverage_plz_{data['slug']}", inputs, pdict, lambda: compute('plz'),
+                            version, RASTER_COVERAGE_CONFIG, depends),
+            ac.cached_stage(f"raster_coverage_bezirk_{data['slug']}", inputs, pdict, lambda: compute('bezirk'),
+                            version, RASTER_COVERAGE_CONFIG, depends))
+
+
+def load_coverage(data, pdict):
+    """Coverage metrics per PLZ and per Bezirk of the configured coverage_engine (no Bezirk table from sample points)"""
+    if pdict.get('coverage_engine', 'raster') == 'raster':
+        return load_raster_coverage(data, pdict)
+    return nr.load_coverage(data, pdict), None
+
+
+if __name__ == "__main__":
+    # python -m core.raster: residents within the configured radii of a station, per Bezirk and for Berlin
+    import main
+    from config import pdict
+    by_plz, by_bezirk = load_raster_coverage(main.load_data(), pdict)
+    with pd.option_context('display.width', 200):
+        print(by_bezirk.sort_values('Einwohner', ascending=False).to_string(index=False))
+    total = by_bezirk['Einwohner'].sum()
+    for col in [c for c in by_bezirk.columns if c.startswith('share_')]:
+        share = (by_bezirk[col] * by_bezirk['Einwohner']).sum() / max(total, 1)
+        sys.stdout.write(f"{share:.1%} of the residents live within {col[6:]} of a charging station\n")
@@ -0,0 +1,161 @@
+import sys
+import heapq
+import numpy                         as np
+import pandas                        as pd
+import scipy.sparse                  as sp
+import geopandas                     as gpd
+import shapely
+from sklearn.neighbors               import KDTree
+import core.HelperTools              as ht
+import core.geodata                  as gd
+import core.hexgrid                  as hx
+import core.raster                   as rr
+
+
+# Candidate site sources, in the order they are offered in the app
+SOURCES = {
+    'plz': 'PLZ centroids',
+    'suggestions': 'Approved community suggestions',
+    'grid': 'Regular grid',
+}
+
+RECOMMEND_COLUMNS = ['rank', 'source', 'label', 'lat', 'lon', 'new_residents', 'covered_share']
+
+
+def block_sum(values, factor):
+    """Sum of factor x factor blocks of a raster (edges padded with zeros)"""
+    h, w = values.shape
+    padded = np.zeros((-(-h // factor) * factor, -(-w // factor) * factor), dtype='float64')
+    padded[:h, :w] = values
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).sum(axis=(1, 3))
+
+
+def coverage_sets(site_x, site_y, cell_x, cell_y, radius_m):
+    """Sparse candidates x cells matrix, 1 where the cell center is within radius_m of the site"""
+    if len(cell_x) == 0 or len(site_x) == 0:
+        return sp.csr_matrix((len(site_x), len(cell_x)), dtype='float64')
+    hits = KDTree(np.column_stack([cell_x, cell_y])).query_radius(np.column_stack([site_x, site_y]), radius_m)
+    indptr = np.concatenate([[0], np.cumsum([len(h) for h in hits])])
+    indices = np.concatenate(hits).astype('int64') if len(hits) else np.array([], dtype='int64')
+    return sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(site_x), len(cell_x)))
+
+
+@ht.timer
+def celf(sets, weights, k):
+    """Lazy greedy max coverage: k rows of sets covering the most weight; returns (rows, marginal gains)"""
+    sets = sp.csr_matrix(sets)
+    weights = np.asarray(weights, dtype='float64').copy()
+    indptr, indices = sets.indptr, sets.indices
+
+    # max-heap of (-gain, row, round the gain was computed in); gains only shrink, so a fresh top is the best row
+    gains = sets @ weights
+    heap = [(-g, i, 0) for i, g in enumerate(gains) if g > 0]
+    heapq.heapify(heap)
+    chosen, chosen_gains = [], []
+    while heap and len(chosen) < k:
+        neg_gain, i, round_ = heapq.heappop(heap)
+        if round_ == len(chosen):
+            chosen.append(i)
+            chosen_gains.append(-neg_gain)
+            weights[indices[indptr[i]:indptr[i + 1]]] = 0.0
+            continue
+        gain = weights[indices[indptr[i]:indptr[i + 1]]].sum()
+        if gain > 0:
+            heapq.heappush(heap, (-gain, i, len(chosen)))
+    return np.array(chosen, dtype='int64'), np.array(chosen_gains, dtype='float64')
+
+
+class SiteRecommender:
+    """Picks the next charging sites by residents newly brought within radius_m, on the resident raster of core.raster"""
+
+    def __init__(self, raster, gdf_lstat, plz_index, radius_m=500, resolution_m=100, grid_m=250):
+        self.raster = raster
+        self.plz_index = plz_index
+        self.radius_m = radius_m
+        self.grid_m = grid_m
+        grid = raster.grid
+        factor = max(int(round(resolution_m / grid.resolution)), 1)
+
+        # residents not yet within radius_m of a station, summed into coarser blocks
+        dist = raster.distance(gdf_lstat['Breitengrad'].to_numpy(), gdf_lstat['Längengrad'].to_numpy())
+        self.total = float(raster.residents.sum())
+        self.uncovered_total = float(raster.residents[dist > radius_m].sum())
+        blocks = block_sum(np.where(dist > radius_m, raster.residents, 0.0), factor)
+        rows, cols = np.nonzero(blocks > 0)
+        size = factor * grid.resolution
+        self.cell_x = grid.x0 + (cols + 0.5) * size
+        self.cell_y = grid.y0 + (rows + 0.5) * size
+        self.weights = blocks[rows, cols]
+        self._memo = {}
+
+    def __repr__(self):
+        return (f"SiteRecommender({len(self.weights)} uncovered cells, {int(round(self.uncovered_total))} residents "
+                f"beyond {self.radius_m} m)")
+
+    def candidates(self, sources=('plz', 'suggestions'), suggestion_plz=()):
+        """Candidate sites (source, label, lat, lon) of the selected sources"""
+        frames = []
+        if 'plz' in sources:
+            frames.append(pd.DataFrame({'source': 'plz', 'label': self.plz_index['plz'].astype(str),
+                                        'lat': self.plz_index['rep_lat'], 'lon': self.plz_index['rep_lon']}))
+        if 'suggestions' in sources and len(suggestion_plz):
+            lat, lon = gd.lookup_plz_centroids(self.plz_index, list(suggestion_plz))
+            frames.append(pd.DataFrame({'source': 'suggestions', 'label': [str(p) for p in suggestion_plz],
+                                        'lat': lat, 'lon': lon}))
+        if 'grid' in sources:
+            frames.append(self.grid_candidates())
+        if not frames:
+            return pd.DataFrame(columns=['source', 'label', 'lat', 'lon'])
+        sites = pd.concat(frames, ignore_index=True)
+        return sites[np.isfinite(sites['lat']) & np.isfinite(sites['lon'])].reset_index(drop=True)
+
+    def grid_candidates(self):
+        """Grid points every grid_m meters on populated raster cells"""
+        grid = self.raster.grid
+        step = max(int(round(self.grid_m / grid.resolution)), 1)
+        populated = self.raster.residents[step // 2::step, step // 2::step] > 0
+        rows, cols = np.nonzero(populated)
+        x = grid.x0 + (cols * step + step // 2 + 0.5) * grid.resolution
+        y = grid.y0 + (rows * step + step // 2 + 0.5) * grid.resolution
+        lon, lat = gpd.GeoSeries(shapely.points(x, y), crs=self.raster.crs).to_crs(epsg=4326).get_coordinates().to_numpy().T
+        return pd.DataFrame({'source': 'grid', 'label': [f"{a:.5f}, {b:.5f}" for a, b in zip(lat, lon)],
+                             'lat': lat, 'lon': lon})
+
+    @ht.timer
+    def recommend(self, k=50, sources=('plz', 'suggestions'), suggestion_plz=()):
+        """The k candidate sites with the most newly covered residents, in the order the greedy picked them"""
+        key = (int(k), tuple(sources), tuple(suggestion_plz))
+        if key not in self._memo:
+            sites = self.candidates(sources, suggestion_plz)
+            x, y = hx.project_points(sites['lat'].to_numpy(), sites['lon'].to_numpy(), self.raster.crs)
+            rows, gains = celf(coverage_sets(x, y, self.cell_x, self.cell_y, self.radius_m), self.weights, k)
+            picked = sites.iloc[rows].reset_index(drop=True)
+            picked.insert(0, 'rank', np.arange(1, len(picked) + 1))
+            picked['new_residents'] = np.rint(gains).astype('int64')
+            covered = self.total - self.uncovered_total + np.cumsum(gains)
+            picked['covered_share'] = (covered / max(self.total, 1)).round(4)
+            if len(self._memo) > 8:
+                self._memo.clear()
+            self._memo[key] = picked[RECOMMEND_COLUMNS]
+        return self._memo[key]
+
+
+def load_recommender(data, pdict):
+    """Recommender over the resident raster and the stations of the loaded data"""
+    return SiteRecommender(rr.load_resident_raster(data, pdict), data['gdf_lstat3'], data['plz_index'],
+                           radius_m=pdict.get('coverage_radius_m', 500),
+                           resolution_m=pdict.get('recommend_resolution_m', 100),
+                           grid_m=pdict.get('recommend_grid_m', 250))
+
+
+if __name__ == "__main__":
+    # python -m core.recommend [k]: the next k sites from PLZ centroids, approved suggestions and the grid
+    import main
+    import core.suggestions          as sg
+    from config import pdict
+    recommender = load_recommender(main.load_data(), pdict)
+    print(recommender)
+    approved = [s.get('plz') for s in sg.get_suggestion_store(pdict).list(status='approved')]
+    sites = recommender.recommend(int(sys.argv[1]) if len(sys.argv) > 1 else 20, tuple(SOURCES), approved)
+    with pd.option_context('display.width', 200, 'display.max_rows', 60):
+        print(sites.to_string(index=False))
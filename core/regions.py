@@ -0,0 +1,257 @@
+import os
+import re
+import sys
+from concurrent.futures              import ProcessPoolExecutor
+import core.HelperTools              as ht
+import core.geodata                  as gd
+import core.registry                 as rg
+import core.artifacts                as ac
+import core.residents                as rs
+import core.deltas                   as dl
+import core.methods                  as m1
+
+
+# Project root (one level above core/), dataset files of a region are relative to its datasets folder
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASETS_DIR = os.path.join(basedir, 'datasets')
+
+# Keys of a region definition (config.py, p["regions"]); lstat_plz/resid_plz are exclusive PLZ bounds
+REGION_KEYS = ['bundesland', 'lstat_plz', 'resid_plz', 'file_geodat_plz', 'file_geodat_dis', 'file_residents',
+               'file_bezirke', 'center', 'crs']
+
+
+def region_slug(name):
+    """File-name safe form of a region name (artifact stages, state folders)"""
+    name = name.lower().translate(str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'}))
+    return re.sub(r'[^a-z0-9]+', '_', name).strip('_')
+
+
+def region_definitions(pdict):
+    """{name: definition} of the configured regions; without p["regions"] the single Berlin region of the file keys"""
+    regions = pdict.get('regions') or {'Berlin': {
+        'bundesland': 'Berlin', 'lstat_plz': (10115, 14200), 'resid_plz': (10000, 14200),
+        'file_geodat_plz': pdict.get('file_geodat_plz', 'geodata_berlin_plz.csv'),
+        'file_geodat_dis': pdict.get('file_geodat_dis', 'geodata_berlin_dis.csv'),
+        'file_residents': pdict.get('file_residents', 'plz_einwohner.csv'),
+        'file_bezirke': os.path.join('berlin_bezirke', 'bezirksgrenzen.shp'),
+        'center': (52.52, 13.40),
+    }}
+    out = {}
+    for name, definition in regions.items():
+        region = {key: definition.get(key) for key in REGION_KEYS}
+        region['bundesland'] = region['bundesland'] or name
+        region['lstat_plz'] = tuple(region['lstat_plz'] or (0, 100000))
+        region['resid_plz'] = tuple(region['resid_plz'] or region['lstat_plz'])
+        region.update(name=name, slug=region_slug(name))
+        out[name] = region
+    return out
+
+
+def get_region(pdict, name=None):
+    """Definition of a region by name; None gives p["region"] (or the first configured region)"""
+    regions = region_definitions(pdict)
+    name = name or pdict.get('region') or next(iter(regions))
+    if name not in regions:
+        raise KeyError(f"Unknown region {name!r}, configured: {list(regions)}")
+    return regions[name]
+
+
+def region_paths(region, pdict):
+    """Absolute paths of the input datasets of a region"""
+    paths = {
+        'datasets_dir': DATASETS_DIR,
+        'geodata_plz': os.path.join(DATASETS_DIR, region['file_geodat_plz']),
+        'geodata_dis': os.path.join(DATASETS_DIR, region['file_geodat_dis']) if region['file_geodat_dis'] else '',
+        'lstat': os.path.join(DATASETS_DIR, pdict.get('file_lstations', 'Ladesaeulenregister.csv')),
+        # optional files are '' when a region has none (treated like a missing file)
+        'bezirke': os.path.join(DATASETS_DIR, region['file_bezirke']) if region['file_bezirke'] else '',
+    }
+
+    # config may point to a CSV but the folder contains an Excel file — try config path first then fallback
+    path_residents = os.path.join(DATASETS_DIR, region['file_residents'])
+    if not os.path.exists(path_residents):
+        alt = os.path.splitext(path_residents)[0] + '.xlsx'
+        if os.path.exists(alt):
+            path_residents = alt
+    paths['residents'] = path_residents
+    return paths
+
+
+def available_regions(pdict):
+    """Names of the configured regions whose PLZ geodata and residents files exist"""
+    available = []
+    for name, region in region_definitions(pdict).items():
+        paths = region_paths(region, pdict)
+        if os.path.exists(paths['geodata_plz']) and os.path.exists(paths['residents']):
+            available.append(name)
+    return available
+
+
+def lstat_read_window(region, pdict):
+    """Registry PLZ range read for a region"""
+    # (with coordinate-based PLZ assignment the registry PLZ is not trusted, so its window is not applied)
+    return (0, 100000) if pdict.get('lstat_plz_assignment') == 'coordinates' else region['lstat_plz']
+
+
+def _stages(region, pdict):
+    """{frame: (stage, input files, version, config keys, depends)} of the cached preprocessing stages of a region"""
+    paths = region_paths(region, pdict)
+    slug = region['slug']
+    # the region definition selects the rows, so its Bundesland and PLZ windows are part of the key
+    lstat = ([paths['lstat'], paths['geodata_plz']],
+             ac.stage_version(m1.PREPROP_LSTAT_VERSION, m1.__file__, rg.__file__), m1.PREPROP_LSTAT_CONFIG,
+             [repr((region['bundesland'], region['lstat_plz']))])
+    resid = ([paths['residents'], paths['geodata_plz'], paths['bezirke']],
+             ac.stage_version(m1.PREPROP_RESID_VERSION, m1.__file__, rs.__file__), m1.PREPROP_RESID_CONFIG,
+             [repr(region['resid_plz']), rs.RESIDENTS_TAG])
+    return {'gdf_lstat3': (f'gdf_lstat3_{slug}', *lstat), 'df_lstat2': (f'df_lstat2_{slug}', *lstat),
+            'gdf_residents2': (f'gdf_residents2_{slug}', *resid)}
+
+
+def artifact_keys(region, pdict):
+    """{frame: artifact key} of the preprocessed frames, the upstream keys of the derived stages (hexagons, coverage)"""
+    return {name: ac.artifact_key(stage, inputs, pdict, version, keys, deps)
+            for name, (stage, inputs, version, keys, deps) in _stages(region, pdict).items()}
+
+
+def cached_rows(region, pdict):
+    """{frame: rows} of a preprocessed region from the Parquet footers (frames not loaded); None if not cached"""
+    rows = {}
+    if pdict.get('lstat_incremental', False):
+        # with lstat_incremental the stations live in the registry state, not in artifacts
+        names = ['gdf_residents2']
+        state = dl.state_rows(pdict, region['slug'])
+        if state is None:
+            return None
+        rows.update(state)
+    else:
+        names = ['gdf_residents2', 'gdf_lstat3', 'df_lstat2']
+    stages = _stages(region, pdict)
+    for name in names:
+        rows[name] = ac.cached_rows(*stages[name])
+        if rows[name] is None:
+            return None
+    return rows
+
+
+def is_preprocessed(region, pdict):
+    """Whether every cached stage of the region (or its registry state) is in the cache"""
+    return cached_rows(region, pdict) is not None
+
+
+def read_region_registry(region, pdict):
+    """Charging stations CSV rows of one region, read in chunks (header detection, used columns only)"""
+    plz_window = lstat_read_window(region, pdict)
+    return rg.read_lstat_chunked(region_paths(region, pdict)['lstat'], bundesland=region['bundesland'],
+                                 plz_min=plz_window[0], plz_max=plz_window[1],
+                                 chunksize=pdict.get('lstat_chunksize', 100_000))
+
+
+@ht.timer
+def preprocess_region(region, pdict, df_lstat=None):
+    """Loads and preprocesses the datasets of one region; df_lstat: its registry rows if already read"""
+    paths = region_paths(region, pdict)
+    stages = _stages(region, pdict)
+
+    def cached(name, compute):
+        stage, inputs, version, keys, deps = stages[name]
+        return ac.cached_stage(stage, inputs, pdict, compute, version, keys, deps)
+
+    # 1) Load geodata (PLZ polygons), parsed once and shared via the GeoParquet cache
+    df_geodat_plz = gd.load_geodata_plz(paths['geodata_plz'], pdict)
+    plz_index = gd.load_plz_index(paths['geodata_plz'], pdict)
+
+    # 2) + 3) Load and preprocess charging stations, count per PLZ
+    update = None
+    if pdict.get('lstat_incremental', False):
+        # stored station table and counts, updated from the rows that changed since the last snapshot
+        update = dl.refresh_registry(paths['lstat'], df_geodat_plz, pdict, df_geo_path=paths['geodata_plz'],
+                                     plz_window=lstat_read_window(region, pdict), region=region)
+        gdf_lstat3, df_lstat2 = update['stations'], update['counts']
+    else:
+        gdf_lstat3 = cached('gdf_lstat3', lambda: m1.preprop_lstat(
+            df_lstat if df_lstat is not None else read_region_registry(region, pdict), df_geodat_plz, pdict,
+            bundesland=region['bundesland'], plz_window=region['lstat_plz']))
+        df_lstat2 = cached('df_lstat2', lambda: m1.count_plz_occurrences(gdf_lstat3))
+
+    # 4) + 5) Load residents data (Excel or CSV), preprocess and attach geometries
+    gdf_residents2 = cached('gdf_residents2', lambda: m1.preprop_resid(
+        rs.load_residents(paths['residents'], pdict, plz_index, paths['geodata_plz'], paths['bezirke']),
+        df_geodat_plz, pdict, plz_window=region['resid_plz']))
+
+    if pdict.get('memory_report', False):
+        stages = {'gdf_lstat3': gdf_lstat3, 'df_lstat2': df_lstat2, 'gdf_residents2': gdf_residents2}
+        ht.memory_report(stages, {name: m1.legacy_dtypes(frame) for name, frame in stages.items()})
+
+    return {
+        'region': region['name'],
+        'slug': region['slug'],
+        'paths': paths,
+        'df_geodat_plz': df_geodat_plz,
+        'plz_index': plz_index,
+        'gdf_lstat3': gdf_lstat3,
+        'df_lstat2': df_lstat2,
+        'gdf_residents2': gdf_residents2,
+        'artifact_keys': artifact_keys(region, pdict),
+        # metric CRS of the grids, rasters and distances: set by the region or the UTM zone of its residents
+        'crs': region['crs'] or gd.metric_crs(gdf_residents2),
+        # with lstat_incremental: the refresh result (snapshot, touched PLZ) the demand metrics are patched with
+        'registry_update': update,
+    }
+
+
+def _preprocess_worker(region, pdict, df_lstat, keep):
+    """Process pool entry point: the frames of one region, or only its row counts when keep is False"""
+    data = preprocess_region(region, pdict, df_lstat)
+    if keep:
+        return data
+    return {name: len(data[name]) for name in ('gdf_lstat3', 'df_lstat2', 'gdf_residents2')}
+
+
+@ht.timer
+def preprocess_regions(pdict, names=None, workers=None, keep=True):
+    """Preprocesses several regions: one pass over the registry for all of them, then one worker process per region"""
+    regions = [get_region(pdict, name) for name in (names or available_regions(pdict))]
+    cached = {region['name']: cached_rows(region, pdict) for region in regions}
+    todo = [region for region in regions if cached[region['name']] is None]
+
+    # regions whose artifacts are cached skip the registry read and the pool
+    partitions = {}
+    if todo and not pdict.get('lstat_incremental', False):
+        windows = {r['name']: (r['bundesland'], *lstat_read_window(r, pdict)) for r in todo}
+        partitions = rg.read_lstat_partitioned(region_paths(todo[0], pdict)['lstat'], windows,
+                                               chunksize=pdict.get('lstat_chunksize', 100_000))
+
+    results = {}
+    workers = min(workers or pdict.get('region_workers') or os.cpu_count() or 1, len(todo))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {r['name']: pool.submit(_preprocess_worker, r, dict(pdict), partitions.get(r['name']), keep)
+                       for r in todo}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"Region {name} not preprocessed ({e})")
+    else:
+        for region in todo:
+            try:
+                results[region['name']] = _preprocess_worker(region, pdict, partitions.get(region['name']), keep)
+            except Exception as e:
+                print(f"Region {region['name']} not preprocessed ({e})")
+
+    # cached regions are read from the artifact cache with keep, otherwise only their row counts are reported
+    for region in regions:
+        if cached[region['name']] is not None:
+            results[region['name']] = _preprocess_worker(region, pdict, None, True) if keep else cached[region['name']]
+    return {r['name']: results[r['name']] for r in regions if r['name'] in results}
+
+
+if __name__ == "__main__":
+    # python -m core.regions [workers]: preprocesses every available region in parallel and prints one line per region
+    from config import pdict
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print(f"Configured: {list(region_definitions(pdict))}, available: {available_regions(pdict)}")
+    for name, rows in preprocess_regions(pdict, workers=workers, keep=False).items():
+        print(f"{name:<24} stations={rows['gdf_lstat3']:>7}  PLZ with stations={rows['df_lstat2']:>5}  "
+              f"residents PLZ={rows['gdf_residents2']:>5}")
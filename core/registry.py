@@ -0,0 +1,114 @@
+import unicodedata
+import pandas                        as pd
+import core.HelperTools              as ht
+import core.instrumentation          as ins
+
+
+# Columns of Ladesaeulenregister.csv used by preprop_lstat
+LSTAT_COLUMNS = ['Postleitzahl', 'Bundesland', 'Breitengrad', 'Längengrad', 'Nennleistung Ladeeinrichtung [kW]']
+LSTAT_NUMERIC = ['Breitengrad', 'Längengrad', 'Nennleistung Ladeeinrichtung [kW]']
+
+# Stable key of a charging point across registry snapshots (used by core.deltas)
+ID_COLUMN = 'Ladeeinrichtungs-ID'
+
+BUNDESLAENDER = [
+    'Baden-Württemberg', 'Bayern', 'Berlin', 'Brandenburg', 'Bremen', 'Hamburg', 'Hessen',
+    'Mecklenburg-Vorpommern', 'Niedersachsen', 'Nordrhein-Westfalen', 'Rheinland-Pfalz',
+    'Saarland', 'Sachsen', 'Sachsen-Anhalt', 'Schleswig-Holstein', 'Thüringen'
+]
+BUNDESLAND_DTYPE = pd.CategoricalDtype(BUNDESLAENDER)
+
+
+def _bundesland_key(name):
+    """Spelling-insensitive key of a Bundesland name (case, blanks, dashes, umlauts as ae/oe/ue, UTF-8 read as latin1)"""
+    name = str(name)
+    try:
+        name = name.encode('latin1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        pass
+    name = unicodedata.normalize('NFC', name).strip().lower()
+    for umlaut, plain in (('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')):
+        name = name.replace(umlaut, plain)
+    return ''.join(c for c in name if c.isalnum())
+
+
+_BUNDESLAND_KEYS = {_bundesland_key(name): name for name in BUNDESLAENDER}
+
+
+def detect_header_row(path, sep=';', encoding='latin1'):
+    """Line number of the registry header (the file starts with metadata lines)"""
+    with open(path, 'r', encoding=encoding) as fh:
+        for i, line in enumerate(fh):
+            if 'Ladeeinrichtungs-ID' in line or 'Postleitzahl' in line:
+                return i
+    return 0
+
+
+def normalize_bundesland(values):
+    """Bundesland column as BUNDESLAND_DTYPE, spelling variants mapped to the 16 names; returns it and the unmatched rows"""
+    raw = values.astype('category')
+    names = pd.Series([_BUNDESLAND_KEYS.get(_bundesland_key(c)) for c in raw.cat.categories], dtype=object)
+    # one lookup per distinct spelling, the rows only carry their category code
+    codes = raw.cat.codes.to_numpy()
+    mapped = pd.Series(names.to_numpy()[codes], index=values.index).where(codes >= 0)
+    unmatched = values[mapped.isna() & values.notna()]
+    return mapped.astype(BUNDESLAND_DTYPE), unmatched
+
+
+def _read_registry(path, chunksize, sep, columns):
+    """Chunks of Ladesaeulenregister.csv with the used columns; Bundesland normalized, unmatched rows counted on the span"""
+    header_row = detect_header_row(path, sep=sep)
+    reader = pd.read_csv(
+        path, sep=sep, encoding='latin1',
+        skiprows=header_row, header=0,
+        usecols=columns,
+        dtype={'Postleitzahl': str, 'Bundesland': 'category', ID_COLUMN: str},
+        decimal=',',
+        chunksize=chunksize,
+    )
+    unmatched = {}
+    for chunk in reader:
+        bundesland, rest = normalize_bundesland(chunk['Bundesland'])
+        for name, n in rest.astype(str).value_counts().items():
+            unmatched[name] = unmatched.get(name, 0) + n
+        yield chunk.assign(Bundesland=bundesland)
+    # rows of no known Bundesland are dropped by every region filter, so they are reported on the reading stage
+    ins.current_span().set(bundesland_unmatched=sum(unmatched.values()),
+                           bundesland_unknown=sorted(unmatched, key=unmatched.get, reverse=True)[:5])
+
+
+def _clean_chunk(chunk, bundesland, plz_min, plz_max):
+    """Filters one registry chunk to a Bundesland and PLZ window, coordinates as floats"""
+    chunk = chunk[chunk['Bundesland'] == bundesland]
+    plz = pd.to_numeric(chunk['Postleitzahl'], errors='coerce')
+    chunk = chunk[(plz > plz_min) & (plz < plz_max)]
+
+    # decimal=',' parses clean columns directly; columns with stray values stay text and are coerced here
+    for col in LSTAT_NUMERIC:
+        if chunk[col].dtype == object or str(chunk[col].dtype) in ('str', 'string'):
+            chunk = chunk.assign(**{col: pd.to_numeric(chunk[col].astype(str).str.replace(',', '.'), errors='coerce')})
+    return chunk
+
+
+@ht.timer
+def read_lstat_chunked(path, bundesland='Berlin', plz_min=10115, plz_max=14200, chunksize=100_000, sep=';', columns=LSTAT_COLUMNS):
+    """Streams Ladesaeulenregister.csv in chunks, keeping only the used columns of one Bundesland"""
+    reader = _read_registry(path, chunksize, sep, columns)
+    parts = [_clean_chunk(chunk, bundesland, plz_min, plz_max) for chunk in reader]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(parts, ignore_index=True)
+
+
+@ht.timer
+def read_lstat_partitioned(path, windows, chunksize=100_000, sep=';', columns=LSTAT_COLUMNS):
+    """One pass over Ladesaeulenregister.csv for several regions; windows: name -> (Bundesland, plz_min, plz_max)"""
+    reader = _read_registry(path, chunksize, sep, columns)
+    parts = {name: [] for name in windows}
+    for chunk in reader:
+        # group once per chunk, so each region only filters the rows of its Bundesland
+        by_land = {land: rows for land, rows in chunk.groupby('Bundesland', observed=True)}
+        for name, (bundesland, plz_min, plz_max) in windows.items():
+            if bundesland in by_land:
+                parts[name].append(_clean_chunk(by_land[bundesland], bundesland, plz_min, plz_max))
+    return {name: pd.concat(p, ignore_index=True) if p else pd.DataFrame(columns=columns) for name, p in parts.items()}
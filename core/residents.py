@@ -0,0 +1,211 @@
+import os
+import openpyxl
+import numpy                         as np
+import pandas                        as pd
+import core.HelperTools              as ht
+import core.geodata                  as gd
+import core.overlap                  as ov
+
+
+RESIDENT_COLUMNS = ['plz', 'einwohner', 'lat', 'lon']
+
+# Version of the residents algorithm (sheet parsing, T5 redistribution): bump when it changes the result.
+# With the overlap matrix version it tags the sidecar, so old sidecars are not reused by new code
+RESIDENTS_VERSION = 1
+RESIDENTS_TAG = f"v{RESIDENTS_VERSION}-ov{ov.OVERLAP_VERSION}"
+
+
+def read_sheet(workbook, sheet):
+    """All rows of one worksheet as a DataFrame without header (sheet by name or position)"""
+    ws = workbook.worksheets[sheet] if isinstance(sheet, int) else workbook[sheet]
+    return pd.DataFrame(list(ws.iter_rows(values_only=True)))
+
+
+def frame_with_header(raw, header_row):
+    """Uses one already loaded row as header, like read_excel(header=header_row)"""
+    header = raw.iloc[header_row].tolist()
+    columns = [f"Unnamed: {i}" if v is None or (isinstance(v, float) and pd.isna(v)) else str(v) for i, v in enumerate(header)]
+    df = raw.iloc[header_row + 1:].reset_index(drop=True)
+    df.columns = columns
+    return df
+
+
+def detect_t14_header(raw, default=2):
+    """Header row of sheet T14: the first row naming 'Postleitzahl' and a total column"""
+    for i in range(min(10, len(raw))):
+        vals = raw.iloc[i].astype(str).str.strip().str.lower().tolist()
+        if 'postleitzahl' in vals and any('ins' in v or 'gesamt' in v for v in vals):
+            return i
+    return default
+
+
+def residents_from_t14(df_t14, plz_index):
+    """Residents per (PLZ, district) row of sheet T14 with PLZ centroid lat/lon; None if columns are missing"""
+    # detect the PLZ and total columns
+    plz_col = None
+    total_col = None
+    for c in df_t14.columns:
+        lc = str(c).strip().lower()
+        if 'postleitzahl' in lc or lc == 'plz':
+            plz_col = c
+        if 'insgesamt' in lc or lc == 'ins-' or 'gesamt' in lc:
+            total_col = c
+    if plz_col is None or total_col is None:
+        return None
+
+    df_res = df_t14[[plz_col, total_col]].copy()
+    df_res.columns = ['plz', 'einwohner']
+    df_res['plz'] = df_res['plz'].astype(str).str.extract(r'(\d{5})')[0]
+    df_res['plz'] = pd.to_numeric(df_res['plz'], errors='coerce')
+    # einwohner is numeric from Excel; convert directly without regex (regex removes decimal points)
+    df_res['einwohner'] = pd.to_numeric(df_res['einwohner'], errors='coerce').fillna(0).astype(int)
+    # Note: T14 lists each PLZ once per district. Each row is a unique (PLZ, district) entry.
+    # Do NOT aggregate—sum of all rows = expected total.
+    df_residents = df_res.dropna(subset=['plz'])
+
+    # attach PLZ centroid lat/lon (batch lookup in the cached PLZ index)
+    lat, lon = gd.lookup_plz_centroids(plz_index, df_residents['plz'])
+    return df_residents.assign(lat=lat, lon=lon)[RESIDENT_COLUMNS].reset_index(drop=True)
+
+
+def residents_from_t5(df_t5, bez_path, plz_index, geodata_path=None, pdict=None):
+    """District totals of sheet T5 spread over the PLZ by the area each PLZ shares with each district"""
+    # find district and total columns
+    district_col = None
+    total_col = None
+    for c in df_t5.columns:
+        lc = str(c).lower()
+        if 'bezirk' in lc:
+            district_col = c
+        if 'insgesamt' in lc or 'gesamt' in lc:
+            total_col = c
+
+    if district_col is None:
+        district_col = df_t5.columns[0]
+    if total_col is None:
+        for c in df_t5.columns[1:]:
+            if pd.to_numeric(df_t5[c], errors='coerce').notna().any():
+                total_col = c
+                break
+    if total_col is None or geodata_path is None or not os.path.exists(bez_path):
+        return None
+
+    df_districts = df_t5[[district_col, total_col]].copy()
+    df_districts.columns = ['Bezirk', 'Einwohner_Bezirk']
+    df_districts = df_districts.dropna(subset=['Bezirk'])
+    df_districts['Einwohner_Bezirk'] = df_districts['Einwohner_Bezirk'].astype(str).str.replace(r"[^0-9-]", "", regex=True)
+    df_districts['Einwohner_Bezirk'] = pd.to_numeric(df_districts['Einwohner_Bezirk'], errors='coerce').fillna(0)
+
+    # Cached sparse PLZ x Bezirk area weights: one matrix-vector product instead of a spatial join per run
+    overlap = ov.load_overlap_matrix(geodata_path, bez_path, pdict or {})
+    totals = overlap.align_districts(df_districts['Bezirk'], df_districts['Einwohner_Bezirk'])
+    einwohner = overlap.district_to_plz(totals)
+
+    lat, lon = gd.lookup_plz_centroids(plz_index, overlap.plz)
+    return pd.DataFrame({
+        'plz': overlap.plz.astype(int),
+        'einwohner': np.rint(einwohner).astype(int),
+        'lat': lat,
+        'lon': lon
+    })
+
+
+def residents_from_table(df_read):
+    """Residents from a plain table with 'Postleitzahl' and 'Insgesamt' columns; None otherwise"""
+    df_read_cols = {str(c).strip().lower(): c for c in df_read.columns}
+    if 'postleitzahl' not in df_read_cols or 'insgesamt' not in df_read_cols:
+        return None
+    df_tmp = df_read[[df_read_cols['postleitzahl'], df_read_cols['insgesamt']]].copy()
+    df_tmp.columns = ['plz', 'einwohner']
+    df_tmp['plz'] = df_tmp['plz'].astype(str).str.extract(r'(\d{5})')[0]
+    df_tmp['plz'] = pd.to_numeric(df_tmp['plz'], errors='coerce')
+    df_tmp['einwohner'] = df_tmp['einwohner'].astype(str).str.replace(r"[^0-9-]", "", regex=True)
+    df_tmp['einwohner'] = pd.to_numeric(df_tmp['einwohner'], errors='coerce').fillna(0).astype(int)
+    return df_tmp
+
+
+def normalize_residents(df_residents):
+    """Maps common column variants to plz, einwohner, lat, lon and checks they are all present"""
+    if df_residents is None:
+        raise RuntimeError("Residents file could not be read: no T14, T5 or Postleitzahl/Insgesamt table found")
+
+    mapper = {}
+    if 'plz' not in df_residents.columns:
+        plz_col = next((c for c in df_residents.columns if 'plz' in str(c)), None)
+        if plz_col is not None:
+            mapper[plz_col] = 'plz'
+    if 'einwohner' not in df_residents.columns:
+        einw_col = next((c for c in df_residents.columns if 'einw' in str(c)), None)
+        if einw_col is not None:
+            mapper[einw_col] = 'einwohner'
+
+    # lat / lon variants
+    for c in df_residents.columns:
+        if c in ('breitengrad', 'latitude'):
+            mapper[c] = 'lat'
+        if c in ('lng', 'longitude', 'längengrad'):
+            mapper[c] = 'lon'
+    df_residents = df_residents.rename(columns=mapper)
+
+    # Ensure required columns exist; if not, raise informative error
+    missing = set(RESIDENT_COLUMNS) - set(df_residents.columns)
+    if missing:
+        raise RuntimeError(f"Residents file is missing required columns: {missing}. Columns found: {list(df_residents.columns)}")
+    return df_residents
+
+
+def _read_residents_source(path, bez_path, plz_index, geodata_path=None, pdict=None):
+    """Parses the residents workbook (each needed sheet once, read-only) or CSV"""
+    if not path.lower().endswith(('.xlsx', '.xls')):
+        df_read = pd.read_csv(path, sep=';')
+        df_read.columns = [str(c).strip().lower() for c in df_read.columns]
+        return residents_from_table(df_read)
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        # Prefer the PLZ-level table in sheet 'T14'; the header is found in the rows already loaded
+        if 'T14' in workbook.sheetnames:
+            raw_t14 = read_sheet(workbook, 'T14')
+            df_residents = residents_from_t14(frame_with_header(raw_t14, detect_t14_header(raw_t14)), plz_index)
+            if df_residents is not None:
+                return df_residents
+
+        # Fall back to the first sheet: either a Bezirke summary (-> T5) or a plain PLZ table
+        df_read = frame_with_header(read_sheet(workbook, 0), 0)
+        df_read.columns = [str(c).strip().lower() for c in df_read.columns]
+        cols = list(df_read.columns)
+        if any('bezirk' in c for c in cols) or all(c.startswith('unnamed') or c == '' for c in cols):
+            if 'T5' not in workbook.sheetnames:
+                return None
+            raw_t5 = read_sheet(workbook, 'T5')
+            df_t5 = frame_with_header(raw_t5, 2) if len(raw_t5) > 2 else raw_t5
+            return residents_from_t5(df_t5, bez_path, plz_index, geodata_path, pdict)
+        return residents_from_table(df_read)
+    finally:
+        workbook.close()
+
+
+@ht.timer
+def load_residents(path, pdict, plz_index, geodata_path, bez_path):
+    """Residents (plz, einwohner, lat, lon); a Parquet sidecar is used while the sources are unchanged"""
+    inputs = [path, geodata_path] + ([bez_path] if os.path.exists(bez_path) else [])
+    key = '_'.join([RESIDENTS_TAG] + [gd.file_fingerprint(p) for p in inputs])
+    # the source path tag keeps the sidecars of equally named files (plz_einwohner.* of each region) apart
+    prefix = f"residents_{os.path.splitext(os.path.basename(path))[0]}_{gd.source_tag(path)}_"
+    sidecar = os.path.join(gd.get_cache_dir(pdict), f"{prefix}{key}.parquet")
+
+    if os.path.exists(sidecar):
+        try:
+            return pd.read_parquet(sidecar, memory_map=True)
+        except Exception:
+            pass
+
+    df_residents = normalize_residents(_read_residents_source(path, bez_path, plz_index, geodata_path, pdict))[RESIDENT_COLUMNS]
+    try:
+        # drop stale sidecars of this source only
+        for old in [f for f in os.listdir(os.path.dirname(sidecar)) if f.startswith(prefix)]:
+            os.remove(os.path.join(os.path.dirname(sidecar), old))
+        df_residents.to_parquet(sidecar, index=False)
+    except Exception as e:
+        print(f"Residents sidecar not written ({e})")
+    return df_residents
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import sqlite3
+from datetime import datetime
+
+
+# Project root (one level above core/), suggestion files in pdict are relative to it
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SUGGESTION_FIELDS = ['id', 'plz', 'address', 'reason', 'timestamp', 'status', 'reviewed_by', 'review_date', 'review_notes']
+
+
+class JsonSuggestionStore:
+    """Suggestions in one JSON file (original format; every write rewrites the file)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def list(self, status=None):
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                suggestions = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return [s for s in suggestions if status is None or s.get('status') == status]
+
+    def query(self, status=None, plz=None, newest_first=True, limit=20, cursor=None):
+        rows = [s for s in self.list(status=status) if plz is None or str(s.get('plz')) == str(plz)]
+        return paginate(rows, newest_first, limit, cursor)
+
+    def counts_by_plz(self, status=None):
+        counts = {}
+        for s in self.list(status=status):
+            counts[str(s.get('plz'))] = counts.get(str(s.get('plz')), 0) + 1
+        return sorted(counts.items())
+
+    def _write(self, suggestions):
+        # write to a temp file and swap it in, so a crash never leaves a half-written file
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(suggestions, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def add(self, suggestion):
+        suggestions = self.list()
+        suggestion = dict(suggestion, id=max([s.get('id', 0) for s in suggestions], default=0) + 1)
+        suggestions.append(suggestion)
+        self._write(suggestions)
+        return suggestion['id']
+
+    def review(self, suggestion_id, status, reviewer, review_date, notes):
+        suggestions = self.list()
+        for suggestion in suggestions:
+            if suggestion.get('id') == suggestion_id:
+                suggestion.update(status=status, reviewed_by=reviewer, review_date=review_date, review_notes=notes)
+                break
+        self._write(suggestions)
+
+
+class SQLiteSuggestionStore:
+    """Suggestions in SQLite (WAL mode): O(1) inserts/updates, safe with concurrent sessions"""
+
+    def __init__(self, path):
+        self.path = path
+        con = self._connect()
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS suggestions (
+                    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                    plz          TEXT,
+                    address      TEXT,
+                    reason       TEXT,
+                    timestamp    TEXT,
+                    status       TEXT NOT NULL DEFAULT 'pending',
+                    reviewed_by  TEXT,
+                    review_date  TEXT,
+                    review_notes TEXT
+                )""")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_suggestions_status ON suggestions(status)")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_suggestions_plz ON suggestions(plz)")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_suggestions_timestamp ON suggestions(timestamp, id)")
+            # store-level flags (e.g. whether the JSON import already ran)
+            con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            con.commit()
+        finally:
+            con.close()
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=10)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA busy_timeout=10000")
+        return con
+
+    def _execute(self, sql, params=()):
+        con = self._connect()
+        try:
+            with con:
+                return con.execute(sql, params)
+        finally:
+            con.close()
+
+    def _query(self, sql, params=()):
+        con = self._connect()
+        try:
+            return [dict(row) for row in con.execute(sql, params).fetchall()]
+        finally:
+            con.close()
+
+    def list(self, status=None):
+        if status is None:
+            return self._query("SELECT * FROM suggestions ORDER BY id")
+        return self._query("SELECT * FROM suggestions WHERE status = ? ORDER BY id", (status,))
+
+    def query(self, status=None, plz=None, newest_first=True, limit=20, cursor=None):
+        """One page of suggestions (keyset pagination on timestamp, id) and the cursor of the next page"""
+        where, params = [], []
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        if plz is not None:
+            where.append("plz = ?")
+            params.append(str(plz))
+        if cursor is not None:
+            where.append("(timestamp, id) < (?, ?)" if newest_first else "(timestamp, id) > (?, ?)")
+            params.extend(cursor)
+        order = "DESC" if newest_first else "ASC"
+        sql = "SELECT * FROM suggestions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY timestamp {order}, id {order} LIMIT ?"
+        rows = self._query(sql, tuple(params) + (limit + 1,))
+        return _page(rows, limit)
+
+    def counts_by_plz(self, status=None):
+        """(plz, number of suggestions) pairs, counted in SQL"""
+        if status is None:
+            rows = self._query("SELECT plz, COUNT(*) AS n FROM suggestions GROUP BY plz ORDER BY plz")
+        else:
+            rows = self._query("SELECT plz, COUNT(*) AS n FROM suggestions WHERE status = ? GROUP BY plz ORDER BY plz", (status,))
+        return [(r['plz'], r['n']) for r in rows]
+
+    def count(self):
+        return self._query("SELECT COUNT(*) AS n FROM suggestions")[0]['n']
+
+    @staticmethod
+    def _row(suggestion):
+        values = {k: suggestion.get(k) for k in SUGGESTION_FIELDS}
+        values['status'] = values['status'] or 'pending'
+        values['timestamp'] = values['timestamp'] or ''
+        return values
+
+    def add(self, suggestion):
+        values = self._row(suggestion)
+        if values['id'] is None:
+            del values['id']  # assigned by AUTOINCREMENT
+        cols = ', '.join(values)
+        marks = ', '.join('?' for _ in values)
+        return self._execute(f"INSERT INTO suggestions ({cols}) VALUES ({marks})", tuple(values.values())).lastrowid
+
+    def _insert_many(self, con, suggestions):
+        # ids are always assigned by AUTOINCREMENT (legacy ids may collide)
+        fields = [k for k in SUGGESTION_FIELDS if k != 'id']
+        cols = ', '.join(fields)
+        marks = ', '.join('?' for _ in fields)
+        con.executemany(f"INSERT INTO suggestions ({cols}) VALUES ({marks})",
+                        [tuple(self._row(s)[k] for k in fields) for s in suggestions])
+
+    def add_many(self, suggestions):
+        """Inserts many suggestions in one transaction (new ids, in the given order)"""
+        con = self._connect()
+        try:
+            with con:
+                self._insert_many(con, suggestions)
+        finally:
+            con.close()
+
+    def import_once(self, flag, suggestions):
+        """Inserts the suggestions and sets the meta flag in one write transaction, unless the flag is already set"""
+        con = self._connect()
+        try:
+            with con:
+                # BEGIN IMMEDIATE takes the write lock first, so a second session waits and then sees the flag
+                con.execute("BEGIN IMMEDIATE")
+                if con.execute("SELECT 1 FROM meta WHERE key = ?", (flag,)).fetchone():
+                    return 0
+                # stores filled before the flag existed already hold the import
+                n = 0
+                if con.execute("SELECT COUNT(*) FROM suggestions").fetchone()[0] == 0:
+                    self._insert_many(con, suggestions)
+                    n = len(suggestions)
+                con.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (flag, datetime.now().isoformat()))
+                return n
+        finally:
+            con.close()
+
+    def review(self, suggestion_id, status, reviewer, review_date, notes):
+        self._execute(
+            "UPDATE suggestions SET status = ?, reviewed_by = ?, review_date = ?, review_notes = ? WHERE id = ?",
+            (status, reviewer, review_date, notes, suggestion_id)
+        )
+
+
+def _sort_key(suggestion):
+    return (suggestion.get('timestamp') or '', suggestion.get('id') or 0)
+
+
+def _page(rows, limit):
+    """Splits limit+1 fetched rows into the page and the cursor of the next page (None on the last page)"""
+    page = rows[:limit]
+    next_cursor = _sort_key(page[-1]) if len(rows) > limit and page else None
+    return page, next_cursor
+
+
+def paginate(rows, newest_first=True, limit=20, cursor=None):
+    """Keyset pagination of in-memory suggestions, same semantics as SQLiteSuggestionStore.query"""
+    rows = sorted(rows, key=_sort_key, reverse=newest_first)
+    if cursor is not None:
+        cursor = tuple(cursor)
+        rows = [r for r in rows if (_sort_key(r) < cursor if newest_first else _sort_key(r) > cursor)]
+    return _page(rows[:limit + 1], limit)
+
+
+def import_json_suggestions(store, json_path):
+    """One-time import of suggestions.json into the store; legacy ids are dropped, new ones follow the timestamps"""
+    suggestions = sorted(JsonSuggestionStore(json_path).list(), key=lambda s: str(s.get('timestamp') or ''))
+    return store.import_once('json_import', suggestions)
+
+
+# Stores already opened in this process, keyed by (backend, path)
+_STORES = {}
+
+
+def get_suggestion_store(pdict=None):
+    """Suggestion backend configured in pdict ('sqlite' or 'json')"""
+    if pdict is None:
+        from config import pdict
+    backend = pdict.get('suggestion_backend', 'sqlite')
+    json_path = os.path.join(basedir, pdict.get('file_suggestions', 'suggestions.json'))
+
+    if backend == 'json':
+        key = (backend, json_path)
+        if key not in _STORES:
+            _STORES[key] = JsonSuggestionStore(json_path)
+        return _STORES[key]
+
+    db_path = os.path.join(basedir, pdict.get('file_suggestions_db', 'suggestions.db'))
+    key = (backend, db_path)
+    if key not in _STORES:
+        store = SQLiteSuggestionStore(db_path)
+        # first start with the SQLite backend: take over the existing JSON suggestions
+        if os.path.exists(json_path):
+            import_json_suggestions(store, json_path)
+        _STORES[key] = store
+    return _STORES[key]
+
+
+def new_suggestion(suggestion):
+    """Suggestion dict with timestamp and review fields initialized"""
+    return dict(
+        suggestion,
+        timestamp=datetime.now().isoformat(),
+        status='pending',  # pending, approved, rejected
+        reviewed_by=None,
+        review_date=None,
+        review_notes=None,
+    )
+
+
+if __name__ == "__main__":
+    # python -m core.suggestions import [suggestions.json]
+    if len(sys.argv) >= 2 and sys.argv[1] == 'import':
+        from config import pdict
+        src = sys.argv[2] if len(sys.argv) > 2 else os.path.join(basedir, pdict.get('file_suggestions', 'suggestions.json'))
+        db_path = os.path.join(basedir, pdict.get('file_suggestions_db', 'suggestions.db'))
+        n = import_json_suggestions(SQLiteSuggestionStore(db_path), src)
+        print(f"Imported {n} suggestions from {src} into {db_path}")
+    else:
+        print("Usage: python -m core.suggestions import [suggestions.json]")
@@ -0,0 +1,120 @@
+import os
+import math
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import geopandas                     as gpd
+import openpyxl
+
+
+# Berlin bounding box (lon_min, lat_min, lon_max, lat_max) and the PLZ window kept by preprop_lstat
+BERLIN_BBOX = (13.08, 52.33, 13.77, 52.68)
+GERMANY_BBOX = (5.9, 47.3, 15.0, 55.0)
+PLZ_WINDOW = (10116, 14199)
+
+REGISTRY_COLUMNS = ['Ladeeinrichtungs-ID', 'Betreiber', 'Nennleistung Ladeeinrichtung [kW]', 'Status',
+                    'Postleitzahl', 'Ort', 'Bundesland', 'Breitengrad', 'Längengrad']
+OTHER_LAENDER = ['Bayern', 'Baden-Württemberg', 'Nordrhein-Westfalen', 'Niedersachsen', 'Hessen', 'Hamburg']
+KW_CHOICES = np.array([11.0, 22.0, 50.0, 150.0, 300.0])
+
+
+def _grid_shape(n_cells, bbox):
+    """Columns and rows of a grid with at least n_cells roughly square cells over bbox"""
+    width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    cols = max(1, int(math.ceil(math.sqrt(n_cells * width / height))))
+    rows = int(math.ceil(n_cells / cols))
+    return cols, rows
+
+
+def synthetic_plz_grid(n_plz, bbox=BERLIN_BBOX):
+    """GeoDataFrame (PLZ, geometry) of n_plz rectangular cells over bbox, PLZ spread over the Berlin window"""
+    if n_plz > PLZ_WINDOW[1] - PLZ_WINDOW[0] + 1:
+        raise ValueError(f"At most {PLZ_WINDOW[1] - PLZ_WINDOW[0] + 1} PLZ fit into the window {PLZ_WINDOW}")
+    cols, rows = _grid_shape(n_plz, bbox)
+    dx = (bbox[2] - bbox[0]) / cols
+    dy = (bbox[3] - bbox[1]) / rows
+    i = np.arange(n_plz)
+    x0 = bbox[0] + (i % cols) * dx
+    y0 = bbox[1] + (i // cols) * dy
+    plz = np.linspace(PLZ_WINDOW[0], PLZ_WINDOW[1], n_plz).astype('int64')
+    return gpd.GeoDataFrame({'PLZ': plz}, geometry=shapely.box(x0, y0, x0 + dx, y0 + dy), crs='EPSG:4326')
+
+
+def synthetic_registry(n_stations, gdf_plz, berlin_share=0.1, seed=0):
+    """Registry rows in the Ladesaeulenregister layout; Berlin stations lie inside the cell of their PLZ"""
+    rng = np.random.default_rng(seed)
+    n_berlin = int(round(n_stations * berlin_share))
+    n_other = n_stations - n_berlin
+
+    # Berlin: random cell, uniform position inside it
+    cell = rng.integers(0, len(gdf_plz), n_berlin)
+    bounds = shapely.bounds(gdf_plz.geometry.values)[cell]
+    lon = np.concatenate([rng.uniform(bounds[:, 0], bounds[:, 2]), rng.uniform(GERMANY_BBOX[0], GERMANY_BBOX[2], n_other)])
+    lat = np.concatenate([rng.uniform(bounds[:, 1], bounds[:, 3]), rng.uniform(GERMANY_BBOX[1], GERMANY_BBOX[3], n_other)])
+    plz = np.concatenate([gdf_plz['PLZ'].to_numpy()[cell], rng.integers(20000, 99999, n_other)])
+    land = np.concatenate([np.full(n_berlin, 'Berlin', dtype=object), rng.choice(OTHER_LAENDER, n_other).astype(object)])
+
+    order = rng.permutation(n_stations)
+    return pd.DataFrame({
+        'Ladeeinrichtungs-ID': np.arange(1, n_stations + 1),
+        'Betreiber': 'Synthetic',
+        'Nennleistung Ladeeinrichtung [kW]': rng.choice(KW_CHOICES, n_stations),
+        'Status': 'In Betrieb',
+        'Postleitzahl': plz[order],
+        'Ort': np.where(land[order] == 'Berlin', 'Berlin', 'Ort'),
+        'Bundesland': land[order],
+        'Breitengrad': lat[order].round(6),
+        'Längengrad': lon[order].round(6),
+    }, columns=REGISTRY_COLUMNS)
+
+
+def synthetic_residents(gdf_plz, seed=0):
+    """Residents per PLZ in the layout returned by core.residents.load_residents (plz, einwohner, lat, lon)"""
+    rng = np.random.default_rng(seed)
+    centroids = shapely.centroid(gdf_plz.geometry.values)
+    return pd.DataFrame({
+        'plz': gdf_plz['PLZ'].to_numpy(),
+        'einwohner': rng.integers(500, 40000, len(gdf_plz)),
+        'lat': shapely.get_y(centroids),
+        'lon': shapely.get_x(centroids),
+    })
+
+
+# -----------------------------------------------------------------------------
+def write_registry(df, path):
+    """Writes a registry CSV like the original: metadata lines, ';' separated, comma decimals, latin1"""
+    with open(path, 'w', encoding='latin1', newline='') as fh:
+        fh.write('Ladesäulenregister (synthetisch);;;\nStand: Benchmark;;;\n;;;\n')
+        df.to_csv(fh, sep=';', index=False, decimal=',')
+    return path
+
+
+def write_plz_geodata(gdf, path):
+    """Writes PLZ polygons as 'PLZ;geometry' CSV with WKT, like geodata_berlin_plz.csv"""
+    pd.DataFrame({'PLZ': gdf['PLZ'], 'geometry': shapely.to_wkt(gdf.geometry.values)}).to_csv(path, sep=';', index=False)
+    return path
+
+
+def write_residents_xlsx(df_residents, path):
+    """Writes residents as sheet 'T14' of an Excel workbook (two title rows, then the header)"""
+    workbook = openpyxl.Workbook(write_only=True)
+    ws = workbook.create_sheet('T14')
+    ws.append(['Einwohnerinnen und Einwohner nach Postleitzahl (synthetisch)'])
+    ws.append([])
+    ws.append(['Postleitzahl', 'Bezirk', 'Insgesamt'])
+    for plz, einwohner in zip(df_residents['plz'], df_residents['einwohner']):
+        ws.append([int(plz), 'Synthetisch', int(einwohner)])
+    workbook.save(path)
+    return path
+
+
+def write_dataset(out_dir, n_stations, n_plz, berlin_share=0.1, seed=0):
+    """Writes a complete synthetic dataset (registry, PLZ geodata, residents workbook); returns the paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    gdf_plz = synthetic_plz_grid(n_plz)
+    return {
+        'lstat': write_registry(synthetic_registry(n_stations, gdf_plz, berlin_share, seed),
+                                os.path.join(out_dir, f'Ladesaeulenregister_{n_stations}.csv')),
+        'geodata_plz': write_plz_geodata(gdf_plz, os.path.join(out_dir, f'geodata_plz_{n_plz}.csv')),
+        'residents': write_residents_xlsx(synthetic_residents(gdf_plz, seed), os.path.join(out_dir, f'plz_einwohner_{n_plz}.xlsx')),
+    }
@@ -0,0 +1,427 @@
+import os
+import re
+import sys
+import json
+import gzip
+import math
+import struct
+import sqlite3
+import hashlib
+import threading
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import geopandas                     as gpd
+import core.HelperTools              as ht
+import core.geodata                  as gd
+
+
+# Mapbox Vector Tile v2: tile coordinates 0..EXTENT, clipped with a BUFFER margin to avoid seams
+EXTENT = 4096
+BUFFER = 64
+ORIGIN = math.pi * 6378137          # half the width of the Web Mercator world in meters
+WORLD = 2 * ORIGIN
+
+GEOM_POLYGON = 3
+CMD_MOVE_TO, CMD_LINE_TO, CMD_CLOSE_PATH = 1, 2, 7
+
+
+# -----------------------------------------------------------------------------
+# Protobuf wire format (only what vector_tile.proto needs)
+def _varint(value, out):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _field_key(field, wire_type, out):
+    _varint((field << 3) | wire_type, out)
+
+
+def _varint_field(field, value, out):
+    _field_key(field, 0, out)
+    _varint(value, out)
+
+
+def _bytes_field(field, data, out):
+    _field_key(field, 2, out)
+    _varint(len(data), out)
+    out.extend(data)
+
+
+def _packed_field(field, values, out):
+    buf = bytearray()
+    for value in values:
+        _varint(value, buf)
+    _bytes_field(field, buf, out)
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _command(cmd, count):
+    return (cmd & 0x7) | (count << 3)
+
+
+def _encode_value(value):
+    """Tile.Value message of one property value"""
+    out = bytearray()
+    if isinstance(value, (bool, np.bool_)):
+        _varint_field(7, int(value), out)
+    elif isinstance(value, (int, np.integer)):
+        if value >= 0:
+            _varint_field(5, int(value), out)
+        else:
+            _varint_field(6, _zigzag(int(value)), out)
+    elif isinstance(value, (float, np.floating)):
+        _field_key(3, 1, out)
+        out.extend(struct.pack('<d', float(value)))
+    else:
+        _bytes_field(1, str(value).encode('utf-8'), out)
+    return bytes(out)
+
+
+# -----------------------------------------------------------------------------
+# Geometry encoding
+def _signed_area(pts):
+    """Surveyor's formula in tile coordinates (y down): positive for exterior rings"""
+    x, y = pts[:, 0], pts[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _encode_ring(coords, exterior, cursor, out):
+    """Appends MoveTo/LineTo/ClosePath of one ring; returns the new cursor (rings that collapsed are skipped)"""
+    pts = coords[:-1].astype(np.int64)
+    if len(pts) == 0:
+        return cursor
+    keep = np.ones(len(pts), dtype=bool)
+    keep[1:] = np.any(pts[1:] != pts[:-1], axis=1)
+    pts = pts[keep]
+    if len(pts) > 1 and (pts[-1] == pts[0]).all():
+        pts = pts[:-1]
+    if len(pts) < 3:
+        return cursor
+    area = _signed_area(pts)
+    if area == 0:
+        return cursor
+    if (area > 0) != exterior:
+        pts = pts[::-1]
+
+    deltas = np.diff(np.vstack([cursor, pts]), axis=0)
+    zz = ((deltas << 1) ^ (deltas >> 63)).ravel().tolist()
+    out.append(_command(CMD_MOVE_TO, 1))
+    out.extend(zz[:2])
+    out.append(_command(CMD_LINE_TO, len(pts) - 1))
+    out.extend(zz[2:])
+    out.append(_command(CMD_CLOSE_PATH, 1))
+    return pts[-1]
+
+
+def encode_polygon_geometry(geom):
+    """Command integers of a (multi)polygon already in integer tile coordinates"""
+    commands = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for poly in shapely.get_parts(geom):
+        if shapely.get_type_id(poly) != 3 or poly.is_empty:
+            continue
+        n_before = len(commands)
+        cursor = _encode_ring(shapely.get_coordinates(poly.exterior), True, cursor, commands)
+        if len(commands) == n_before:
+            continue  # exterior collapsed at this zoom: drop its holes too
+        for ring in poly.interiors:
+            cursor = _encode_ring(shapely.get_coordinates(ring), False, cursor, commands)
+    return commands
+
+
+def encode_layer(name, features):
+    """Tile.Layer message; features are (geometry commands, properties dict) pairs"""
+    keys, values = {}, {}
+    body = bytearray()
+    for commands, properties in features:
+        tags = []
+        for k, v in properties.items():
+            if v is None or (isinstance(v, float) and math.isnan(v)):
+                continue
+            encoded = _encode_value(v)
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault(encoded, len(values)))
+        feature = bytearray()
+        _packed_field(2, tags, feature)
+        _varint_field(3, GEOM_POLYGON, feature)
+        _packed_field(4, commands, feature)
+        _bytes_field(2, feature, body)
+
+    layer = bytearray()
+    _varint_field(15, 2, layer)
+    _bytes_field(1, name.encode('utf-8'), layer)
+    layer.extend(body)
+    for k in keys:
+        _bytes_field(3, k.encode('utf-8'), layer)
+    for v in values:
+        _bytes_field(4, v, layer)
+    _varint_field(5, EXTENT, layer)
+    return bytes(layer)
+
+
+def encode_tile(layers):
+    """Tile message of (layer name, features) pairs; layers without features are left out"""
+    tile = bytearray()
+    for name, features in layers:
+        if features:
+            _bytes_field(3, encode_layer(name, features), tile)
+    return bytes(tile)
+
+
+# -----------------------------------------------------------------------------
+# Tile grid
+def tile_size_m(z):
+    return WORLD / (1 << z)
+
+
+def tile_bounds_m(x, y, z):
+    """(minx, miny, maxx, maxy) of an XYZ tile in Web Mercator meters"""
+    size = tile_size_m(z)
+    minx = -ORIGIN + x * size
+    maxy = ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_range(bounds_m, z):
+    """XYZ tile columns and rows covering Web Mercator bounds"""
+    n = 1 << z
+    size = tile_size_m(z)
+    clamp = lambda v: min(max(int(math.floor(v)), 0), n - 1)
+    x0, x1 = clamp((bounds_m[0] + ORIGIN) / size), clamp((bounds_m[2] + ORIGIN) / size)
+    y0, y1 = clamp((ORIGIN - bounds_m[3]) / size), clamp((ORIGIN - bounds_m[1]) / size)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def _properties(gdf):
+    """Feature properties as plain Python values, one dict per row"""
+    cols = [c for c in gdf.columns if c != gdf.geometry.name]
+    return gdf[cols].to_dict('records')
+
+
+@ht.timer
+def build_mbtiles(layers, path, minzoom=8, maxzoom=14, name='heatmap', data_version=''):
+    """Writes MVT tiles of {layer name: GeoDataFrame} for every zoom into an MBTiles (SQLite) file"""
+    merc = {n: gdf.to_crs(epsg=3857) for n, gdf in layers.items()}
+    props = {n: _properties(gdf) for n, gdf in merc.items()}
+    bounds_m = np.array([gdf.total_bounds for gdf in merc.values()])
+    bounds_m = (bounds_m[:, 0].min(), bounds_m[:, 1].min(), bounds_m[:, 2].max(), bounds_m[:, 3].max())
+
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    con = sqlite3.connect(tmp)
+    n_tiles = 0
+    try:
+        con.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        con.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+        con.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+
+        for z in range(minzoom, maxzoom + 1):
+            size = tile_size_m(z)
+            margin = size * BUFFER / EXTENT
+            # simplify once per zoom to one tile unit, then clip per tile
+            simplified = {n: shapely.simplify(gdf.geometry.values, size / EXTENT, preserve_topology=True) for n, gdf in merc.items()}
+            trees = {n: shapely.STRtree(geoms) for n, geoms in simplified.items()}
+            xs, ys = tile_range(bounds_m, z)
+            rows = []
+            for x in xs:
+                for y in ys:
+                    minx, miny, maxx, maxy = tile_bounds_m(x, y, z)
+                    tile_layers = []
+                    for n, geoms in simplified.items():
+                        idx = trees[n].query(shapely.box(minx - margin, miny - margin, maxx + margin, maxy + margin))
+                        features = []
+                        if len(idx):
+                            clipped = shapely.clip_by_rect(geoms[idx], minx - margin, miny - margin, maxx + margin, maxy + margin)
+                            local = shapely.transform(clipped, lambda c: np.round(np.column_stack([
+                                (c[:, 0] - minx) / size * EXTENT, (maxy - c[:, 1]) / size * EXTENT])))
+                            for i, geom in zip(idx, local):
+                                if geom is None or geom.is_empty:
+                                    continue
+                                commands = encode_polygon_geometry(geom)
+                                if commands:
+                                    features.append((commands, props[n][i]))
+                        tile_layers.append((n, features))
+                    data = encode_tile(tile_layers)
+                    if data:
+                        # MBTiles rows are TMS: y counted from the south
+                        rows.append((z, x, (1 << z) - 1 - y, gzip.compress(data)))
+            con.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)", rows)
+            n_tiles += len(rows)
+
+        bounds_ll = gpd.GeoSeries([shapely.box(*bounds_m)], crs='EPSG:3857').to_crs(epsg=4326).total_bounds
+        vector_layers = [{
+            'id': n,
+            'fields': {c: 'Number' if pd.api.types.is_numeric_dtype(gdf[c]) else 'String'
+                       for c in gdf.columns if c != gdf.geometry.name},
+            'minzoom': minzoom, 'maxzoom': maxzoom,
+        } for n, gdf in layers.items()]
+        metadata = {
+            'name': name, 'format': 'pbf', 'type': 'overlay', 'version': '1',
+            'minzoom': str(minzoom), 'maxzoom': str(maxzoom),
+            'bounds': ','.join(f"{v:.6f}" for v in bounds_ll),
+            'center': f"{(bounds_ll[0] + bounds_ll[2]) / 2:.6f},{(bounds_ll[1] + bounds_ll[3]) / 2:.6f},{minzoom}",
+            'json': json.dumps({'vector_layers': vector_layers}),
+            'data_version': data_version,
+        }
+        con.executemany("INSERT INTO metadata VALUES (?, ?)", list(metadata.items()))
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, path)
+    print(f"{n_tiles} tiles written to {path}")
+    return path
+
+
+def read_metadata(path):
+    """MBTiles metadata as a dict, empty if the file is missing"""
+    if not os.path.exists(path):
+        return {}
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return dict(con.execute("SELECT name, value FROM metadata").fetchall())
+    finally:
+        con.close()
+
+
+def read_tile(path, z, x, y):
+    """Gzipped tile data of an XYZ tile, None if there is no tile"""
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        row = con.execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                          (z, x, (1 << z) - 1 - y)).fetchone()
+    finally:
+        con.close()
+    return row[0] if row else None
+
+
+# -----------------------------------------------------------------------------
+# Heatmap tiles of the pipeline
+def get_tiles_path(pdict):
+    """MBTiles file of the heatmap layers (inside the cache folder)"""
+    tiles_dir = os.path.join(gd.get_cache_dir(pdict), 'tiles')
+    os.makedirs(tiles_dir, exist_ok=True)
+    return os.path.join(tiles_dir, 'heatmap.mbtiles')
+
+
+def heatmap_tile_layers(data, pdict):
+    """{'plz': PLZ polygons with every layer's values and fill colors, 'bezirke': Bezirk outlines}"""
+    import core.methods as m1
+    features, _, _, _ = m1.combined_features(data['df_lstat2'], m1.with_coverage(data['gdf_residents2'], data.get('coverage')))
+    layers = {'plz': features}
+    path_dis = data['paths'].get('geodata_dis') or os.path.join(data['paths']['datasets_dir'],
+                                                                 pdict.get('file_geodat_dis', 'geodata_berlin_dis.csv'))
+    if os.path.exists(path_dis):
+        gdf_dis = gd.load_geodata_dis(path_dis, pdict)
+        layers['bezirke'] = gpd.GeoDataFrame({'Bezirk': gdf_dis['Bezirk'].astype(str)}, geometry=gdf_dis.geometry.values, crs=gdf_dis.crs)
+    return layers
+
+
+def _layers_version(layers, minzoom, maxzoom):
+    h = hashlib.sha1(f"{minzoom}-{maxzoom}".encode())
+    for n, gdf in layers.items():
+        h.update(n.encode())
+        h.update(gdf.drop(columns=gdf.geometry.name).to_json().encode())
+        h.update(b''.join(shapely.to_wkb(gdf.geometry.values)))
+    return h.hexdigest()[:16]
+
+
+def ensure_heatmap_tiles(data, pdict):
+    """Builds the heatmap MBTiles unless the existing file was built from the same data; returns its path"""
+    path = get_tiles_path(pdict)
+    minzoom, maxzoom = pdict.get('tiles_minzoom', 8), pdict.get('tiles_maxzoom', 14)
+    layers = heatmap_tile_layers(data, pdict)
+    version = _layers_version(layers, minzoom, maxzoom)
+    if read_metadata(path).get('data_version') != version:
+        build_mbtiles(layers, path, minzoom=minzoom, maxzoom=maxzoom, data_version=version)
+    return path
+
+
+# -----------------------------------------------------------------------------
+# Local tile server
+_TILE_ROUTE = re.compile(r'^/tiles/(\d+)/(\d+)/(\d+)\.pbf$')
+_TILE_SERVERS = {}
+
+
+def make_tile_handler(path):
+    """HTTP handler serving /tiles/{z}/{x}/{y}.pbf and /tiles.json from an MBTiles file"""
+    from http.server import BaseHTTPRequestHandler
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body=b'', headers=None):
+            self.send_response(status)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            route = self.path.split('?')[0]
+            match = _TILE_ROUTE.match(route)
+            if match:
+                z, x, y = (int(v) for v in match.groups())
+                data = read_tile(path, z, x, y)
+                if data is None:
+                    return self._send(204)
+                return self._send(200, data, {'Content-Type': 'application/x-protobuf', 'Content-Encoding': 'gzip',
+                                              'Cache-Control': 'public, max-age=3600'})
+            if route == '/tiles.json':
+                meta = read_metadata(path)
+                host = self.headers.get('Host', f"localhost:{self.server.server_port}")
+                tilejson = {
+                    'tilejson': '3.0.0', 'name': meta.get('name'),
+                    'tiles': [f"http://{host}/tiles/{{z}}/{{x}}/{{y}}.pbf"],
+                    'minzoom': int(meta.get('minzoom', 0)), 'maxzoom': int(meta.get('maxzoom', 14)),
+                    'bounds': [float(v) for v in meta.get('bounds', '-180,-85,180,85').split(',')],
+                    'vector_layers': json.loads(meta.get('json', '{}')).get('vector_layers', []),
+                }
+                return self._send(200, json.dumps(tilejson).encode('utf-8'), {'Content-Type': 'application/json'})
+            return self._send(404)
+
+        def log_message(self, *args):
+            pass
+
+    return TileHandler
+
+
+def start_tile_server(path, host='127.0.0.1', port=8090):
+    """Serves the MBTiles file on a background thread, once per process and port"""
+    from http.server import ThreadingHTTPServer
+    if port in _TILE_SERVERS:
+        return _TILE_SERVERS[port]
+    try:
+        server = ThreadingHTTPServer((host, port), make_tile_handler(path))
+    except OSError as e:
+        print(f"Tile server not started on {host}:{port} ({e})")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _TILE_SERVERS[port] = server
+    return server
+
+
+if __name__ == "__main__":
+    # python -m core.tiles build | serve [port]
+    from config import pdict
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    if command == 'build':
+        import main
+        ensure_heatmap_tiles(main.load_data(), pdict)
+    elif command == 'serve':
+        from http.server import ThreadingHTTPServer
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else pdict.get('tile_server_port', 8090)
+        path = get_tiles_path(pdict)
+        if not os.path.exists(path):
+            import main
+            ensure_heatmap_tiles(main.load_data(), pdict)
+        print(f"Serving {path} on http://127.0.0.1:{port}/tiles/{{z}}/{{x}}/{{y}}.pbf")
+        ThreadingHTTPServer(('127.0.0.1', port), make_tile_handler(path)).serve_forever()
+    else:
+        print("Usage: python -m core.tiles build|serve [port]")
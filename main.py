@@ -1,10 +1,19 @@
 import os
-import io
+import time
+from types                           import MappingProxyType
 import pandas                        as pd
-import geopandas                     as gpd
-from shapely.geometry                import Point
+import streamlit                     as st
 from core import methods             as m1
 from core import HelperTools         as ht
+from core import geodata             as gd
+from core import registry            as rg
+from core import instrumentation     as ins
+from core import tiles               as tl
+from core import hexgrid             as hx
+from core import raster              as rr
+from core import recommend           as rc
+from core import regions             as rn
+from core import deltas              as dl
 
 from config                          import pdict
 
@@ -19,255 +28,145 @@ def _read_csv_with_header_detection(path, sep=';'):
     Find a header row by scanning for a line that contains expected column names
     (like 'Ladeeinrichtungs-ID' or 'Postleitzahl') and use that as header.
     """
-    with open(path, 'r', encoding='latin1') as fh:
-        header_row = 0
-        for i, line in enumerate(fh):
-            if 'Ladeeinrichtungs-ID' in line or 'Postleitzahl' in line or (line.count(sep) > 1 and 'Postleitzahl' in line):
-                header_row = i
-                break
-
+    header_row = rg.detect_header_row(path, sep=sep)
     df = pd.read_csv(path, sep=sep, header=header_row, encoding='latin1')
     return df
 
 
+@ht.timer
+def load_data(region=None):
+    """Loads and preprocesses all datasets of a region; stage results come from the artifact cache while inputs are unchanged"""
+    return rn.preprocess_region(rn.get_region(pdict, region), pdict)
+
+
+# Last scan of every datasets folder: path -> (monotonic time, version)
+_DATASETS_VERSION = {}
+
+
+def datasets_version(datasets_dir=None):
+    """(path, mtime_ns, size) of every file below datasets/, changes whenever an input file is edited or replaced"""
+    datasets_dir = datasets_dir or os.path.join(basedir, 'datasets')
+    # the folder is scanned at most once per datasets_check_s seconds, reruns in between reuse the last scan
+    checked = _DATASETS_VERSION.get(datasets_dir)
+    if checked is not None and time.monotonic() - checked[0] < pdict.get('datasets_check_s', 5):
+        return checked[1]
+    version = []
+    for root, _, files in os.walk(datasets_dir):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            version.append((os.path.relpath(os.path.join(root, name), datasets_dir), stat.st_mtime_ns, stat.st_size))
+    _DATASETS_VERSION[datasets_dir] = (time.monotonic(), tuple(sorted(version)))
+    return _DATASETS_VERSION[datasets_dir][1]
+
+
+@st.cache_resource(max_entries=1, show_spinner="Preprocessing regions ...")
+def _preprocessed_regions(version):
+    """Available regions of one datasets version; the ones missing from the artifact cache are preprocessed in parallel"""
+    names = rn.available_regions(pdict)
+    if len(names) > 1:
+        # one registry pass and a process pool instead of one region after the other on first use
+        rn.preprocess_regions(pdict, names, keep=False)
+    return tuple(names)
+
+
+# one context per region and datasets version (least recently used contexts are dropped)
+@st.cache_resource(max_entries=max(len(rn.region_definitions(pdict)), 1), show_spinner="Loading datasets ...")
+def _shared_data_context(version, region=None):
+    """Data context of one region and datasets version, loaded once per process and shared by all sessions and reruns"""
+    data = load_data(region)
+    definition = rn.get_region(pdict, region)
+    data['definition'] = definition
+    bbox = data['plz_index']['bbox']
+    data['center'] = tuple(definition['center'] or ((bbox[:, 1].min() + bbox[:, 3].max()) / 2,
+                                                    (bbox[:, 0].min() + bbox[:, 2].max()) / 2))
+
+    # 6) Simplified PLZ polygons for the map zoom (cached per simplification level)
+    zoom = pdict.get('map_zoom', 10)
+    data['df_geodat_plz_display'] = gd.load_simplified_geodata(data['paths']['geodata_plz'], pdict, zoom)
+    data['zoom'] = zoom
+    data['version'] = version
+
+    # Demand metrics from the registry state, recomputed for the PLZ the last refresh touched (seeds the memo)
+    if data['registry_update'] is not None:
+        dl.refresh_demand(data['registry_update'], data['gdf_residents2'], pdict, data['slug'])
+
+    # Hexagon grid levels of this version (artifacts on disk, so a restart only reads them)
+    data['hex_pyramid'] = hx.load_hex_pyramid(data, pdict) if pdict.get('hex_resolutions') else None
+
+    # Nearest-station coverage per PLZ (artifact, recomputed with every registry or residents change)
+    data['coverage'], data['coverage_bezirk'] = None, None
+    if pdict.get('coverage_layer', True):
+        data['coverage'], data['coverage_bezirk'] = rr.load_coverage(data, pdict)
+
+    # Site recommender over the resident raster and the stations of this version
+    data['recommender'] = rc.load_recommender(data, pdict) if pdict.get('recommend_sites', True) else None
+
+    # Vector tiles of this version (rebuilt only when the layer data changed) and their local server;
+    # the tile server holds the default region, other regions are drawn inline
+    data['tile_url'] = None
+    if pdict.get('map_source', 'inline') == 'tiles' and definition['name'] == rn.get_region(pdict)['name']:
+        tl.start_tile_server(tl.ensure_heatmap_tiles(data, pdict), port=pdict.get('tile_server_port', 8090))
+        data['tile_url'] = pdict.get('tile_url')
+
+    # Read-only view: sessions share these frames, nobody may modify them in place
+    return MappingProxyType(data)
+
+
+def get_data_context(region=None):
+    """Shared data context of a region; a changed file in datasets/ gives a new version and triggers a reload"""
+    return _shared_data_context(datasets_version(), region)
+
+
+def invalidate_data_context():
+    """Drops the shared data context and the derived in-process caches; the next access rescans datasets/ and reloads"""
+    _DATASETS_VERSION.clear()
+    _shared_data_context.clear()
+    _preprocessed_regions.clear()
+    m1._DEMAND_CACHE.clear()
+
+
+def _session_id():
+    """Id of the Streamlit session running this script, None outside Streamlit"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+    return ctx.session_id if ctx is not None else None
+
+
 @ht.timer
 def main():
-    """Main: Generation of Streamlit App for visualizing electric charging stations & residents in Berlin"""
-
-    # Paths
-    datasets_dir = os.path.join(basedir, 'datasets')
-    path_geodata_plz = os.path.join(datasets_dir, pdict.get('file_geodat_plz', 'geodata_berlin_plz.csv'))
-    path_lstat = os.path.join(datasets_dir, pdict.get('file_lstations', 'Ladesaeulenregister.csv'))
-
-    # config may point to a CSV but repo contains an Excel file — try config path first then fallback
-    residents_file_cfg = pdict.get('file_residents', 'plz_einwohner.csv')
-    path_residents = os.path.join(datasets_dir, residents_file_cfg)
-    if not os.path.exists(path_residents):
-        alt = os.path.join(datasets_dir, 'plz_einwohner.xlsx')
-        if os.path.exists(alt):
-            path_residents = alt
-
-    # 1) Load geodata (PLZ polygons)
-    df_geodat_plz = pd.read_csv(path_geodata_plz, sep=';')
-
-    # 2) Load charging stations CSV (robust header detection because file contains metadata lines)
-    df_lstat = _read_csv_with_header_detection(path_lstat, sep=';')
-
-    # 3) Preprocess charging stations and count per PLZ
-    gdf_lstat3 = m1.preprop_lstat(df_lstat, df_geodat_plz, pdict)
-    df_lstat2 = m1.count_plz_occurrences(gdf_lstat3)
-
-    # 4) Load residents data (Excel or CSV).
-    df_residents = None
-    if path_residents.lower().endswith(('.xlsx', '.xls')):
-        # Try to find PLZ-level table in sheet 'T14' first using header detection
-        try:
-            raw = pd.read_excel(path_residents, sheet_name='T14', header=None, engine='openpyxl')
-            header_row = None
-            for i in range(min(10, len(raw))):
-                vals = raw.iloc[i].astype(str).str.strip().str.lower().tolist()
-                if 'postleitzahl' in vals and any('ins' in v or 'gesamt' in v for v in vals):
-                    header_row = i
-                    break
-            if header_row is None:
-                header_row = 2
-            df_t14 = pd.read_excel(path_residents, sheet_name='T14', header=header_row, engine='openpyxl')
-        except Exception:
-            df_t14 = None
-
-        if df_t14 is not None:
-            # detect the PLZ and total columns
-            cols_low = {c: str(c).strip().lower() for c in df_t14.columns}
-            plz_col = None
-            total_col = None
-            for c, lc in cols_low.items():
-                if 'postleitzahl' in lc or lc == 'plz' or 'postleitzahl' in str(c).lower():
-                    plz_col = c
-                if 'insgesamt' in lc or lc == 'ins-' or 'gesamt' in lc or 'in insgesamt' in lc:
-                    total_col = c
-
-            if plz_col is not None and total_col is not None:
-                df_res = df_t14[[plz_col, total_col]].copy()
-                df_res.columns = ['plz', 'einwohner']
-                df_res['plz'] = df_res['plz'].astype(str).str.extract(r'(\d{5})')[0]
-                df_res['plz'] = pd.to_numeric(df_res['plz'], errors='coerce')
-                # einwohner is numeric from Excel; convert directly without regex (regex removes decimal points)
-                df_res['einwohner'] = pd.to_numeric(df_res['einwohner'], errors='coerce').fillna(0).astype(int)
-                # Note: T14 lists each PLZ once per district. Each row is a unique (PLZ, district) entry.
-                # Do NOT aggregate—sum of all rows = expected total.
-                df_residents = df_res.dropna(subset=['plz'])
-
-                # attach PLZ centroid lat/lon
-                df_geodat_plz_loc = df_geodat_plz.copy()
-                df_geodat_plz_loc['geometry'] = gpd.GeoSeries.from_wkt(df_geodat_plz_loc['geometry'])
-                gdf_plz = gpd.GeoDataFrame(df_geodat_plz_loc, geometry='geometry')
-                try:
-                    gdf_plz.set_crs(epsg=4326, inplace=True)
-                except Exception:
-                    gdf_plz.crs = 'EPSG:4326'
-                gdf_plz['centroid'] = gdf_plz.geometry.centroid
-                merged_plz = df_residents.merge(gdf_plz[['PLZ', 'centroid']], left_on='plz', right_on='PLZ', how='left')
-                merged_plz['lat'] = merged_plz['centroid'].apply(lambda g: g.y if g is not None else None)
-                merged_plz['lon'] = merged_plz['centroid'].apply(lambda g: g.x if g is not None else None)
-                df_residents = merged_plz[['plz', 'einwohner', 'lat', 'lon']].copy()
-
-    # If T14 failed or is not present, fall back to older logic (CSV or T5 Bezirke totals)
-    if df_residents is None:
-        if path_residents.lower().endswith(('.xlsx', '.xls')):
-            df_read = pd.read_excel(path_residents, engine='openpyxl')
-        else:
-            df_read = pd.read_csv(path_residents, sep=';')
-
-        # normalize column names to lower-case keys
-        col_map = {c: c.strip().lower() for c in df_read.columns}
-        df_read.rename(columns=col_map, inplace=True)
-
-        # detect if this is a Bezirke summary (T5)
-        cols = list(df_read.columns)
-        if any('bezirk' in str(c).lower() for c in cols) or all(str(c).lower().startswith('unnamed') or str(c).strip()=='' for c in cols):
-            try:
-                df_t5 = pd.read_excel(path_residents, sheet_name='T5', header=2, engine='openpyxl')
-            except Exception:
-                df_t5 = pd.read_excel(path_residents, sheet_name='T5', header=None, engine='openpyxl')
-
-            # find district and total columns
-            tcols = {c: str(c).lower() for c in df_t5.columns}
-            district_col = None
-            total_col = None
-            for c, lc in tcols.items():
-                if 'bezirk' in lc or 'bezirk' in str(c).lower():
-                    district_col = c
-                if 'insgesamt' in lc or 'in insgesamt' in lc or 'gesamt' in lc or 'in insgesamt' in str(c).lower():
-                    total_col = c
-
-            if district_col is None:
-                district_col = df_t5.columns[0]
-            if total_col is None:
-                for c in df_t5.columns[1:]:
-                    if pd.to_numeric(df_t5[c], errors='coerce').notna().any():
-                        total_col = c
-                        break
-
-            if total_col is not None:
-                df_districts = df_t5[[district_col, total_col]].copy()
-                df_districts.columns = ['Bezirk', 'Einwohner_Bezirk']
-                df_districts = df_districts.dropna(subset=['Bezirk'])
-
-                # Read Bezirke shapefile and map Bezirke -> PLZ via PLZ centroids
-                bez_path = os.path.join(datasets_dir, 'berlin_bezirke', 'bezirksgrenzen.shp')
-                if os.path.exists(bez_path):
-                    gdf_bez = gpd.read_file(bez_path)
-                    if 'Gemeinde_n' in gdf_bez.columns:
-                        bez_name_col = 'Gemeinde_n'
-                    elif 'Gemeinde_s' in gdf_bez.columns:
-                        bez_name_col = 'Gemeinde_s'
-                    else:
-                        bez_name_col = None
-                        for c in gdf_bez.columns:
-                            if 'gemeinde' in str(c).lower() or 'bezirk' in str(c).lower() or 'name' in str(c).lower():
-                                bez_name_col = c
-                                break
-
-                    gdf_bez['bezirk_norm'] = gdf_bez[bez_name_col].astype(str).str.strip().str.lower()
-                    df_districts['bezirk_norm'] = df_districts['Bezirk'].astype(str).str.strip().str.lower()
-
-                    valid_bez = set(gdf_bez['bezirk_norm'].tolist())
-                    df_districts = df_districts[df_districts['bezirk_norm'].isin(valid_bez)].copy()
-
-                    df_geodat_plz_loc = df_geodat_plz.copy()
-                    df_geodat_plz_loc['geometry'] = gpd.GeoSeries.from_wkt(df_geodat_plz_loc['geometry'])
-                    gdf_plz = gpd.GeoDataFrame(df_geodat_plz_loc, geometry='geometry')
-                    try:
-                        gdf_plz.set_crs(epsg=4326, inplace=True)
-                    except Exception:
-                        gdf_plz.crs = 'EPSG:4326'
-                    gdf_plz['centroid'] = gdf_plz.geometry.centroid
-                    gdf_plz_centroids = gdf_plz.set_geometry('centroid')
-                    if gdf_plz_centroids.crs != gdf_bez.crs:
-                        gdf_plz_centroids = gdf_plz_centroids.to_crs(gdf_bez.crs)
-
-                    joined = gpd.sjoin(gdf_plz_centroids, gdf_bez.set_geometry('geometry'), how='left', predicate='within')
-                    joined['bezirk_norm'] = joined[bez_name_col].astype(str).str.strip().str.lower()
-
-                    plz_counts = joined.groupby('bezirk_norm').size().rename('n_plz').reset_index()
-                    merged = df_districts.merge(plz_counts, on='bezirk_norm', how='left')
-                    merged['Einwohner_Bezirk'] = merged['Einwohner_Bezirk'].astype(str).str.replace(r"[^0-9-]", "", regex=True)
-                    merged['Einwohner_Bezirk'] = pd.to_numeric(merged['Einwohner_Bezirk'], errors='coerce').fillna(0).astype(int)
-                    merged = merged.dropna(subset=['n_plz'])
-                    merged['einwohner_per_plz'] = (merged['Einwohner_Bezirk'] / merged['n_plz']).round().astype(int)
-                    joined2 = joined.merge(merged[['bezirk_norm', 'einwohner_per_plz']], on='bezirk_norm', how='left')
-                    df_residents = pd.DataFrame({
-                        'plz': joined2['PLZ'].astype(int),
-                        'einwohner': joined2['einwohner_per_plz'].fillna(0).astype(int),
-                        'lat': joined2['centroid'].y,
-                        'lon': joined2['centroid'].x
-                    })
-        else:
-            # Not T5 format; try to map common column names if present
-            df_read_cols = {c.lower(): c for c in df_read.columns}
-            # simple mapping
-            if 'postleitzahl' in df_read_cols and 'insgesamt' in df_read_cols:
-                df_tmp = df_read[[df_read_cols['postleitzahl'], df_read_cols['insgesamt']]].copy()
-                df_tmp.columns = ['plz', 'einwohner']
-                df_tmp['plz'] = df_tmp['plz'].astype(str).str.extract(r'(\d{5})')[0]
-                df_tmp['plz'] = pd.to_numeric(df_tmp['plz'], errors='coerce')
-                df_tmp['einwohner'] = df_tmp['einwohner'].astype(str).str.replace(r"[^0-9-]", "", regex=True)
-                df_tmp['einwohner'] = pd.to_numeric(df_tmp['einwohner'], errors='coerce').fillna(0).astype(int)
-                df_residents = df_tmp
-
-    # If still no df_residents, raise a clear error later when validating columns
-
-    # Try to map common variants to 'plz','einwohner','lat','lon'
-    mapper = {}
-    if 'plz' in df_residents.columns:
-        mapper['plz'] = 'plz'
-    else:
-        for c in df_residents.columns:
-            if 'plz' in c:
-                mapper[c] = 'plz'
-                break
-
-    if 'einwohner' in df_residents.columns:
-        mapper['einwohner'] = 'einwohner'
-    else:
-        for c in df_residents.columns:
-            if 'einw' in c:
-                mapper[c] = 'einwohner'
-                break
-
-    # lat / lon variants
-    lat_col = None
-    lon_col = None
-    for c in df_residents.columns:
-        if c in ('lat', 'breitengrad', 'latitude'):
-            lat_col = c
-        if c in ('lon', 'lng', 'longitude', 'längengrad'):
-            lon_col = c
-    if lat_col:
-        mapper[lat_col] = 'lat'
-    if lon_col:
-        mapper[lon_col] = 'lon'
-
-    # apply mapping (only keys that exist)
-    final_mapper = {k: v for k, v in mapper.items() if k in df_residents.columns}
-    if final_mapper:
-        df_residents.rename(columns=final_mapper, inplace=True)
-
-    # Ensure required columns exist; if not, raise informative error
-    required = {'plz', 'einwohner', 'lat', 'lon'}
-    if not required.issubset(set(df_residents.columns)):
-        missing = required - set(df_residents.columns)
-        raise RuntimeError(f"Residents file is missing required columns: {missing}. Columns found: {list(df_residents.columns)}")
-
-    # 5) Preprocess residents and attach geometries
-    gdf_residents2 = m1.preprop_resid(df_residents, df_geodat_plz, pdict)
-
-    # 6) Call Streamlit page builder
-    m1.make_streamlit_electric_Charging_resid(df_lstat2, gdf_residents2)
+    """Main: Generation of Streamlit App for visualizing electric charging stations & residents of a region"""
+    # The run's span carries the session, so slow stages can be traced to a user
+    ins.current_span().set(session=_session_id())
+    ins.start_metrics_server()
+
+    with ins.profiled('app_run'):
+        # Region of this session (the selector is shown once more than one region has its datasets)
+        regions = _preprocessed_regions(datasets_version())
+        default = rn.get_region(pdict)['name']
+        region = default
+        if len(regions) > 1:
+            region = st.sidebar.selectbox("Region", regions, key="region",
+                                          index=regions.index(default) if default in regions else 0)
+        data = get_data_context(region)
+
+        # 7) Call Streamlit page builder
+        m1.make_streamlit_electric_Charging_resid(data['df_lstat2'], data['gdf_residents2'], data['df_geodat_plz_display'],
+                                                 zoom_start=data['zoom'], plz_index=data['plz_index'],
+                                                 layer_switching=pdict.get('layer_switching', 'client'),
+                                                 tile_url=data['tile_url'], tiles_maxzoom=pdict.get('tiles_maxzoom', 14),
+                                                 hex_pyramid=data['hex_pyramid'], coverage=data['coverage'],
+                                                 coverage_bezirk=data['coverage_bezirk'], recommender=data['recommender'],
+                                                 center=data['center'], plz_window=data['definition']['resid_plz'],
+                                                 region_name=data['region'], on_reload=invalidate_data_context)
 
 
 if __name__ == "__main__":
     main()
+    if pdict.get('debug_panel', False):
+        m1.show_debug_panel(_session_id())
 
 # currentWorkingDirectory = "C:\\(...)\\project1"
 # #currentWorkingDirectory = "/mount/src/berlingeoheatmap1/"
@@ -0,0 +1,17 @@
+import os
+import sys
+
+# tests import the app modules (core.*, config) from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import shapely
+import geopandas                     as gpd
+
+
+@pytest.fixture
+def residents():
+    """Two adjacent ~700 m x 1100 m PLZ boxes in central Berlin"""
+    boxes = [shapely.box(13.40, 52.52, 13.41, 52.53), shapely.box(13.41, 52.52, 13.42, 52.53)]
+    return gpd.GeoDataFrame({'PLZ': [10115, 10117], 'Einwohner': [1000, 3000]}, geometry=boxes, crs='EPSG:4326')
+
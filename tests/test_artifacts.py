@@ -0,0 +1,59 @@
+import os
+import pandas                        as pd
+import core.artifacts                as ac
+
+
+def test_artifact_key_ignores_unrelated_config(tmp_path):
+    src = tmp_path / 'input.csv'
+    src.write_text('a;b\n1;2\n')
+    pdict = {'coverage_radius_m': 500, 'hex_resolutions': [250, 500]}
+    key = ac.artifact_key('coverage', [str(src)], pdict, 1, ['coverage_radius_m'], ['upstream'])
+
+    assert ac.artifact_key('coverage', [str(src)], dict(pdict, hex_resolutions=[1000]), 1,
+                           ['coverage_radius_m'], ['upstream']) == key
+    assert ac.artifact_key('coverage', [str(src)], dict(pdict, coverage_radius_m=300), 1,
+                           ['coverage_radius_m'], ['upstream']) != key
+    assert ac.artifact_key('coverage', [str(src)], pdict, 2, ['coverage_radius_m'], ['upstream']) != key
+    assert ac.artifact_key('coverage', [str(src)], pdict, 1, ['coverage_radius_m'], ['other']) != key
+    os.utime(src, (0, 0))  # touched, same content
+    assert ac.artifact_key('coverage', [str(src)], pdict, 1, ['coverage_radius_m'], ['upstream']) == key
+    src.write_text('a;b\n1;3\n')
+    assert ac.artifact_key('coverage', [str(src)], pdict, 1, ['coverage_radius_m'], ['upstream']) != key
+
+
+def test_cached_stage_computes_once(tmp_path):
+    pdict = {'cachefolder': str(tmp_path)}
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return pd.DataFrame({'PLZ': [10115, 10117], 'n': [1, 2]})
+
+    first = ac.cached_stage('test_stage', [], pdict, compute, 1)
+    second = ac.cached_stage('test_stage', [], pdict, compute, 1)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, second)
+    assert ac.is_cached('test_stage', [], pdict, 1) and not ac.is_cached('test_stage', [], pdict, 2)
+    assert ac.cached_rows('test_stage', [], pdict, 1) == 2 and ac.cached_rows('test_stage', [], pdict, 2) is None
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    pdict = {'cachefolder': str(tmp_path)}
+    for i, name in enumerate(['old', 'new']):
+        ac.cached_stage(name, [], pdict, lambda: pd.DataFrame({'n': range(1000)}), 1)
+        path = ac.artifact_path(name, [], pdict, 1)
+        os.utime(path, (i, i))
+    size = os.path.getsize(path)
+    assert ac.evict(pdict, max_bytes=size) == size
+    assert os.listdir(ac.get_artifact_dir(pdict)) == [os.path.basename(path)]
+
+def test_stage_version_follows_source(tmp_path):
+    src = tmp_path / 'stage.py'
+    src.write_text('VERSION = 1\n')
+    version = ac.stage_version(1, str(src))
+    assert version.startswith('1-') and ac.stage_version(2, str(src)) != version
+
+    # an edit without a version bump still changes the key (new process: hashes are computed once per process)
+    src.write_text('VERSION = 1\nSCALE = 2\n')
+    ac._SOURCE_HASHES.clear()
+    assert ac.stage_version(1, str(src)) != version
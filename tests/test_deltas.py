@@ -0,0 +1,82 @@
+import pandas                        as pd
+import core.synthetic                as sy
+import core.registry                 as rg
+import core.methods                  as m1
+import core.deltas                   as dl
+
+
+PDICT = {'geocode': 'PLZ', 'lstat_chunksize': 1000}
+
+
+def _dataset(tmp_path):
+    gdf_plz = sy.synthetic_plz_grid(40)
+    registry = sy.synthetic_registry(2000, gdf_plz, berlin_share=0.5)
+    residents = pd.DataFrame({'PLZ': gdf_plz['PLZ'].astype(m1.PLZ_DTYPE), 'Einwohner': range(1000, 1000 + len(gdf_plz))})
+    return gdf_plz, registry, residents, dict(PDICT, cachefolder=str(tmp_path / 'cache'))
+
+
+def _full_pipeline(path, gdf_plz, pdict):
+    stations = m1.preprop_lstat(rg.read_lstat_chunked(path, chunksize=1000), gdf_plz, pdict)
+    return stations, m1.count_plz_occurrences(stations)
+
+
+def _sorted(frame):
+    columns = [c for c in frame.columns if c != 'geometry']
+    return pd.DataFrame(frame)[columns].sort_values(columns, ignore_index=True)
+
+
+def test_refresh_matches_full_pipeline(tmp_path):
+    gdf_plz, registry, residents, pdict = _dataset(tmp_path)
+    path = str(tmp_path / 'registry.csv')
+    sy.write_registry(registry, path)
+    dl.refresh_registry(path, gdf_plz, pdict)
+
+    # one station removed, one with more power, two new ones
+    berlin = registry.index[registry['Bundesland'] == 'Berlin']
+    changed = registry.drop(index=berlin[0])
+    changed.loc[berlin[1], 'Nennleistung Ladeeinrichtung [kW]'] += 100
+    changed = pd.concat([changed, registry.loc[berlin[2:4]].assign(**{'Ladeeinrichtungs-ID': [90001, 90002]})])
+    sy.write_registry(changed, path)
+
+    geometrized = []
+    sort_by_plz_add_geometry = m1.sort_by_plz_add_geometry
+
+    def recording(dfr, dfg, pd_):
+        geometrized.append(len(dfr))
+        return sort_by_plz_add_geometry(dfr, dfg, pd_)
+
+    m1.sort_by_plz_add_geometry = recording
+    try:
+        update = dl.refresh_registry(path, gdf_plz, pdict)
+    finally:
+        m1.sort_by_plz_add_geometry = sort_by_plz_add_geometry
+
+    assert (update['added'], update['removed'], update['changed']) == (2, 1, 1)
+    # only the incoming rows and the per-PLZ counts are geometrized, not the stored stations
+    assert max(geometrized) <= len(update['counts'])
+    stations, counts = _full_pipeline(path, gdf_plz, pdict)
+    pd.testing.assert_frame_equal(_sorted(update['stations']), _sorted(stations), check_dtype=False)
+    pd.testing.assert_frame_equal(_sorted(update['counts']), _sorted(counts), check_dtype=False)
+    assert update['stations']['PLZ'].is_monotonic_increasing
+
+
+def test_refresh_demand_is_stored(tmp_path):
+    gdf_plz, registry, residents, pdict = _dataset(tmp_path)
+    path = str(tmp_path / 'registry.csv')
+    sy.write_registry(registry, path)
+    dl.refresh_demand(dl.refresh_registry(path, gdf_plz, pdict), residents, pdict)
+
+    berlin = registry.index[registry['Bundesland'] == 'Berlin']
+    sy.write_registry(registry.drop(index=berlin[:5]), path)
+    update = dl.refresh_registry(path, gdf_plz, pdict)
+    # a new process: no memoized metrics, the stored ones are patched instead of recomputed
+    m1._DEMAND_CACHE.clear()
+    compute_demand_metrics = m1.compute_demand_metrics
+    m1.compute_demand_metrics = None
+    try:
+        metrics = dl.refresh_demand(update, residents, pdict)
+    finally:
+        m1.compute_demand_metrics = compute_demand_metrics
+    m1._DEMAND_CACHE.clear()
+    pd.testing.assert_frame_equal(metrics, m1.compute_demand_metrics(update['counts'], residents), check_dtype=False)
+    assert dl.state_rows(pdict) == {'gdf_lstat3': len(update['stations']), 'df_lstat2': len(update['counts'])}
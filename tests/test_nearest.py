@@ -0,0 +1,37 @@
+import numpy                         as np
+import pandas                        as pd
+import core.nearest                  as nr
+
+
+def test_nearest_distance():
+    index = nr.StationIndex([52.52, 52.53], [13.40, 13.40])
+    dist, pos = index.nearest([52.52, 52.529], [13.40, 13.40], k=1)
+    assert pos[:, 0].tolist() == [0, 1]
+    assert dist[0, 0] < 1 and abs(dist[1, 0] - 111.2) < 0.5
+    assert index.count_within([52.525], [13.40], 600).tolist() == [2]
+
+
+def test_station_index_without_stations():
+    index = nr.StationIndex([np.nan], [np.nan])
+    assert len(index) == 0
+    dist, pos = index.nearest([52.52, 52.53], [13.40, 13.41], k=2)
+    assert dist.shape == (2, 2) and np.isinf(dist).all() and (pos == -1).all()
+    assert index.count_within([52.52], [13.40], 500).tolist() == [0]
+    assert [len(w) for w in index.within([52.52, 52.53], [13.40, 13.41], 500)] == [0, 0]
+
+
+def test_coverage_by_plz_without_stations(residents):
+    stations = pd.DataFrame({'Breitengrad': [], 'Längengrad': []}, dtype='float64')
+    coverage = nr.coverage_by_plz(stations, residents, spacing_m=200, radius_m=500)
+    assert coverage['PLZ'].tolist() == [10115, 10117]
+    assert coverage['dist_mean_m'].isna().all() and coverage['dist_max_m'].isna().all()
+    assert coverage['share_within'].tolist() == [0, 0]
+    assert coverage['residents_beyond'].tolist() == [1000, 3000]
+
+
+def test_coverage_by_plz_with_station(residents):
+    stations = pd.DataFrame({'Breitengrad': [52.525], 'Längengrad': [13.405]})
+    coverage = nr.coverage_by_plz(stations, residents, spacing_m=100, radius_m=500)
+    first, second = coverage.iloc[0], coverage.iloc[1]
+    assert first['share_within'] > second['share_within']
+    assert first['dist_mean_m'] < second['dist_mean_m'] <= second['dist_max_m']
@@ -0,0 +1,48 @@
+import numpy                         as np
+import shapely
+import geopandas                     as gpd
+import core.overlap                  as ov
+
+
+def _layers():
+    # two PLZ side by side; district A covers the first PLZ and the left half of the second, B the rest
+    plz = gpd.GeoDataFrame({'PLZ': [10115, 10117]}, crs='EPSG:25833',
+                           geometry=[shapely.box(0, 0, 1000, 1000), shapely.box(1000, 0, 2000, 1000)])
+    bez = gpd.GeoDataFrame({'Gemeinde_n': ['A', 'B']}, crs='EPSG:25833',
+                           geometry=[shapely.box(0, 0, 1500, 1000), shapely.box(1500, 0, 2000, 1000)])
+    return plz, bez
+
+
+def test_overlap_redistribution():
+    overlap = ov.build_overlap_matrix(*_layers())
+    assert overlap.areas.nnz == 3
+    # district totals spread by area, totals are kept
+    np.testing.assert_allclose(overlap.district_to_plz([1500, 500]), [1000, 1000])
+    np.testing.assert_allclose(overlap.plz_to_district([1000, 1000]), [1500, 500])
+    np.testing.assert_allclose(overlap.align_districts([' b', 'A'], [5, 7]), [7, 5])
+
+
+def test_overlap_matrix_roundtrip(tmp_path):
+    overlap = ov.build_overlap_matrix(*_layers())
+    path = str(tmp_path / 'overlap.npz')
+    ov.save_overlap_matrix(overlap, path)
+    loaded = ov.read_overlap_matrix(path)
+    assert (loaded.areas != overlap.areas).nnz == 0
+    assert loaded.plz.tolist() == [10115, 10117] and loaded.bezirke.tolist() == ['A', 'B']
+
+
+def test_overlap_cache_per_region(tmp_path):
+    plz, bez = _layers()
+    pdict = {'cachefolder': str(tmp_path / 'cache')}
+    paths = []
+    for region in ('a', 'b'):
+        (tmp_path / region).mkdir()
+        geodata_path, bez_path = tmp_path / region / 'geodata_plz.csv', tmp_path / region / 'bezirke.geojson'
+        plz.to_crs(epsg=4326).to_wkt().to_csv(geodata_path, sep=';', index=False)
+        bez.to_file(bez_path, driver='GeoJSON')
+        paths.append((str(geodata_path), str(bez_path)))
+
+    for geodata_path, bez_path in paths:
+        assert ov.load_overlap_matrix(geodata_path, bez_path, pdict).areas.nnz == 3
+    # equally named files of another region do not evict each other's matrix
+    assert len(list((tmp_path / 'cache').glob('overlap_plz_bezirk_*.npz'))) == 2
@@ -0,0 +1,61 @@
+import numpy                         as np
+import pandas                        as pd
+import shapely
+import core.raster                   as rr
+
+
+def test_resident_raster_keeps_residents(residents):
+    raster = rr.ResidentRaster(residents, resolution=50, pad=500)
+    assert round(raster.residents.sum()) == 4000
+    assert (raster.cells_per_plz > 0).all()
+
+
+def test_resident_raster_crs_follows_region(residents):
+    assert rr.ResidentRaster(residents, resolution=50, pad=500).crs == 'EPSG:25833'
+    # the same boxes moved to Cologne (6.9° E) are laid out in UTM zone 32N
+    cologne = residents.set_geometry(residents.translate(-6.5, -1.6))
+    raster = rr.ResidentRaster(cologne, resolution=50, pad=500)
+    assert raster.crs == 'EPSG:25832' and round(raster.residents.sum()) == 4000
+
+
+def test_rasterize_matches_contains():
+    ring = shapely.Polygon([(0, 0), (400, 0), (400, 300), (0, 300)], holes=[[(100, 100), (200, 100), (150, 200)]])
+    polys = np.array([ring, shapely.MultiPolygon([shapely.box(350, 250, 500, 400), shapely.box(600, 0, 700, 90)])])
+    grid = rr.RasterGrid((0, 0, 700, 400), 10, pad=20)
+    labels = rr.rasterize(polys, grid)
+    gx, gy = np.meshgrid(grid.xs(), grid.ys())
+    expected = np.where(shapely.contains_xy(polys[0], gx, gy), 0, np.where(shapely.contains_xy(polys[1], gx, gy), 1, -1))
+    assert (labels == expected).all()
+
+
+def test_coverage_rasters_shares(residents):
+    raster = rr.ResidentRaster(residents, resolution=50, pad=500)
+    stations = pd.DataFrame({'Breitengrad': [52.525], 'Längengrad': [13.405]})
+    by_plz, _ = rr.coverage_rasters(raster, stations, radii=(250, 1000), radius_m=500)
+    assert (by_plz['share_250m'] <= by_plz['share_within']).all()
+    assert (by_plz['share_within'] <= by_plz['share_1000m']).all()
+    assert by_plz['share_within'].iloc[0] > by_plz['share_within'].iloc[1]
+
+
+def test_coverage_rasters_without_stations(residents):
+    raster = rr.ResidentRaster(residents, resolution=50, pad=500)
+    stations = pd.DataFrame({'Breitengrad': [], 'Längengrad': []}, dtype='float64')
+    by_plz, _ = rr.coverage_rasters(raster, stations, radii=(250,), radius_m=500)
+    assert by_plz['dist_mean_m'].isna().all() and by_plz['dist_max_m'].isna().all()
+    assert by_plz['share_within'].tolist() == [0, 0]
+    assert by_plz['residents_beyond'].tolist() == [1000, 3000]
+
+
+def test_load_raster_coverage_without_stations(tmp_path, residents):
+    for name in ('geodata.csv', 'residents.xlsx'):
+        (tmp_path / name).write_text(name)
+    pdict = {'cachefolder': str(tmp_path), 'raster_resolution_m': 50, 'raster_radii_m': [250], 'coverage_radius_m': 500}
+    data = {'slug': 'test', 'paths': {'geodata_plz': str(tmp_path / 'geodata.csv'),
+                                      'residents': str(tmp_path / 'residents.xlsx'), 'bezirke': ''},
+            'artifact_keys': {'gdf_lstat3': 'lstat', 'gdf_residents2': 'resid'}, 'crs': 'EPSG:25833',
+            'gdf_residents2': residents,
+            'gdf_lstat3': pd.DataFrame({'Breitengrad': [], 'Längengrad': []}, dtype='float64')}
+    for _ in range(2):  # computed, then served from the artifact cache
+        by_plz, _ = rr.load_raster_coverage(data, pdict)
+        assert by_plz['dist_max_m'].isna().all()
+        assert by_plz['dist_max_m'].fillna(0).astype(int).tolist() == [0, 0]
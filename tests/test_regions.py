@@ -0,0 +1,34 @@
+import pytest
+import core.regions                  as rn
+
+
+def test_region_slug():
+    assert rn.region_slug('Berlin') == 'berlin'
+    assert rn.region_slug('Baden-Württemberg') == 'baden_wuerttemberg'
+    assert rn.region_slug('Thüringen / Süd') == 'thueringen_sued'
+
+
+def test_region_definitions_default_to_berlin():
+    regions = rn.region_definitions({})
+    assert list(regions) == ['Berlin']
+    berlin = regions['Berlin']
+    assert berlin['slug'] == 'berlin' and berlin['lstat_plz'] == (10115, 14200)
+    assert rn.get_region({})['name'] == 'Berlin'
+
+
+def test_region_definitions_fill_defaults():
+    pdict = {'regions': {'Hamburg': {'lstat_plz': [20000, 23000], 'file_geodat_plz': 'hamburg/geodata_plz.csv',
+                                     'file_residents': 'hamburg/plz_einwohner.csv'}}}
+    hamburg = rn.get_region(pdict, 'Hamburg')
+    assert hamburg['bundesland'] == 'Hamburg'
+    assert hamburg['lstat_plz'] == hamburg['resid_plz'] == (20000, 23000)
+    assert rn.region_paths(hamburg, pdict)['bezirke'] == ''
+    with pytest.raises(KeyError):
+        rn.get_region(pdict, 'Bremen')
+
+
+def test_lstat_read_window():
+    berlin = rn.get_region({})
+    assert rn.lstat_read_window(berlin, {}) == (10115, 14200)
+    # coordinate-based PLZ assignment does not trust the registry PLZ
+    assert rn.lstat_read_window(berlin, {'lstat_plz_assignment': 'coordinates'}) == (0, 100000)
@@ -0,0 +1,24 @@
+import pandas                        as pd
+import core.instrumentation          as ins
+import core.registry                 as rg
+
+
+def test_normalize_bundesland_spellings():
+    values = pd.Series([' Berlin', 'BERLIN', 'Thueringen', 'ThÃ¼ringen', 'baden württemberg', 'Atlantis', None])
+    bundesland, unmatched = rg.normalize_bundesland(values)
+    assert bundesland.dtype == rg.BUNDESLAND_DTYPE
+    assert bundesland.tolist()[:5] == ['Berlin', 'Berlin', 'Thüringen', 'Thüringen', 'Baden-Württemberg']
+    assert bundesland.iloc[5:].isna().all()
+    assert unmatched.tolist() == ['Atlantis']
+
+
+def test_read_lstat_reports_unmatched_rows(tmp_path):
+    path = tmp_path / 'registry.csv'
+    rows = ['Ladeeinrichtungs-ID;' + ';'.join(rg.LSTAT_COLUMNS),
+            '1;10117;Berlin ;52,52;13,40;22', '2;10117;berlin;52,52;13,41;11', '3;10117;Berlinn;52,52;13,42;50']
+    path.write_text('Metadaten\n' + '\n'.join(rows) + '\n', encoding='latin1')
+    with ins.span('test') as sp:
+        df = rg.read_lstat_chunked(str(path), chunksize=2)
+    stage = sp.children[0]
+    assert df['Längengrad'].tolist() == [13.40, 13.41]
+    assert stage.attrs['bundesland_unmatched'] == 1 and stage.attrs['bundesland_unknown'] == ['Berlinn']
@@ -0,0 +1,114 @@
+import json
+import threading
+import core.suggestions              as sg
+
+
+def _suggestion(i, plz='10115', ts=None, **extra):
+    return dict({'plz': plz, 'address': f'Street {i}', 'reason': 'test',
+                 'timestamp': ts or f'2025-01-01T00:00:{i:02d}'}, **extra)
+
+
+def _write_json(path, suggestions):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(suggestions, f)
+    return str(path)
+
+
+def test_add_and_review(tmp_path):
+    store = sg.SQLiteSuggestionStore(str(tmp_path / 'suggestions.db'))
+    first = store.add(_suggestion(1))
+    store.add(_suggestion(2, plz='12045'))
+    store.review(first, 'approved', 'admin', '2025-01-02T00:00:00', 'ok')
+
+    assert store.count() == 2
+    assert [r['address'] for r in store.list(status='approved')] == ['Street 1']
+    assert [r['plz'] for r in store.list(status='pending')] == ['12045']
+
+
+def test_import_json_with_duplicate_ids(tmp_path):
+    legacy = [_suggestion(1, id=1), _suggestion(2, id=1), _suggestion(3, id=2, status='approved'), _suggestion(4)]
+    store = sg.SQLiteSuggestionStore(str(tmp_path / 'suggestions.db'))
+
+    assert sg.import_json_suggestions(store, _write_json(tmp_path / 'suggestions.json', legacy)) == 4
+    rows = store.list()
+    assert [r['id'] for r in rows] == [1, 2, 3, 4]
+    assert [r['address'] for r in rows] == [s['address'] for s in legacy]
+    assert [r['status'] for r in rows] == ['pending', 'pending', 'approved', 'pending']
+
+
+def test_import_json_runs_once(tmp_path):
+    json_path = _write_json(tmp_path / 'suggestions.json', [_suggestion(i, id=i) for i in range(1, 4)])
+    store = sg.SQLiteSuggestionStore(str(tmp_path / 'suggestions.db'))
+
+    assert sg.import_json_suggestions(store, json_path) == 3
+    store.add(_suggestion(9))
+    assert sg.import_json_suggestions(store, json_path) == 0
+    assert store.count() == 4
+    # a new store object on the same file (another session) sees the flag as well
+    assert sg.import_json_suggestions(sg.SQLiteSuggestionStore(str(tmp_path / 'suggestions.db')), json_path) == 0
+
+
+def test_import_json_concurrent_sessions(tmp_path):
+    json_path = _write_json(tmp_path / 'suggestions.json', [_suggestion(i, id=i) for i in range(1, 51)])
+    db_path = str(tmp_path / 'suggestions.db')
+    sg.SQLiteSuggestionStore(db_path)
+    imported = []
+
+    def session():
+        imported.append(sg.import_json_suggestions(sg.SQLiteSuggestionStore(db_path), json_path))
+
+    threads = [threading.Thread(target=session) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(imported) == [0, 0, 0, 50]
+    assert sg.SQLiteSuggestionStore(db_path).count() == 50
+
+
+def test_import_json_into_filled_store_is_skipped(tmp_path):
+    store = sg.SQLiteSuggestionStore(str(tmp_path / 'suggestions.db'))
+    store.add(_suggestion(1))
+    assert sg.import_json_suggestions(store, _write_json(tmp_path / 'suggestions.json', [_suggestion(2, id=1)])) == 0
+    assert store.count() == 1
+
+
+def _all_pages(store, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        page, cursor = store.query(limit=limit, cursor=cursor, **filters)
+        pages.append([r['address'] for r in page])
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pagination(tmp_path):
+    # equal timestamps are ordered by id, so no row is skipped or repeated at a page border
+    suggestions = [_suggestion(i, plz='10115' if i % 3 else '12045', ts=f'2025-01-01T00:00:{i // 2:02d}')
+                   for i in range(1, 24)]
+    store = sg.SQLiteSuggestionStore(str(tmp_path / 'suggestions.db'))
+    store.add_many(suggestions)
+
+    pages = _all_pages(store, 5)
+    assert [len(p) for p in pages] == [5, 5, 5, 5, 3]
+    assert sum(pages, []) == [s['address'] for s in reversed(suggestions)]
+
+    oldest_first = _all_pages(store, 4, newest_first=False)
+    assert sum(oldest_first, []) == [s['address'] for s in suggestions]
+
+    by_plz = sum(_all_pages(store, 2, plz='12045'), [])
+    assert by_plz == [s['address'] for s in reversed(suggestions) if s['plz'] == '12045']
+
+
+def test_keyset_pagination_json_matches_sqlite(tmp_path):
+    suggestions = [_suggestion(i, ts=f'2025-01-01T00:00:{i // 3:02d}') for i in range(1, 12)]
+    sqlite_store = sg.SQLiteSuggestionStore(str(tmp_path / 'suggestions.db'))
+    sqlite_store.add_many(suggestions)
+    json_store = sg.JsonSuggestionStore(str(tmp_path / 'suggestions.json'))
+    for s in suggestions:
+        json_store.add(s)
+
+    for newest_first in (True, False):
+        assert _all_pages(json_store, 4, newest_first=newest_first) == \
+            _all_pages(sqlite_store, 4, newest_first=newest_first)
+    assert json_store.counts_by_plz() == sqlite_store.counts_by_plz() == [('10115', 11)]